@@ -9,6 +9,7 @@ E3631A. For more information -> see README.md
 
 import pyvisa
 import logging
+from contextlib import contextmanager
 
 class E3631A():
     
@@ -24,6 +25,8 @@ class E3631A():
             raise ValueError("E3631A not found, maybe address was wrong or Device not connected")
         
         self.__enStatus = False
+        # commands of an open transaction (see transaction), None if commands are written at once
+        self.queue = None
 
         self.log = log
         if log:
@@ -43,7 +46,7 @@ class E3631A():
         v_string = str(voltage)
         i_string = str(ILimit)
         command = "APPL P6V, " + v_string + ", " + i_string
-        self.instr.write(command)
+        self.send(command)
         if self.log:
             self.logger.info("Set 6V output to {v:.2f}V with current limit of {i:2f}A".format(v=voltage,i=ILimit))
 
@@ -57,7 +60,7 @@ class E3631A():
         v_string = str(voltage)
         i_string = str(ILimit)
         command = "APPL P25V, " + v_string + ", " + i_string
-        self.instr.write(command)
+        self.send(command)
         if self.log:
             self.logger.info("Set P25V output to {v:.2f}V with current limit of {i:2f}A".format(v=voltage,i=ILimit))
 
@@ -71,16 +74,72 @@ class E3631A():
         v_string = str(voltage)
         i_string = str(ILimit)
         command = "APPL N25V, " + v_string + ", " + i_string
-        self.instr.write(command)
+        self.send(command)
         if self.log:
             self.logger.info("Set N25V output to {v:.2f}V with current limit of {i:2f}A".format(v=voltage,i=ILimit))
 
+    def send(self, command:str):
+        """
+        Writes a command, or queues it if a transaction is open.
+        """
+        if self.queue is None:
+            self.instr.write(command)
+        else:
+            self.queue.append(command)
+
+    def flush(self):
+        """
+        Writes the queued commands of the open transaction as one message (one GPIB transaction).
+        """
+        if self.queue:
+            # ';:' separates the commands, each starts again at the root of the command tree
+            self.instr.write(";:".join(self.queue))
+            self.queue.clear()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Queues the settings written within the block and writes them with one message at its end,
+        e.g.:
+
+            with power_sup.transaction():
+                power_sup.set_P25V(5.0, 0.4)
+                power_sup.en_output(True)
+
+        The queued commands are discarded if the block raises an exception. A transaction within a
+        transaction is part of the outer one.
+        """
+        if self.queue is not None:
+            yield self
+            return
+        self.queue = []
+        try:
+            yield self
+            self.flush()
+        finally:
+            self.queue = None
+
+    def measure(self, output:str):
+        """
+        Measures the voltage and the current of an output ('P6V', 'P25V' or 'N25V') with one query.
+
+        Returns:
+            list: [voltage, current]
+        """
+        # queued settings are written first, in the same message as the query
+        commands = (self.queue or []) + [f"MEAS:VOLT? {output}", f"MEAS:CURR? {output}"]
+        if self.queue:
+            self.queue.clear()
+        response = self.instr.query(";:".join(commands))
+        V, I = response.strip().split(";")
+        return [float(V), float(I)]
+
     def en_output(self, en=True):
         if en == True:
-            self.instr.write("OUTP ON")
+            self.send("OUTP ON")
             self.__enStatus = True
         else:
-            self.instr.write("OUTP OFF")
+            self.send("OUTP OFF")
             self.__enStatus = False
         if self.log:
             if en:
@@ -90,45 +149,36 @@ class E3631A():
 
 
     def meas_6V(self):
-        command_I = "MEAS:CURR? P6V"
-        I = self.instr.query(command_I)
-        command_V = "MEAS:VOLT? P6V"
-        V = self.instr.query(command_V)
+        V, I = self.measure("P6V")
 
         if self.log:
-            self.logger.info("6V output is: {v:.4f}V, {i:.4f}A ".format(v=float(V),i=float(I)))
+            self.logger.info("6V output is: {v:.4f}V, {i:.4f}A ".format(v=V,i=I))
 
-        return([float(V), float(I)])
+        return([V, I])
     
     def meas_P25V(self):
-        command_I = "MEAS:CURR? P25V"
-        I = self.instr.query(command_I)
-        command_V = "MEAS:VOLT? P25V"
-        V = self.instr.query(command_V)
+        V, I = self.measure("P25V")
 
         if self.log:
             self.logger.info("P25V output is: {v:.4f}V, {i:.4f}A ".format(v=V,i=I))
         
-        return([float(V), float(I)])
+        return([V, I])
     
     def meas_N25V(self):
-        command_I = "MEAS:CURR? N25V"
-        I = self.instr.query(command_I)
-        command_V = "MEAS:VOLT? N25V"
-        V = self.instr.query(command_V)
+        V, I = self.measure("N25V")
 
         if self.log:
             self.logger.info("N25V output is: {v:.4f}V, {i:.4f}A ".format(v=V,i=I))
         
-        return([float(V), float(I)])
+        return([V, I])
     
     def display_select(self, select="6V"):
         if select == "6V":
-            self.instr.write("INST:SEL P6V")
+            self.send("INST:SEL P6V")
         elif select == "P25V":
-            self.instr.write("INST P25V")
+            self.send("INST P25V")
         elif select == "N25V":
-            self.instr.write("INST N25V")
+            self.send("INST N25V")
         else:
             print("Power_Supply: Invalid display selection")
     
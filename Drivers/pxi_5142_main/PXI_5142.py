@@ -16,7 +16,10 @@ import numpy as np
 import math
 import hightime
 import time
-from plot_data import PlotData
+import queue
+import threading
+import concurrent.futures
+from plot_data import PlotData, ScaledWaveform, TimeBase
 
 class PXI_5142:
     
@@ -26,9 +29,18 @@ class PXI_5142:
     NISCOPE_VAL_100MHZ_BANDWIDTH            = 100000000.0
     NISCOPE_VAL_20MHZ_MAX_INPUT_FREQUENCY   =  20000000.0
     NISCOPE_VAL_100MHZ_MAX_INPUT_FREQUENCY  = 100000000.0
+    # current probes on the current scope of get_data2
+    CURRENT_RATIO                           =         2.5 # 2.5V/A
     #                                       =  35000000.0
     
-    def __init__(self, addr = 'PXI2Slot7', name = 'NoName', selftest=False, reset=False, log=False):
+    def __init__(self, addr = 'PXI2Slot7', name = 'NoName', selftest=False, reset=False, log=False, simulate=None):
+        """
+        Opens the scope at addr.
+
+        Parameters:
+        - simulate: A SimulatedSession (see simulation.py) that is used instead of the device, e.g. to
+          run the tests without the PXI chassis. Default is None (the device).
+        """
         self.log = log
         if log:
             self.logger = logging.getLogger("Scope")
@@ -37,12 +49,24 @@ class PXI_5142:
         self.name = name
         self.addr = addr
         self.instr = None
+        # reusable fetch buffers, keyed by (shape, dtype)
+        self.buffers = {}
+        # last configuration written to the device (see apply_setting)
+        self.shadow = {}
+        self.uncommitted = False
+        # perf_counter() time of the last initiate
+        self.initiated_at = None
 
-        self.__open_com(selftest,reset)
+        self.__open_com(selftest,reset,simulate)
 
-    def __open_com(self, with_selftest: bool, with_reset: bool):
+    def __open_com(self, with_selftest: bool, with_reset: bool, simulate=None):
         #options = '' #{'simulate': False, 'driver_setup': {'Model': '4141', 'BoardType': 'PXIe', }, }
-        self.instr = niscope.Session(self.addr) #, options)
+        if simulate is not None:
+            self.instr = simulate
+            if self.log:
+                self.logger.info("Simulated scope")
+        else:
+            self.instr = niscope.Session(self.addr) #, options)
         if with_selftest:
             self.selftest(with_reset)
         
@@ -56,6 +80,9 @@ class PXI_5142:
     def reset(self):
         self.instr.reset_device()
         self.instr.disable()
+        # the device is back at its default configuration
+        self.shadow.clear()
+        self.uncommitted = False
         if self.log:
             self.logger.info("Device reseted")
         
@@ -65,20 +92,69 @@ class PXI_5142:
     # def autosetup(self):
     #     self.instr.auto_setup()
         
+    def apply_setting(self, key, value, write) -> bool:
+        """
+        Calls write() only if value differs from the last value applied for key.
+
+        The configure methods of this class go through here, so repeated runs with the same
+        settings do not write to the driver again. reset() forgets all applied values.
+
+        Parameters:
+        - key: The setting, e.g. ("vertical", 0).
+        - value: The value of the setting, compared with ==.
+        - write: A function without arguments that writes the value to the driver.
+
+        Returns:
+        - True if the value was written.
+        """
+        if key in self.shadow and self.shadow[key] == value:
+            return False
+        write()
+        self.shadow[key] = value
+        self.uncommitted = True
+        return True
+
+    def commit(self):
+        """
+        Commits the written settings to the hardware, only if a setting changed since the last commit.
+        """
+        if self.uncommitted:
+            self.instr.commit()
+            self.uncommitted = False
+
     def configure_vertical(self, channel_nr:int, vrange:float, coupling:str, offset:float, probe_attenuation:float, enabled:bool):
-        coupling = niscope.VerticalCoupling[coupling]
-        self.instr.channels[channel_nr].configure_vertical(vrange, coupling, 
-                                                           offset=offset, 
-                                                           probe_attenuation=probe_attenuation, 
-                                                           enabled=enabled)
-
-    def configure_horizontal(self, min_sample_rate:float, min_num_pts:int, num_records:int):
-        ref_position = 50.0
+        def write():
+            self.instr.channels[channel_nr].configure_vertical(vrange, niscope.VerticalCoupling[coupling],
+                                                               offset=offset,
+                                                               probe_attenuation=probe_attenuation,
+                                                               enabled=enabled)
+        self.apply_setting(("vertical", channel_nr), (vrange, coupling, offset, probe_attenuation, enabled), write)
+
+    def configure_vertical_all(self, vrange:float, coupling:str, offset:float, probe_attenuation:float, enabled:bool=True):
+        """
+        Configures the vertical settings of both channels with one driver call.
+        """
+        value = (vrange, coupling, offset, probe_attenuation, enabled)
+        if all(self.shadow.get(("vertical", channel_nr)) == value for channel_nr in (0, 1)):
+            return
+        self.instr.configure_vertical(range=vrange, coupling=niscope.VerticalCoupling[coupling],
+                                      offset=offset, probe_attenuation=probe_attenuation, enabled=enabled)
+        for channel_nr in (0, 1):
+            self.shadow[("vertical", channel_nr)] = value
+        self.uncommitted = True
+
+    def configure_horizontal(self, min_sample_rate:float, min_num_pts:int, num_records:int, ref_position:float=50.0):
         enforce_realtime = True
-        self.instr.configure_horizontal_timing(min_sample_rate, min_num_pts, ref_position, num_records, enforce_realtime)
+        self.apply_setting("horizontal", (min_sample_rate, min_num_pts, ref_position, num_records, enforce_realtime),
+                           lambda: self.instr.configure_horizontal_timing(min_sample_rate, min_num_pts, ref_position,
+                                                                          num_records, enforce_realtime))
 
     def configure_chan_characteristics(self, channel_nr:int, input_impedance:float, max_input_frequency:float ):
-        self.instr.channels[channel_nr].configure_chan_characteristics(input_impedance, max_input_frequency)
+        def write():
+            self.instr.channels[channel_nr].configure_chan_characteristics(input_impedance, max_input_frequency)
+            # the driver may coerce the vertical range to the new impedance, so it is written again
+            self.shadow.pop(("vertical", channel_nr), None)
+        self.apply_setting(("characteristics", channel_nr), (input_impedance, max_input_frequency), write)
 
     def configure_trigger_edge(self, trigger_source_channel_nr:int, trigger_coupling:str, level:float, slope:str):
         trigger_source = self.addr + '/' + str(trigger_source_channel_nr)
@@ -86,19 +162,84 @@ class PXI_5142:
         slope = niscope.TriggerSlope[slope]
         holdoff = hightime.timedelta(seconds=0.0)
         delay = hightime.timedelta(seconds=0.0)
-        self.instr.configure_trigger_edge(trigger_source, level, trigger_coupling, slope=slope, holdoff=holdoff, delay=delay)
+        # the trigger types replace each other, so they share one setting
+        self.apply_setting("trigger", ("edge", trigger_source, trigger_coupling, level, slope),
+                           lambda: self.instr.configure_trigger_edge(trigger_source, level, trigger_coupling,
+                                                                     slope=slope, holdoff=holdoff, delay=delay))
+
+    def configure_trigger_digital(self, trigger_source:str):
+        self.apply_setting("trigger", ("digital", trigger_source),
+                           lambda: self.instr.configure_trigger_digital(trigger_source=trigger_source))
+
+    def configure_exported_ref_trigger(self, terminal:str):
+        """
+        Exports the reference trigger of this scope to a terminal (e.g. "PXI_Trig1"), "" to release it.
+        """
+        def write():
+            self.instr.exported_ref_trigger_output_terminal = terminal
+        self.apply_setting("exported_ref_trigger", terminal, write)
 
     def initiate(self):
-        self.instr.commit()
+        self.commit()
         self.instr.initiate()
+        self.initiated_at = time.perf_counter()
+
+    def wait_until_acquisition_done(self, max_sec:float, min_interval:float=50e-6, max_interval:float=1e-3) -> float:
+        """
+        Waits until the acquisition is complete and returns as soon as it is.
 
-    def wait_until_acquisition_done(self, max_sec:int):
-        i = 0
-        while not (self.is_acquisition_done() or (i >= max_sec*10)):
-            time.sleep(0.1); i = i + 1
-        if not self.is_acquisition_done():
+        The status is polled adaptively: the interval starts at min_interval and doubles up to
+        max_interval, so a record that completes right away costs microseconds and a long wait
+        for the trigger does not load the CPU.
+
+        Parameters:
+        - max_sec: The maximum time to wait in seconds.
+        - min_interval: The first polling interval in seconds. Default is 50us.
+        - max_interval: The longest polling interval in seconds. Default is 1ms.
+
+        Returns:
+        - The time in seconds from the last initiate (or from the call, if this session was not
+          initiated with initiate()) until the acquisition was seen complete, None on timeout.
+          This is not the time to the trigger: it includes the post-trigger part of the record and
+          up to one polling interval.
+        """
+        start = time.perf_counter()
+        if self.initiated_at is not None:
+            start = self.initiated_at
+        if not self.poll(self.is_acquisition_done, max_sec, min_interval, max_interval):
             if self.log:
                 self.logger.info("acquisition is not done!!!!")
+            return None
+        return time.perf_counter() - start
+
+    def wait_until_records_done(self, num_records:int, max_sec:float, min_interval:float=50e-6,
+                                max_interval:float=1e-3) -> bool:
+        """
+        Waits until the first num_records records of a multi-record acquisition are acquired, polled like
+        wait_until_acquisition_done.
+
+        Returns:
+        - True if the records are done, False on timeout.
+        """
+        return self.poll(lambda: self.instr.records_done >= num_records, max_sec, min_interval, max_interval)
+
+    @staticmethod
+    def poll(done, max_sec:float, min_interval:float, max_interval:float) -> bool:
+        """
+        Calls done() until it returns True, the interval starts at min_interval and doubles up to max_interval.
+
+        Returns:
+        - True if done() returned True, False if max_sec elapsed before.
+        """
+        deadline = time.perf_counter() + max_sec
+        interval = min_interval
+        while not done():
+            now = time.perf_counter()
+            if now >= deadline:
+                return False
+            time.sleep(min(interval, deadline - now))
+            interval = min(2 * interval, max_interval)
+        return True
 
     def is_acquisition_done(self) -> bool:
         return self.instr.acquisition_status() == niscope.AcquisitionStatus.COMPLETE
@@ -112,7 +253,8 @@ class PXI_5142:
         dt = 1/horz_sample_rate
         t_min = -num_samples/2*dt
         t_max = num_samples/2*dt
-        time = np.linspace(t_min, t_max, num=num_samples)
+        # shared, the time array is only created when it is used
+        time = TimeBase.from_range(t_min, t_max, num_samples)
         waveform = np.ndarray(num_channels * num_samples * num_records, dtype=np.float64)
         relative_to = niscope.FetchRelativeTo.PRETRIGGER #PRETRIGGER # READ_POINTER PRETRIGGER NOW START TRIGGER
         offset = 0 # Offset in samples
@@ -126,6 +268,216 @@ class PXI_5142:
                                                    timeout=timeout)
         return [time, waveform]
 
+    def get_buffer(self, num_samples:int, num_channels:int=2, dtype=np.float64) -> np.ndarray:
+        """
+        Returns the preallocated (num_channels, num_samples) fetch buffer of this scope.
+
+        The buffer is allocated on the first call and reused afterwards, so its content is
+        overwritten by the next fetch into it.
+        """
+        shape = (num_channels, num_samples)
+        key = (shape, np.dtype(dtype))
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = np.empty(shape, dtype=dtype)
+        return buffer
+
+    def fetch_channels(self, num_samples:int, channels:str="0,1", out:np.ndarray=None,
+                       timeout:float=5.0) -> np.ndarray:
+        """
+        Fetches the first record of several channels with one fetch_into call.
+
+        Parameters:
+        - num_samples: The number of samples per channel.
+        - channels: The channel list, e.g. "0,1".
+        - out: A C-contiguous (number of channels, num_samples) array to fetch into. Default is
+          the reusable buffer of this scope (see get_buffer).
+        - timeout: The time to wait for the data in seconds. Default is 5s.
+
+        Returns:
+        - out: The samples, one row per channel in the order of the channel list.
+        """
+        num_channels = len(channels.split(","))
+        if out is None:
+            out = self.get_buffer(num_samples, num_channels)
+        self.fetch_into_rows(out, channels, timeout)
+        return out
+
+    def fetch_records(self, num_samples:int, num_records:int, channels:str="0,1", out:np.ndarray=None,
+                      timeout:float=5.0) -> np.ndarray:
+        """
+        Fetches num_records records of several channels with one fetch_into call.
+
+        Parameters:
+        - num_samples: The number of samples per record.
+        - num_records: The number of records, starting with record 0.
+        - channels: The channel list, e.g. "0,1".
+        - out: A C-contiguous float64 (num_records, number of channels, num_samples) array to fetch
+          into. Default is a new array.
+        - timeout: The time to wait for the data in seconds. Default is 5s.
+
+        Returns:
+        - out: The samples, out[record, channel] in the order of the channel list.
+        """
+        shape = (num_records, len(channels.split(",")), num_samples)
+        if out is None:
+            out = np.empty(shape)
+        if out.shape != shape or not out.flags.c_contiguous:
+            raise ValueError(f"out must be a C-contiguous array of shape {shape}")
+        # the driver writes record after record, the channels of a record after each other
+        self.instr.channels[channels].fetch_into(out.reshape(-1),
+                                                 relative_to=niscope.FetchRelativeTo.PRETRIGGER,
+                                                 record_number=0, num_records=num_records,
+                                                 timeout=hightime.timedelta(seconds=timeout))
+        return out
+
+    def fetch_into_rows(self, out:np.ndarray, channels:str, timeout:float) -> list:
+        """
+        Fetches the first record of the channels into the rows of out (float64, int8, int16 or
+        int32, see niscope fetch_into) and returns the waveform infos with gain and offset.
+        """
+        num_channels = len(channels.split(","))
+        if out.ndim != 2 or out.shape[0] != num_channels or not out.flags.c_contiguous:
+            raise ValueError(f"out must be a C-contiguous array with {num_channels} rows")
+        # the driver writes the records channel after channel into the flat view
+        return self.instr.channels[channels].fetch_into(out.reshape(-1),
+                                                        relative_to=niscope.FetchRelativeTo.PRETRIGGER,
+                                                        num_records=1,
+                                                        timeout=hightime.timedelta(seconds=timeout))
+
+    def fetch_raw(self, num_samples:int, channels:str="0,1", out:np.ndarray=None, scale:float=1.0,
+                  timeout:float=5.0) -> list:
+        """
+        Fetches the first record of several channels as native int16 samples.
+
+        The samples are not scaled, the gain and offset of each channel are kept in the returned
+        ScaledWaveform objects, which scale to volts when they are used. This needs a quarter
+        of the memory and storage of float64 volts.
+
+        Parameters:
+        - num_samples: The number of samples per channel.
+        - channels: The channel list, e.g. "0,1".
+        - out: A C-contiguous int16 (number of channels, num_samples) array to fetch into.
+          Default is the reusable int16 buffer of this scope (see get_buffer).
+        - scale: A factor applied to the volts, e.g. 1/2.5 for a 2.5V/A current probe.
+        - timeout: The time to wait for the data in seconds. Default is 5s.
+
+        Returns:
+        - waveforms: One ScaledWaveform per channel in the order of the channel list.
+        """
+        if out is None:
+            out = self.get_buffer(num_samples, len(channels.split(",")), dtype=np.int16)
+        if out.dtype != np.int16:
+            raise ValueError("out must be an int16 array")
+        wfm_infos = self.fetch_into_rows(out, channels, timeout)
+        return [ScaledWaveform(raw, info.gain * scale, info.offset * scale)
+                for raw, info in zip(out, wfm_infos)]
+
+    def stream_to_file(self, path:str, num_samples:int, sample_rate:float, channels:str="0,1",
+                       chunk_samples:int=65536, ring_chunks:int=8, dtype=np.float64, backlog_limit:int=None,
+                       on_backpressure=None) -> tuple:
+        """
+        Acquires one long record continuously and streams it into a memory-mapped file.
+
+        The acquisition starts immediately (no trigger). Chunks of chunk_samples are fetched from the
+        read pointer (FetchRelativeTo.READ_POINTER) into a ring buffer of ring_chunks chunks, a writer
+        thread copies them into the file. The memory used is bounded by the ring buffer, independent of
+        num_samples.
+
+        Backpressure is reported when the fetch falls behind the acquisition (the backlog of samples
+        acquired but not fetched exceeds backlog_limit) or when the writer falls behind the fetch (the
+        ring buffer is full). on_backpressure is then called with the report.
+
+        Parameters:
+        - path: The file the samples are written to, it contains a (number of channels, num_samples)
+          array of dtype in C order (open it with np.memmap(path, dtype, mode='r', shape=...)).
+        - num_samples: The number of samples per channel.
+        - sample_rate: The minimum sample rate in samples per second.
+        - channels: The channel list, e.g. "0,1".
+        - chunk_samples: The number of samples per channel and fetch. Default is 65536.
+        - ring_chunks: The number of chunks in the ring buffer. Default is 8.
+        - dtype: np.float64 for volts or np.int16 for raw samples (scale with the gains and offsets
+          of the report). Default is np.float64.
+        - backlog_limit: The backlog in samples that is reported. Default is the ring buffer size.
+        - on_backpressure: A function called with the report when backpressure occurs. Default is None.
+
+        Returns:
+        - (samples, report): The np.memmap of the file and a dictionary with 'sample_rate',
+          'fetches', 'max_backlog', 'backlog_events', 'ring_full_events', 'gains' and 'offsets'.
+        """
+        num_channels = len(channels.split(","))
+        if backlog_limit is None:
+            backlog_limit = ring_chunks * chunk_samples
+        samples = np.memmap(path, dtype=dtype, mode="w+", shape=(num_channels, num_samples))
+        ring = np.empty((ring_chunks, num_channels * chunk_samples), dtype=dtype)
+        free_slots = queue.Queue()
+        for slot in range(ring_chunks):
+            free_slots.put(slot)
+        filled_slots = queue.Queue()
+        report = {"sample_rate": None, "fetches": 0, "max_backlog": 0.0, "backlog_events": 0,
+                  "ring_full_events": 0, "gains": None, "offsets": None}
+        errors = []
+
+        def write_chunks():
+            # copies the filled slots into the file until None is queued
+            while True:
+                item = filled_slots.get()
+                if item is None:
+                    return
+                slot, start, count = item
+                try:
+                    samples[:, start:start + count] = ring[slot, :num_channels * count].reshape(num_channels, count)
+                except Exception as error: # pylint: disable=broad-except
+                    errors.append(error)
+                free_slots.put(slot)
+
+        self.configure_horizontal(min_sample_rate=sample_rate, min_num_pts=num_samples, num_records=1, ref_position=0.0)
+        self.trigger()
+        self.initiate()
+        report["sample_rate"] = self.instr.horz_sample_rate
+        # time to acquire one chunk plus a margin for the first fetch
+        timeout = 2 * chunk_samples / report["sample_rate"] + 5.0
+        writer = threading.Thread(target=write_chunks, name=f"{self.name} stream writer", daemon=True)
+        writer.start()
+        try:
+            start = 0
+            while start < num_samples and not errors:
+                count = min(chunk_samples, num_samples - start)
+                try:
+                    slot = free_slots.get_nowait()
+                except queue.Empty:
+                    report["ring_full_events"] += 1
+                    if on_backpressure is not None:
+                        on_backpressure(report)
+                    slot = free_slots.get()
+                out = ring[slot, :num_channels * count].reshape(num_channels, count)
+                wfm_infos = self.instr.channels[channels].fetch_into(out.reshape(-1),
+                                                                    relative_to=niscope.FetchRelativeTo.READ_POINTER,
+                                                                    offset=0, record_number=0, num_records=1,
+                                                                    timeout=hightime.timedelta(seconds=timeout))
+                if report["gains"] is None:
+                    report["gains"] = [info.gain for info in wfm_infos]
+                    report["offsets"] = [info.offset for info in wfm_infos]
+                filled_slots.put((slot, start, count))
+                start += count
+                report["fetches"] += 1
+                backlog = self.instr.backlog
+                report["max_backlog"] = max(report["max_backlog"], backlog)
+                if backlog > backlog_limit:
+                    report["backlog_events"] += 1
+                    if self.log:
+                        self.logger.info("Stream falls behind, backlog of %d samples", backlog)
+                    if on_backpressure is not None:
+                        on_backpressure(report)
+        finally:
+            filled_slots.put(None)
+            writer.join()
+            self.instr.abort()
+            samples.flush()
+        if errors:
+            raise errors[0]
+        return samples, report
+
     def configure_simple_ac(self, amplitude_to_meas:float, freq_to_meas:float, nr_of_periods:int, num_records:int, sample_rate:float,trigger=0,hysteresis=None,triggerlevel=0):
         if type(amplitude_to_meas) == list:
             vrange0 = amplitude_to_meas[0]
@@ -144,7 +496,8 @@ class PXI_5142:
         self.configure_trigger_edge(trigger_source_channel_nr=trigger, trigger_coupling='DC', level=triggerlevel, slope='POSITIVE')
         trigger_source = self.addr + '/' + str(trigger)
         if hysteresis != None:
-            self.instr.configure_trigger_hysteresis(trigger_source=trigger_source,level=0,hysteresis=hysteresis,trigger_coupling=niscope.TriggerCoupling['DC'])
+            self.apply_setting("trigger", ("hysteresis", trigger_source, hysteresis),
+                               lambda: self.instr.configure_trigger_hysteresis(trigger_source=trigger_source,level=0,hysteresis=hysteresis,trigger_coupling=niscope.TriggerCoupling['DC']))
 
         self.initiate()
 
@@ -157,7 +510,7 @@ class PXI_5142:
         if self.log:
             self.logger.info("Object Deleted")
     def trigger(self):
-        self.instr.channels[0].configure_trigger_immediate()
+        self.apply_setting("trigger", ("immediate",), self.instr.channels[0].configure_trigger_immediate)
         # self.instr.configure_trigger_software(holdoff=0, delay=0)
     def get_some_data(self, probe_attenuation1=1, probe_attenuation2=1):
         self.configure_vertical(channel_nr=0, vrange=4, coupling='DC', offset=1, probe_attenuation=probe_attenuation1, enabled=True)
@@ -169,8 +522,9 @@ class PXI_5142:
         dt = 1/horz_sample_rate
         t_min = -num_samples/2*dt
         t_max = num_samples/2*dt
-        time = np.linspace(t_min, t_max, num=num_samples)
-        self.instr.configure_horizontal_timing(min_sample_rate=horz_sample_rate, min_num_pts=num_samples, ref_position=0.0, num_records=1, enforce_realtime=True)
+        # shared, the time array is only created when it is used
+        time = TimeBase.from_range(t_min, t_max, num_samples)
+        self.configure_horizontal(min_sample_rate=horz_sample_rate, min_num_pts=num_samples, num_records=1, ref_position=0.0)
         waveforms0 = self.instr.channels[0].read(num_samples=1000)
         waveforms1 = self.instr.channels[1].read(num_samples=1000)
         return [time, np.array([waveforms0[0].samples.obj, waveforms1[0].samples.obj])]
@@ -210,25 +564,25 @@ class PXI_5142:
         t_min = -num_samples/2*dt
         t_max = num_samples/2*dt
         # create the time vector
-        time_t = np.linspace(t_min, t_max, num=num_samples)
-        # create list of scopes
-        session_list=[sc0.instr, sc1.instr]
-        # set the vertical and horizontal settings for each scope
-        for session in session_list:
-            session.configure_vertical(range=5.0, coupling=niscope.VerticalCoupling.DC, probe_attenuation=10.0)
-            session.configure_horizontal_timing(min_sample_rate=horz_sample_rate, min_num_pts=num_samples, ref_position=50.0, num_records=1, enforce_realtime=True)
+        # shared, the time array is only created when it is used
+        time_t = TimeBase.from_range(t_min, t_max, num_samples)
+        # set the vertical and horizontal settings for each scope (only the settings that changed are written)
+        for scope in (sc0, sc1):
+            scope.configure_vertical_all(vrange=5.0, coupling='DC', offset=0.0, probe_attenuation=10.0)
+            scope.configure_horizontal(min_sample_rate=horz_sample_rate, min_num_pts=num_samples, num_records=1)
 
         # sc0.instr.configure_trigger_immediate()
         # configure the trigger settings for the first scope
         sc0.configure_trigger_edge(trigger_source_channel_nr=trigger_source_channel_nr, trigger_coupling='DC', level=trigger_level, slope=trigger_slope)
         # export the trigger from the first scope to the second scope (add trigger on pxi line 1)
-        sc0.instr.exported_ref_trigger_output_terminal="PXI_Trig1"
+        sc0.configure_exported_ref_trigger("PXI_Trig1")
+        sc1.configure_exported_ref_trigger("")
         # set trigger of second scope to the exported trigger
-        sc1.instr.configure_trigger_digital(trigger_source="PXI_Trig1")
+        sc1.configure_trigger_digital(trigger_source="PXI_Trig1")
 
         # initiate the acquisition
-        sc1.instr.initiate()
-        sc0.instr.initiate()
+        sc1.initiate()
+        sc0.initiate()
         # wait to be sure that the scope has triggered
         sc0.wait_until_acquisition_done(20)
         if sc1.instr.acquisition_status().name=="IN_PROGRESS":
@@ -248,17 +602,89 @@ class PXI_5142:
         plot_data.add_data(time_t, waveform2, label="sc0 channel 1")
         plot_data.add_data(time_t, waveform3, label="sc1 channel 0")
         plot_data.add_data(time_t, waveform4, label="sc1 channel 1")
-        print(f"Overshot was on input{sc0.instr.channels[0].fetch_measurement_stats(scalar_meas_function=niscope.ScalarMeasurement.OVERSHOOT)}")
-        print(f"Overshot was on output{sc0.instr.channels[1].fetch_measurement_stats(scalar_meas_function=niscope.ScalarMeasurement.OVERSHOOT)}")
+        overshoot = sc0.fetch_scalar_measurements(["OVERSHOOT"])
+        print(f"Overshot was on input{PXI_5142.scalar_measurement(overshoot, 'OVERSHOOT', 0)}")
+        print(f"Overshot was on output{PXI_5142.scalar_measurement(overshoot, 'OVERSHOOT', 1)}")
 
         return plot_data
     
+    @staticmethod
+    def run_parallel(*calls) -> list:
+        """
+        Runs one call per scope session at the same time and returns their results in order.
+
+        The first call runs in the calling thread, the others in worker threads. The driver
+        releases the GIL while it waits for the device, so the sessions fetch concurrently.
+        An exception of a call is raised after all calls have finished.
+        """
+        if len(calls) == 1:
+            return [calls[0]()]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(calls) - 1,
+                                                   thread_name_prefix="PXI_5142") as executor:
+            futures = [executor.submit(call) for call in calls[1:]]
+            results = [calls[0]()]
+        return results + [future.result() for future in futures]
+
+    def fetch_scalar_measurements(self, functions, channels:str="0,1", num_records:int=1,
+                                  timeout:float=5.0) -> np.ndarray:
+        """
+        Fetches onboard scalar measurements of several channels as a structured array.
+
+        Each measurement function is requested for all channels and records with one
+        fetch_measurement_stats call, the digitizer computes the measurements, so only the results
+        are transferred and not the waveforms. The driver takes one scalar_meas_function per call,
+        so this is one round trip per function and not one for all functions.
+
+        Parameters:
+        - functions: niscope.ScalarMeasurement members or their names, e.g. ["VOLTAGE_TOP", "OVERSHOOT",
+          "RISE_TIME"].
+        - channels: The channel list, e.g. "0,1".
+        - num_records: The number of records, starting with record 0. Default is 1.
+        - timeout: The time to wait for the data in seconds. Default is 5s.
+
+        Returns:
+        - measurements: One row per record and channel (record after record, the channels of a record in
+          the order of the channel list) with the fields 'channel', 'record' and one float field per
+          function named like the function, e.g. measurements['OVERSHOOT'] (see scalar_measurement).
+        """
+        functions = [niscope.ScalarMeasurement[function] if isinstance(function, str) else function
+                     for function in functions]
+        names = [name.strip() for name in channels.split(",")]
+        dtype = [("channel", "U32"), ("record", "i4")] + [(function.name, "f8") for function in functions]
+        measurements = np.zeros(num_records * len(names), dtype=dtype)
+        # the driver returns the stats in the same order
+        measurements["channel"] = np.tile(names, num_records)
+        measurements["record"] = np.repeat(np.arange(num_records), len(names))
+        for function in functions:
+            stats = self.instr.channels[channels].fetch_measurement_stats(scalar_meas_function=function,
+                                                                           num_records=num_records,
+                                                                           timeout=hightime.timedelta(seconds=timeout))
+            measurements[function.name] = [stat.result for stat in stats]
+        return measurements
+
+    @staticmethod
+    def scalar_measurement(measurements:np.ndarray, function:str, channel, record:int=0) -> float:
+        """
+        Returns one value of the structured array of fetch_scalar_measurements.
+
+        Parameters:
+        - measurements: The structured array.
+        - function: The name of the measurement function, e.g. "OVERSHOOT".
+        - channel: The channel name or number, e.g. 1.
+        - record: The record number. Default is 0.
+        """
+        rows = measurements[(measurements["channel"] == str(channel)) & (measurements["record"] == record)]
+        if len(rows) != 1:
+            raise ValueError(f"No {function} measurement of channel {channel} record {record}")
+        return float(rows[function][0])
+
     def get_measurement(self, channel_nr:int, record_number:int) -> float:
         return self.instr.channels[channel_nr].fetch_measurement_stats(scalar_meas_function=niscope.ScalarMeasurement.OVERSHOOT)
     
     def get_data2(sc0, sc1, delta_t=100e-3, num_samples=20000, trigger_level=0.1, 
                  trigger_slope='POSITIVE', trigger_source_channel_nr=0, triger_position=50.0, voffset=0, vrange=6.0, trigger_scope=1, delay=0.0,
-                 labels=["Voltage input", "Voltage Output", "Current Input", "Current Output"]) -> PlotData:
+                 labels=["Voltage input", "Voltage Output", "Current Input", "Current Output"], reuse_buffers=False,
+                 raw=False, acquisition_timeout=20.0) -> PlotData:
         """
         Acquires waveform data from two scopes and returns a PlotData object. In this method one has on sc0 the voltage and on sc1 the current
 
@@ -274,8 +700,17 @@ class PXI_5142:
         - voffset: The offset of the voltage signal on the scope. Default is 0V.
         - vrange: The range of the voltage signal on the scope. Default is 6V.
         - trigger_scope: The scope that triggers the other scope. Default is 1. ==> One triggers on the voltage when set to zero one triggers the current
+        - reuse_buffers: Fetch into the preallocated buffers of the scopes. Default is False.
+          The returned waveforms are then overwritten by the next acquisition, so they must be
+          stored (not queued with write_behind) or copied before the next call.
+        - raw: Fetch the native int16 samples and return ScaledWaveform objects that scale to
+          volts on demand (see fetch_raw). Default is False.
+        - acquisition_timeout: The maximum time to wait for the trigger in seconds. Default is 20s.
         Returns:
-        - plot_data: A PlotData object containing the acquired waveform data.
+        - plot_data: A PlotData object containing the acquired waveform data. The attribute
+          acquisition_time is the time in seconds from the initiate until the record was seen complete,
+          including the post-trigger part of the record and up to 1ms of polling
+          (see wait_until_acquisition_done), None if the scope did not trigger.
 
         Note:
         - This function configures the scopes, sets the trigger settings, initiates the acquisition,
@@ -284,6 +719,54 @@ class PXI_5142:
 
         """
         time.sleep(delay)
+        source, follower, time_t = PXI_5142.arm_scopes(sc0, sc1, delta_t, num_samples, trigger_level, trigger_slope,
+                                                       trigger_source_channel_nr, triger_position, voffset, vrange,
+                                                       trigger_scope)
+
+        # returns as soon as the record of the triggering scope is complete
+        acquisition_time = source.wait_until_acquisition_done(acquisition_timeout)
+        if acquisition_time is None or not follower.is_acquisition_done():
+            print("Something went wrong ==> most probably the scope did not trigger")
+        #get the waveform data.
+        current_ratio=PXI_5142.CURRENT_RATIO
+        # one fetch per scope into a (2, num_samples) array, one row per channel
+        dtype = np.int16 if raw else np.float64
+        outs = [None, None] if reuse_buffers else [np.empty((2, num_samples), dtype=dtype)
+                                                   for _ in range(2)]
+
+        def fetch_voltages():
+            if raw:
+                return sc0.fetch_raw(num_samples, out=outs[0])
+            return sc0.fetch_channels(num_samples, out=outs[0])
+
+        def fetch_currents():
+            if raw:
+                return sc1.fetch_raw(num_samples, out=outs[1], scale=1/current_ratio)
+            currents = sc1.fetch_channels(num_samples, out=outs[1])
+            return np.divide(currents, current_ratio, out=currents)
+
+        # both scopes are fetched at the same time
+        (waveform1, waveform2), (waveform3, waveform4) = PXI_5142.run_parallel(fetch_voltages,
+                                                                               fetch_currents)
+
+        plot_data = PXI_5142.create_plot_data(time_t, (waveform1, waveform2, waveform3, waveform4), labels)
+        plot_data.acquisition_time = acquisition_time
+        # Free trigger source
+        source.configure_exported_ref_trigger("")
+        return plot_data
+
+    @staticmethod
+    def arm_scopes(sc0, sc1, delta_t, num_samples, trigger_level, trigger_slope, trigger_source_channel_nr,
+                   triger_position, voffset, vrange, trigger_scope, num_records=1):
+        """
+        Configures and initiates the voltage scope sc0 and the current scope sc1 of get_data2.
+
+        The parameters are the ones of get_data2. With num_records > 1 one initiate arms
+        num_records records, each record waits for its own trigger.
+
+        Returns:
+        - (source, follower, time_t): The triggering scope, the scope triggered by it and the time vector.
+        """
         # Check if the acquisition is in progress and abort it if it is.
         if sc0.instr.acquisition_status().name=="IN_PROGRESS":
             sc0.instr.abort()
@@ -295,53 +778,44 @@ class PXI_5142:
         t_min = -num_samples/2*dt
         t_max = num_samples/2*dt
         # create the time vector
-        time_t = np.linspace(t_min, t_max, num=num_samples)
-        # create list of scopes
-        session_list=[sc0.instr, sc1.instr]
-        # set the vertical and horizontal settings for each scope
-        for session in session_list:
-            if session==session_list[0]:
-                session.configure_vertical(range=vrange, coupling=niscope.VerticalCoupling.DC, probe_attenuation=1.0, offset=voffset)
-            else:
-                session.configure_vertical(range=3, coupling=niscope.VerticalCoupling.DC, probe_attenuation=1.0, offset=0)
-            session.configure_horizontal_timing(min_sample_rate=horz_sample_rate, min_num_pts=num_samples, ref_position=triger_position, num_records=1, enforce_realtime=True)
+        # shared, the time array is only created when it is used
+        time_t = TimeBase.from_range(t_min, t_max, num_samples)
+        # set the vertical and horizontal settings for each scope, settings that did not change
+        # since the previous run are not written again (see apply_setting)
+        sc0.configure_vertical_all(vrange=vrange, coupling='DC', offset=voffset, probe_attenuation=1.0)
+        sc1.configure_vertical_all(vrange=3, coupling='DC', offset=0, probe_attenuation=1.0)
+        for scope in (sc0, sc1):
+            scope.configure_horizontal(min_sample_rate=horz_sample_rate, min_num_pts=num_samples, num_records=num_records,
+                                       ref_position=triger_position)
 
         if trigger_scope:
-            # configure the trigger settings for the first scope
-            sc0.configure_trigger_edge(trigger_source_channel_nr=trigger_source_channel_nr, trigger_coupling='DC', level=trigger_level, slope=trigger_slope)
-            # export the trigger from the first scope to the second scope (add trigger on pxi line 1)
-            sc0.instr.exported_ref_trigger_output_terminal="PXI_Trig1"
-            # set trigger of second scope to the exported trigger
-            sc1.instr.configure_trigger_digital(trigger_source="PXI_Trig1")
-            # initiate the acquisition
-            sc1.instr.initiate()
-            sc0.instr.initiate()
+            source, follower = sc0, sc1
         else:
-            # configure the trigger settings for the first scope
-            sc1.configure_trigger_edge(trigger_source_channel_nr=trigger_source_channel_nr, trigger_coupling='DC', level=trigger_level, slope=trigger_slope)
-            # export the trigger from the first scope to the second scope (add trigger on pxi line 1)
-            sc1.instr.exported_ref_trigger_output_terminal="PXI_Trig1"
-            # set trigger of second scope to the exported trigger
-            sc0.instr.configure_trigger_digital(trigger_source="PXI_Trig1")
-            # initiate the acquisition
-            sc0.instr.initiate()
-            sc1.instr.initiate()
+            source, follower = sc1, sc0
+        # configure the trigger settings for the triggering scope
+        source.configure_trigger_edge(trigger_source_channel_nr=trigger_source_channel_nr, trigger_coupling='DC', level=trigger_level, slope=trigger_slope)
+        # export the trigger to the other scope (add trigger on pxi line 1), only one scope drives the line
+        follower.configure_exported_ref_trigger("")
+        source.configure_exported_ref_trigger("PXI_Trig1")
+        # set trigger of the other scope to the exported trigger
+        follower.configure_trigger_digital(trigger_source="PXI_Trig1")
+        # initiate the acquisition (commits the changed settings once per scope)
+        follower.initiate()
+        source.initiate()
+        return source, follower, time_t
 
-        # wait to be sure that the scope has triggered
-        sc0.wait_until_acquisition_done(20)
-        if sc1.instr.acquisition_status().name=="IN_PROGRESS":
-            print("Something went wrong ==> most probably the scope did not trigger")
-        #get the waveform data.
-        current_ratio=2.5 # 2.5V/A
-        waveforms1 = sc0.instr.channels[0].fetch(num_samples=num_samples)
-        waveforms2 = sc0.instr.channels[1].fetch(num_samples=num_samples)
-        waveforms3 = sc1.instr.channels[0].fetch(num_samples=num_samples)
-        waveforms4 = sc1.instr.channels[1].fetch(num_samples=num_samples)
-        waveform1= np.array(waveforms1[0].samples.obj)
-        waveform2= np.array(waveforms2[0].samples.obj)
-        waveform3= np.array(waveforms3[0].samples.obj)/current_ratio
-        waveform4= np.array(waveforms4[0].samples.obj)/current_ratio
+    @staticmethod
+    def create_plot_data(time_t, waveforms, labels, verbose=True) -> PlotData:
+        """
+        Creates the PlotData of get_data2 with the steady-state values and the efficiency.
 
+        Parameters:
+        - time_t: The time vector.
+        - waveforms: (input voltage, output voltage, input current, output current).
+        - labels: The labels of the four waveforms.
+        - verbose: Print the steady-state values. Default is True.
+        """
+        waveform1, waveform2, waveform3, waveform4 = waveforms
         plot_data = PlotData()
         plot_data.add_data(time_t, waveform1, label=labels[0])
         plot_data.add_data(time_t, waveform2, label=labels[1])
@@ -359,23 +833,115 @@ class PXI_5142:
         power_out = plot_data.out_voltage*plot_data.out_current
         efficiency = power_out/power_in
         plot_data.efficiency = efficiency
-        #print the five values above
-        print(f"Efficiency was {plot_data.efficiency}")
-        print(f"Input Voltage was: {plot_data.in_voltage}V")
-        print(f"Output Voltage was: {plot_data.out_voltage}V")
-        print(f"Input Current was: {plot_data.in_current}A")
-        print(f"Output Current was: {plot_data.out_current}A")
+        if verbose:
+            #print the five values above
+            print(f"Efficiency was {plot_data.efficiency}")
+            print(f"Input Voltage was: {plot_data.in_voltage}V")
+            print(f"Output Voltage was: {plot_data.out_voltage}V")
+            print(f"Input Current was: {plot_data.in_current}A")
+            print(f"Output Current was: {plot_data.out_current}A")
         # print(f"Top was on input{sc0.instr.channels[0].fetch_measurement_stats(scalar_meas_function=niscope.ScalarMeasurement.VOLTAGE_HIGH)[0].result}")
         # print(f"Top was on output{sc0.instr.channels[1].fetch_measurement_stats(scalar_meas_function=niscope.ScalarMeasurement.VOLTAGE_HIGH)[0].result}")
-        
-        # Free trigger source
-        if trigger_scope:
-            sc0.instr.exported_ref_trigger_output_terminal=""
-        else:
-            sc1.instr.exported_ref_trigger_output_terminal=""
-        
         return plot_data
 
+    @staticmethod
+    def get_records2(sc0, sc1, num_records, stimulus, delta_t=100e-3, num_samples=20000, trigger_level=0.1,
+                     trigger_slope='POSITIVE', trigger_source_channel_nr=0, triger_position=50.0, voffset=0, vrange=6.0,
+                     trigger_scope=1, labels=["Voltage input", "Voltage Output", "Current Input", "Current Output"],
+                     acquisition_timeout=20.0) -> list:
+        """
+        Acquires num_records records of a repeated stimulus with one acquisition (multi-record mode).
+
+        The scopes are configured and armed once for num_records records (same settings as get_data2),
+        then stimulus() is called num_records times, each call has to cause one trigger. The next call
+        waits until the triggering scope has completed the record of the previous one (records_done).
+        All records of a scope are fetched with one fetch_into call into a (num_records, 2, num_samples)
+        array, the scopes are fetched at the same time.
+
+        Parameters:
+        - num_records: The number of records.
+        - stimulus: A function without arguments that causes one trigger, e.g. one load step.
+          It is called after the record of the previous call is complete.
+        - The other parameters are the ones of get_data2.
+
+        Returns:
+        - plot_data_list: One PlotData per record, the waveforms are rows of the record arrays.
+        """
+        source, follower, time_t = PXI_5142.arm_scopes(sc0, sc1, delta_t, num_samples, trigger_level, trigger_slope,
+                                                       trigger_source_channel_nr, triger_position, voffset, vrange,
+                                                       trigger_scope, num_records=num_records)
+        deadline = time.perf_counter() + acquisition_timeout
+        for record in range(num_records):
+            stimulus()
+            # the next stimulus would fall into the record that is still being acquired
+            if not source.wait_until_records_done(record + 1, max(deadline - time.perf_counter(), 0.0)):
+                print(f"Something went wrong ==> record {record} was not triggered")
+                break
+        acquisition_time = source.wait_until_acquisition_done(max(deadline - time.perf_counter(), 0.0))
+        if acquisition_time is None or not follower.is_acquisition_done():
+            print("Something went wrong ==> most probably not all records were triggered")
+
+        def fetch_currents():
+            currents = sc1.fetch_records(num_samples, num_records)
+            return np.divide(currents, PXI_5142.CURRENT_RATIO, out=currents)
+
+        voltages, currents = PXI_5142.run_parallel(lambda: sc0.fetch_records(num_samples, num_records),
+                                                   fetch_currents)
+        # Free trigger source
+        source.configure_exported_ref_trigger("")
+        plot_data_list = []
+        for record in range(num_records):
+            plot_data = PXI_5142.create_plot_data(time_t, (*voltages[record], *currents[record]), labels,
+                                                  verbose=False)
+            plot_data.record = record
+            plot_data_list.append(plot_data)
+        return plot_data_list
+
+    @staticmethod
+    def get_measurements2(sc0, sc1, functions=("VOLTAGE_TOP", "VOLTAGE_MAX", "OVERSHOOT", "RISE_TIME"),
+                          delta_t=100e-3, num_samples=20000, trigger_level=0.1, trigger_slope='POSITIVE',
+                          trigger_source_channel_nr=0, triger_position=50.0, voffset=0, vrange=6.0, trigger_scope=1,
+                          delay=0.0, acquisition_timeout=20.0) -> PlotData:
+        """
+        Acquires like get_data2 but only transfers onboard scalar measurements, not the waveforms.
+
+        The measurements of both scopes are fetched at the same time (see fetch_scalar_measurements).
+        The steady-state values and the efficiency are taken from VOLTAGE_TOP, which is always measured,
+        the current measurements in volts are divided by CURRENT_RATIO for these values.
+
+        Parameters:
+        - functions: The scalar measurements, see fetch_scalar_measurements.
+        - The other parameters are the ones of get_data2.
+
+        Returns:
+        - plot_data: A PlotData object without waveforms, with the attributes in_voltage, out_voltage,
+          in_current, out_current, efficiency, acquisition_time and scalar_measurements, a dictionary
+          with the structured arrays of the voltage scope ('sc0') and the current scope ('sc1').
+        """
+        functions = [niscope.ScalarMeasurement[function] if isinstance(function, str) else function
+                     for function in functions]
+        if niscope.ScalarMeasurement.VOLTAGE_TOP not in functions:
+            functions.append(niscope.ScalarMeasurement.VOLTAGE_TOP)
+        time.sleep(delay)
+        source, follower, _ = PXI_5142.arm_scopes(sc0, sc1, delta_t, num_samples, trigger_level, trigger_slope,
+                                                  trigger_source_channel_nr, triger_position, voffset, vrange,
+                                                  trigger_scope)
+        acquisition_time = source.wait_until_acquisition_done(acquisition_timeout)
+        if acquisition_time is None or not follower.is_acquisition_done():
+            print("Something went wrong ==> most probably the scope did not trigger")
+        voltages, currents = PXI_5142.run_parallel(lambda: sc0.fetch_scalar_measurements(functions),
+                                                   lambda: sc1.fetch_scalar_measurements(functions))
+        # Free trigger source
+        source.configure_exported_ref_trigger("")
+        plot_data = PlotData()
+        plot_data.acquisition_time = acquisition_time
+        plot_data.scalar_measurements = {"sc0": voltages, "sc1": currents}
+        plot_data.in_voltage = PXI_5142.scalar_measurement(voltages, "VOLTAGE_TOP", 0)
+        plot_data.out_voltage = PXI_5142.scalar_measurement(voltages, "VOLTAGE_TOP", 1)
+        plot_data.in_current = PXI_5142.scalar_measurement(currents, "VOLTAGE_TOP", 0) / PXI_5142.CURRENT_RATIO
+        plot_data.out_current = PXI_5142.scalar_measurement(currents, "VOLTAGE_TOP", 1) / PXI_5142.CURRENT_RATIO
+        plot_data.efficiency = (plot_data.out_voltage*plot_data.out_current) / (plot_data.in_voltage*plot_data.in_current)
+        return plot_data
 
 if __name__ == '__main__':
     import logging
@@ -0,0 +1,771 @@
+"""
+This module contains a simulation of the PXI-5142 scopes of the DC-DC converter tests.
+
+SimulatedSession is a pure-Python stand-in for the niscope.Session methods that PXI_5142 uses.
+It returns synthetic waveforms of a DcDcConverterModel instead of acquiring them, so get_data2,
+the DC-DC test classes and the database can be run, benchmarked and regression-tested on any
+machine without the PXI chassis or the NI-SCOPE driver:
+
+    model = DcDcConverterModel("load", noise=2e-3, seed=1)
+    sc0, sc1 = create_scopes(model)
+    plot_data = PXI_5142.get_data2(sc0, sc1, **ACQUISITION_SETTINGS["load"])
+
+The simulation follows the hardware where the tests depend on it: the vertical range is coerced
+to a range of the device and the samples are quantized and clipped to it, an edge trigger only
+fires if its channel crosses the level, the scope with a digital trigger follows the scope that
+exports its reference trigger, and records take their acquisition time (see the model's
+trigger_delay and realtime).
+"""
+
+import argparse
+import array
+import math
+import time
+import niscope
+import numpy as np
+
+SCENARIOS = ("startup", "step", "load")
+# vertical ranges (peak to peak) of the 1 MOhm input, a range is coerced up to the next one
+VERTICAL_RANGES = (0.2, 0.4, 1.0, 2.0, 4.0, 10.0, 20.0)
+MAX_SAMPLE_RATE = 100e6
+NUM_CHANNELS = 2
+# the noise is generated in blocks of samples, so a sample has the same noise in every fetch
+_NOISE_BLOCK = 65536
+# get_data2 settings of the DC-DC test classes for the scenarios
+ACQUISITION_SETTINGS = {
+    "startup": {"trigger_source_channel_nr": 0},
+    "step": {"trigger_source_channel_nr": 0, "trigger_level": 4.7, "delta_t": 100e-3,
+             "triger_position": 5.0, "voffset": 0, "vrange": 6.0},
+    "load": {"trigger_source_channel_nr": 1, "trigger_level": 0.01, "delta_t": 25e-3,
+             "triger_position": 10.0, "voffset": 0, "vrange": 6.0, "trigger_scope": 0},
+}
+
+
+class DcDcConverterModel:
+    """
+    Synthetic input and output voltages and currents of a DC-DC converter.
+
+    The event of the scenario happens at t=0, which is the trigger point of the records:
+    'startup' ramps up the input voltage, 'step' steps the input voltage from vin_step[0] to
+    vin_step[1] and 'load' switches step_resistance on for pulse_width. The output voltage
+    answers like a second-order system with natural_frequency and damping.
+
+    Attributes:
+        scenario (str): 'startup', 'step' or 'load'.
+        noise (float): The RMS noise in volts at the scope inputs.
+        trigger_delay (float): The time in seconds from the initiate until a record triggers,
+            None if the trigger never comes.
+        trigger_jitter (float): The standard deviation in seconds of the event around the
+            trigger point.
+        realtime (bool): Records take their acquisition time (number of samples / sample rate).
+        seed (int): The seed of the noise and the jitter.
+    """
+
+    def __init__(self, scenario="load", vin=5.0, vout=1.8, vin_step=(4.3, 4.8), vin_rise=200e-6,
+                 load_resistance=10.0, step_resistance=3.6, pulse_width=5e-3, efficiency=0.85,
+                 quiescent_current=1e-3, output_capacitance=22e-6, natural_frequency=5e3,
+                 damping=0.3, startup_delay=1e-3, soft_start=2e-3, startup_overshoot=0.05,
+                 line_transient=0.02, transient_impedance=0.1, noise=2e-3, trigger_delay=1e-3,
+                 trigger_jitter=0.0, realtime=True, seed=None):
+        """
+        Initializes a DcDcConverterModel object.
+
+        Args:
+            scenario (str, optional): 'startup', 'step' or 'load'. Defaults to "load".
+            vin (float, optional): The input voltage in volts. Defaults to 5.0.
+            vout (float, optional): The regulated output voltage in volts. Defaults to 1.8.
+            vin_step (tuple, optional): The input voltage before and after the step of the
+                'step' scenario. Defaults to (4.3, 4.8).
+            vin_rise (float, optional): The rise time of the input voltage in seconds.
+                Defaults to 200e-6.
+            load_resistance (float, optional): The load in ohms of 'startup' and 'step'.
+                Defaults to 10.0.
+            step_resistance (float, optional): The load in ohms that 'load' switches on the
+                unloaded output. Defaults to 3.6.
+            pulse_width (float, optional): The time in seconds the load is switched on.
+                Defaults to 5e-3 (see DcDcConverterLoadTest.load_step).
+            efficiency (float, optional): The efficiency. Defaults to 0.85.
+            quiescent_current (float, optional): The input current without load in amperes.
+                Defaults to 1e-3.
+            output_capacitance (float, optional): The output capacitance in farads, its
+                charging current is drawn from the input. Defaults to 22e-6.
+            natural_frequency (float, optional): The natural frequency of the control loop in
+                hertz. Defaults to 5e3.
+            damping (float, optional): The damping ratio (0 < damping < 1). Defaults to 0.3.
+            startup_delay (float, optional): The time in seconds from the start of the input
+                voltage until the soft start begins. Defaults to 1e-3.
+            soft_start (float, optional): The ramp time of the output voltage in seconds.
+                Defaults to 2e-3.
+            startup_overshoot (float, optional): The overshoot at the end of the soft start
+                relative to vout. Defaults to 0.05.
+            line_transient (float, optional): The peak output deviation per volt of input step.
+                Defaults to 0.02.
+            transient_impedance (float, optional): The peak output deviation per ampere of
+                load step in ohms. Defaults to 0.1.
+            noise (float, optional): The RMS noise in volts at the scope inputs.
+                Defaults to 2e-3.
+            trigger_delay (float, optional): The time in seconds from the initiate until a
+                record triggers, None if the trigger never comes. Defaults to 1e-3.
+            trigger_jitter (float, optional): The standard deviation in seconds of the event
+                around the trigger point. Defaults to 0.0.
+            realtime (bool, optional): Records take their acquisition time. Defaults to True.
+            seed (int, optional): The seed of the noise and the jitter. Defaults to None
+                (random).
+        """
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {scenario}, use one of {SCENARIOS}")
+        if not 0 < damping < 1:
+            raise ValueError("The damping must be between 0 and 1")
+        self.scenario = scenario
+        self.vin = vin
+        self.vout = vout
+        self.vin_step = vin_step
+        self.vin_rise = vin_rise
+        self.load_resistance = load_resistance
+        self.step_resistance = step_resistance
+        self.pulse_width = pulse_width
+        self.efficiency = efficiency
+        self.quiescent_current = quiescent_current
+        self.output_capacitance = output_capacitance
+        self.natural_frequency = natural_frequency
+        self.damping = damping
+        self.startup_delay = startup_delay
+        self.soft_start = soft_start
+        self.startup_overshoot = startup_overshoot
+        self.line_transient = line_transient
+        self.transient_impedance = transient_impedance
+        self.noise = noise
+        self.trigger_delay = trigger_delay
+        self.trigger_jitter = trigger_jitter
+        self.realtime = realtime
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.sessions = []
+
+    def ringing(self, t):
+        """
+        Returns the damped ringing of the control loop after a disturbance at t=0, normalized
+        to a peak of 1, 0 for t < 0.
+        """
+        a, b = self.decay_and_frequency()
+        t_peak = math.atan2(b, a) / b
+        peak = math.exp(-a * t_peak) * math.sin(b * t_peak)
+        t = np.maximum(t, 0.0)
+        return np.exp(-a * t) * np.sin(b * t) / peak
+
+    def decay_and_frequency(self):
+        """
+        Returns the decay rate and the damped angular frequency of the control loop.
+        """
+        omega = 2 * math.pi * self.natural_frequency
+        return self.damping * omega, omega * math.sqrt(1 - self.damping ** 2)
+
+    def signals(self, t):
+        """
+        Returns the noiseless signals of the converter.
+
+        Args:
+            t (np.ndarray): The evenly spaced times in seconds relative to the event.
+
+        Returns:
+            dict: 'vin', 'vout' in volts and 'iin', 'iout' in amperes.
+        """
+        t = np.asarray(t, dtype=np.float64)
+        rise = np.clip(t / self.vin_rise, 0.0, 1.0)
+        if self.scenario == "startup":
+            vin = self.vin * rise
+            ramp = np.clip((t - self.startup_delay) / self.soft_start, 0.0, 1.0)
+            vout = self.vout * (ramp + self.startup_overshoot *
+                                self.ringing(t - self.startup_delay - self.soft_start))
+            iout = vout / self.load_resistance
+        elif self.scenario == "step":
+            vin_low, vin_high = self.vin_step
+            vin = vin_low + (vin_high - vin_low) * rise
+            vout = self.vout + self.line_transient * (vin_high - vin_low) * self.ringing(t)
+            iout = vout / self.load_resistance
+        else:
+            vin = np.full_like(t, self.vin)
+            step_current = self.vout / self.step_resistance
+            vout = self.vout - self.transient_impedance * step_current * (
+                self.ringing(t) - self.ringing(t - self.pulse_width))
+            iout = np.where((t >= 0) & (t < self.pulse_width), vout / self.step_resistance, 0.0)
+        # the input delivers the load and the charging current of the output capacitor
+        if len(t) > 1:
+            charging = self.output_capacitance * np.gradient(vout, t[1] - t[0])
+        else:
+            charging = np.zeros_like(t)
+        powered = vin > 0.5
+        iin = np.divide(vout * (iout + charging), self.efficiency * vin, out=np.zeros_like(t),
+                        where=powered)
+        iin += self.quiescent_current * powered
+        return {"vin": vin, "vout": vout, "iin": iin, "iout": iout}
+
+    def register(self, session):
+        """
+        Adds a simulated session to the model and returns its number (used for its noise).
+        """
+        self.sessions.append(session)
+        return len(self.sessions) - 1
+
+    def exporter(self, terminal):
+        """
+        Returns the simulated session that exports its reference trigger to terminal, None if
+        there is none.
+        """
+        for session in self.sessions:
+            if terminal and session.exported_ref_trigger_output_terminal == terminal:
+                return session
+        return None
+
+    def voltage_session(self, resource_name="PXI2Slot8"):
+        """
+        Returns a SimulatedSession with the input voltage on channel 0 and the output voltage on
+        channel 1, like sc0 of the DC-DC tests.
+        """
+        return SimulatedSession(self, ("vin", "vout"), 1.0, resource_name)
+
+    def current_session(self, resource_name="PXI2Slot7", current_ratio=2.5):
+        """
+        Returns a SimulatedSession with the input current on channel 0 and the output current on
+        channel 1 as current probe voltages (current_ratio in V/A), like sc1 of the DC-DC tests.
+        """
+        return SimulatedSession(self, ("iin", "iout"), current_ratio, resource_name)
+
+
+class SimulatedChannels:
+    """
+    The channels of a SimulatedSession, indexed like the channels of niscope.Session, e.g.
+    session.channels[0] or session.channels["0,1"].
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            numbers = [key]
+        else:
+            numbers = []
+            for part in str(key).split(","):
+                first, _, last = part.strip().partition("-")
+                numbers.extend(range(int(first), int(last or first) + 1))
+        for number in numbers:
+            if not 0 <= number < NUM_CHANNELS:
+                raise ValueError(f"Invalid channel {number}")
+        return SimulatedChannel(self.session, numbers)
+
+
+class SimulatedChannel:
+    """
+    One or several channels of a SimulatedSession with the per-channel methods of
+    niscope.Session.
+    """
+
+    def __init__(self, session, numbers):
+        self.session = session
+        self.numbers = numbers
+
+    def configure_vertical(self, range, coupling, offset=0.0, probe_attenuation=1.0, # pylint: disable=redefined-builtin
+                           enabled=True):
+        vrange = min((value for value in VERTICAL_RANGES if value >= range - 1e-12),
+                     default=VERTICAL_RANGES[-1])
+        for number in self.numbers:
+            self.session.vertical[number] = {"range": vrange, "coupling": coupling,
+                                             "offset": offset, "enabled": enabled}
+
+    def configure_chan_characteristics(self, input_impedance, max_input_frequency):
+        pass
+
+    def configure_trigger_immediate(self):
+        self.session.configure_trigger_immediate()
+
+    def fetch_into(self, waveform, relative_to=niscope.FetchRelativeTo.PRETRIGGER, offset=0,
+                   record_number=0, num_records=None, timeout=5.0):
+        """
+        Fetches into a flat numpy array (float64, int8, int16 or int32), record after record
+        and the channels of a record after each other, like niscope.Session.fetch_into.
+        """
+        session = self.session
+        num_records = session.num_records_from(record_number, num_records)
+        num_samples = len(waveform) // (len(self.numbers) * num_records)
+        start = session.fetch_start(relative_to, offset, record_number, num_samples, timeout)
+        wfm_infos = []
+        rows = waveform[:num_samples * len(self.numbers) * num_records].reshape(-1, num_samples)
+        for index, (record, number) in enumerate(
+                (record, number) for record in range(record_number, record_number + num_records)
+                for number in self.numbers):
+            gain = session.gain(number, waveform.dtype)
+            rows[index] = session.samples(record, number, start, num_samples, waveform.dtype)
+            wfm_infos.append(session.waveform_info(record, number, start, gain))
+        return wfm_infos
+
+    def fetch(self, num_samples=None, relative_to=niscope.FetchRelativeTo.PRETRIGGER, offset=0,
+              record_number=0, num_records=None, timeout=5.0):
+        """
+        Fetches scaled voltages into WaveformInfo objects like niscope.Session.fetch, the samples
+        are memoryviews of one array.array of all waveforms.
+        """
+        session = self.session
+        num_records = session.num_records_from(record_number, num_records)
+        if num_samples is None:
+            num_samples = session.horz_record_length - offset
+        waveform = np.empty(num_samples * len(self.numbers) * num_records)
+        wfm_infos = self.fetch_into(waveform, relative_to, offset, record_number, num_records,
+                                    timeout)
+        data = memoryview(array.array("d", waveform.tobytes()))
+        for index, wfm_info in enumerate(wfm_infos):
+            wfm_info.samples = data[index * num_samples:(index + 1) * num_samples]
+        return wfm_infos
+
+    def read(self, num_samples=None, relative_to=niscope.FetchRelativeTo.PRETRIGGER, offset=0,
+             record_number=0, num_records=None, timeout=5.0):
+        """
+        Initiates an acquisition and fetches it, like niscope.Session.read.
+        """
+        self.session.initiate()
+        return self.fetch(num_samples, relative_to, offset, record_number, num_records, timeout)
+
+    def fetch_measurement_stats(self, scalar_meas_function, relative_to=None, offset=0,
+                                record_number=0, num_records=None, timeout=5.0): # pylint: disable=unused-argument
+        """
+        Computes a scalar measurement of the records, record after record and the channels of a
+        record after each other, like niscope.Session.fetch_measurement_stats.
+        """
+        session = self.session
+        measure = _MEASUREMENTS.get(scalar_meas_function.name)
+        if measure is None:
+            raise ValueError(f"{scalar_meas_function.name} is not simulated, use one of " +
+                             f"{sorted(_MEASUREMENTS)}")
+        num_records = session.num_records_from(record_number, num_records)
+        num_samples = session.horz_record_length
+        session.fetch_start(niscope.FetchRelativeTo.PRETRIGGER, 0, record_number + num_records - 1,
+                            num_samples, timeout)
+        stats = []
+        for record in range(record_number, record_number + num_records):
+            for number in self.numbers:
+                volts = session.samples(record, number, 0, num_samples, np.float64)
+                result = float(measure(volts, 1 / session.horz_sample_rate))
+                stat = niscope.MeasurementStats(result=result, mean=result, min_val=result,
+                                                max_val=result, num_in_stats=1)
+                stat.channel = str(number)
+                stat.record = record
+                stats.append(stat)
+        return stats
+
+
+class SimulatedSession:
+    """
+    A stand-in for niscope.Session that acquires the signals of a DcDcConverterModel.
+
+    Attributes:
+        model (DcDcConverterModel): The converter model.
+        signals (tuple): The model signal of each channel, e.g. ("vin", "vout").
+        scale (float): The scope input volts per signal unit, e.g. 2.5 for a 2.5V/A probe.
+        resource_name (str): The resource name, used in the trigger sources.
+        channels (SimulatedChannels): The channels, indexed like niscope.Session.channels.
+    """
+
+    def __init__(self, model: DcDcConverterModel, signals=("vin", "vout"), scale=1.0,
+                 resource_name="Sim"):
+        """
+        Initializes a SimulatedSession object.
+
+        Args:
+            model (DcDcConverterModel): The converter model, shared by the scopes of a test.
+            signals (tuple, optional): The model signal of each channel. Defaults to
+                ("vin", "vout").
+            scale (float, optional): The scope input volts per signal unit. Defaults to 1.0.
+            resource_name (str, optional): The resource name. Defaults to "Sim".
+        """
+        self.model = model
+        self.signals = signals
+        self.scale = scale
+        self.resource_name = resource_name
+        self.channels = SimulatedChannels(self)
+        self.number = model.register(self)
+        self.reset_device()
+
+    def self_test(self):
+        pass
+
+    def reset_device(self):
+        self.vertical = {number: {"range": 10.0, "coupling": None, "offset": 0.0, "enabled": True}
+                         for number in range(NUM_CHANNELS)}
+        self.horz_sample_rate = 10e6
+        self.horz_record_length = 1000
+        self.horz_record_ref_position = 50.0
+        self.horz_num_records = 1
+        self.trigger = ("immediate",)
+        self.exported_ref_trigger_output_terminal = ""
+        self.acquisition = 0
+        self.initiated_at = None
+        self.running = False
+        self.read_pointer = 0
+        self.completions = None
+
+    def disable(self):
+        self.running = False
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        self.running = False
+
+    def close(self):
+        self.running = False
+        if self in self.model.sessions:
+            self.model.sessions.remove(self)
+
+    @property
+    def horz_min_num_pts(self):
+        return self.horz_record_length
+
+    def configure_vertical(self, range, coupling, offset=0.0, probe_attenuation=1.0, # pylint: disable=redefined-builtin
+                           enabled=True):
+        self.channels[f"0-{NUM_CHANNELS - 1}"].configure_vertical(range, coupling, offset,
+                                                                  probe_attenuation, enabled)
+
+    def configure_horizontal_timing(self, min_sample_rate, min_num_pts, ref_position, num_records,
+                                    enforce_realtime):
+        self.horz_sample_rate = min(float(min_sample_rate), MAX_SAMPLE_RATE)
+        self.horz_record_length = int(min_num_pts)
+        self.horz_record_ref_position = float(ref_position)
+        self.horz_num_records = int(num_records)
+
+    def configure_trigger_edge(self, trigger_source, level, trigger_coupling, slope=None,
+                               holdoff=None, delay=None):
+        self.trigger = ("edge", trigger_source, level, getattr(slope, "name", "POSITIVE"))
+
+    def configure_trigger_hysteresis(self, trigger_source, level, hysteresis, trigger_coupling,
+                                     slope=None, holdoff=None, delay=None):
+        self.trigger = ("edge", trigger_source, level, getattr(slope, "name", "POSITIVE"))
+
+    def configure_trigger_digital(self, trigger_source, slope=None, holdoff=None, delay=None):
+        self.trigger = ("digital", trigger_source)
+
+    def configure_trigger_immediate(self):
+        self.trigger = ("immediate",)
+
+    def initiate(self):
+        self.acquisition += 1
+        self.initiated_at = time.perf_counter()
+        self.running = True
+        self.read_pointer = 0
+        self.completions = self.completion_times()
+
+    def record_time(self):
+        """
+        Returns the time in seconds it takes to acquire one record, 0 if the model is not
+        realtime.
+        """
+        if not self.model.realtime:
+            return 0.0
+        return self.horz_record_length / self.horz_sample_rate
+
+    def pretrigger_samples(self):
+        return int(round(self.horz_record_ref_position / 100 * self.horz_record_length))
+
+    def completion_times(self):
+        """
+        Returns the perf_counter() times at which the records of the acquisition are complete,
+        None if the records do not trigger.
+        """
+        kind = self.trigger[0]
+        records = range(self.horz_num_records)
+        if kind == "immediate":
+            return [self.initiated_at + (record + 1) * self.record_time() for record in records]
+        if kind == "digital":
+            # follows the scope that exports its reference trigger, see acquisition_status()
+            return None
+        if self.model.trigger_delay is None or not self.edge_fires():
+            return None
+        post_trigger = (1 - self.horz_record_ref_position / 100) * self.record_time()
+        return [self.initiated_at + (record + 1) * self.model.trigger_delay + post_trigger
+                for record in records]
+
+    def edge_fires(self):
+        """
+        Returns True if the noiseless signal of the edge trigger channel crosses the level in
+        the direction of the slope within a record.
+        """
+        _, source, level, slope = self.trigger
+        number = int(source.rsplit("/", 1)[-1])
+        volts = self.signal(number, self.times(0, 0, self.horz_record_length))
+        if slope == "NEGATIVE":
+            return bool(np.any((volts[:-1] > level) & (volts[1:] <= level)))
+        return bool(np.any((volts[:-1] < level) & (volts[1:] >= level)))
+
+    def current_completions(self):
+        if self.trigger[0] == "digital":
+            source = self.model.exporter(self.trigger[1])
+            if source is None or source is self or not source.running:
+                return None
+            return source.completions
+        return self.completions
+
+    def acquisition_status(self):
+        if not self.running:
+            return niscope.AcquisitionStatus.COMPLETE
+        completions = self.current_completions()
+        if completions is not None and time.perf_counter() >= completions[-1]:
+            return niscope.AcquisitionStatus.COMPLETE
+        return niscope.AcquisitionStatus.IN_PROGRESS
+
+    @property
+    def records_done(self):
+        completions = self.current_completions()
+        if completions is None:
+            return 0
+        now = time.perf_counter()
+        return sum(1 for completion in completions if now >= completion)
+
+    def acquired_samples(self, record, now):
+        """
+        Returns the number of samples of a record that are acquired at the perf_counter() time
+        now.
+        """
+        completions = self.current_completions()
+        if completions is None:
+            return 0
+        if now >= completions[record]:
+            return self.horz_record_length
+        if not self.model.realtime:
+            return 0
+        started = completions[record] - self.record_time()
+        acquired = int((now - started) * self.horz_sample_rate)
+        return min(max(acquired, 0), self.horz_record_length)
+
+    @property
+    def backlog(self):
+        if self.initiated_at is None:
+            return 0
+        return self.acquired_samples(0, time.perf_counter()) - self.read_pointer
+
+    def num_records_from(self, record_number, num_records):
+        if num_records is None:
+            return self.horz_num_records - record_number
+        if record_number + num_records > self.horz_num_records:
+            raise ValueError(f"Only {self.horz_num_records} records are configured")
+        return num_records
+
+    def fetch_start(self, relative_to, offset, last_record, num_samples, timeout):
+        """
+        Waits until the samples to fetch are acquired and returns the index of the first sample
+        in the records.
+
+        Raises:
+            TimeoutError: The samples are not acquired within timeout.
+        """
+        if self.initiated_at is None:
+            raise RuntimeError("The acquisition was not initiated")
+        name = relative_to.name
+        if name in ("PRETRIGGER", "START"):
+            start = offset
+        elif name == "TRIGGER":
+            start = self.pretrigger_samples() + offset
+        elif name == "READ_POINTER":
+            start = self.read_pointer + offset
+        else:
+            raise ValueError(f"Fetching relative to {name} is not simulated")
+        end = start + num_samples
+        if start < 0 or end > self.horz_record_length:
+            raise ValueError(f"Samples {start} to {end} are outside of the record")
+        timeout = getattr(timeout, "total_seconds", lambda: timeout)()
+        deadline = time.perf_counter() + timeout
+        while True:
+            now = time.perf_counter()
+            if self.acquired_samples(last_record, now) >= end:
+                break
+            if now >= deadline:
+                raise TimeoutError(f"{self.resource_name}: the samples were not acquired within "
+                                   f"{timeout}s")
+            completions = self.current_completions()
+            wake = now + 1e-3 if completions is None else completions[last_record]
+            if self.model.realtime and completions is not None:
+                # the samples are acquired one after the other
+                wake = min(wake, completions[last_record] - self.record_time() +
+                           end / self.horz_sample_rate)
+            time.sleep(max(min(wake, deadline) - now, 0.0))
+        if name == "READ_POINTER":
+            self.read_pointer = end
+        return start
+
+    def times(self, record, start, count):
+        """
+        Returns the model times of samples of a record, the event of the model is at the trigger
+        point shifted by the jitter of the record.
+        """
+        jitter = 0.0
+        if self.model.trigger_jitter:
+            rng = np.random.default_rng((self.model.seed, self.acquisition, record))
+            jitter = rng.normal(0.0, self.model.trigger_jitter)
+        indices = np.arange(start, start + count) - self.pretrigger_samples()
+        return indices / self.horz_sample_rate - jitter
+
+    def signal(self, number, t):
+        """
+        Returns the noiseless scope input volts of a channel at the model times t.
+        """
+        if number >= len(self.signals) or self.signals[number] is None:
+            return np.zeros_like(t)
+        return self.model.signals(t)[self.signals[number]] * self.scale
+
+    def noise(self, record, number, start, count):
+        """
+        Returns the noise of samples of a record, generated in blocks so that every fetch of a
+        sample returns the same noise.
+        """
+        noise = np.empty(count)
+        first, last = start // _NOISE_BLOCK, (start + count - 1) // _NOISE_BLOCK
+        for block in range(first, last + 1):
+            rng = np.random.default_rng((self.model.seed, self.number, self.acquisition, record,
+                                         number, block))
+            values = rng.standard_normal(_NOISE_BLOCK)
+            begin = max(start, block * _NOISE_BLOCK)
+            end = min(start + count, (block + 1) * _NOISE_BLOCK)
+            noise[begin - start:end - start] = values[begin - block * _NOISE_BLOCK:
+                                                      end - block * _NOISE_BLOCK]
+        return noise * self.model.noise
+
+    def gain(self, number, dtype):
+        """
+        Returns the volts per code of a channel for binary samples of dtype, the volts per
+        int16 code for float samples.
+        """
+        dtype = np.dtype(dtype)
+        bits = 8 * dtype.itemsize if dtype.kind == "i" else 16
+        return self.vertical[number]["range"] / 2 ** bits
+
+    def samples(self, record, number, start, count, dtype):
+        """
+        Returns samples of a record of a channel, quantized and clipped to the vertical range,
+        as binary codes for an integer dtype and in volts otherwise.
+        """
+        volts = self.signal(number, self.times(record, start, count))
+        if self.model.noise:
+            volts = volts + self.noise(record, number, start, count)
+        dtype = np.dtype(dtype)
+        gain = self.gain(number, dtype)
+        offset = self.vertical[number]["offset"]
+        limit = 2 ** (8 * dtype.itemsize - 1) if dtype.kind == "i" else 2 ** 15
+        codes = np.clip(np.round((volts - offset) / gain), -limit, limit - 1)
+        if dtype.kind == "i":
+            return codes.astype(dtype)
+        return codes * gain + offset
+
+    def waveform_info(self, record, number, start, gain):
+        wfm_info = niscope.WaveformInfo(x_increment=1 / self.horz_sample_rate,
+                                        relative_initial_x=(start - self.pretrigger_samples()) /
+                                        self.horz_sample_rate,
+                                        offset=self.vertical[number]["offset"], gain=gain)
+        wfm_info.channel = str(number)
+        wfm_info.record = record
+        return wfm_info
+
+
+def _top_and_base(volts):
+    middle = (volts.min() + volts.max()) / 2
+    upper, lower = volts[volts >= middle], volts[volts < middle]
+    return np.median(upper), np.median(lower) if lower.size else volts.min()
+
+
+def _transition_time(volts, dt, rising):
+    top, base = _top_and_base(volts)
+    low, high = base + 0.1 * (top - base), base + 0.9 * (top - base)
+    if not rising:
+        volts, low, high = -volts, -high, -low
+    first = np.flatnonzero(volts >= low)
+    if not first.size:
+        return math.nan
+    second = np.flatnonzero(volts[first[0]:] >= high)
+    return second[0] * dt if second.size else math.nan
+
+
+# scalar measurements of fetch_measurement_stats, functions of (volts, dt)
+_MEASUREMENTS = {
+    "VOLTAGE_MAX": lambda volts, dt: volts.max(),
+    "VOLTAGE_MIN": lambda volts, dt: volts.min(),
+    "VOLTAGE_PEAK_TO_PEAK": lambda volts, dt: volts.max() - volts.min(),
+    "VOLTAGE_AVERAGE": lambda volts, dt: volts.mean(),
+    "VOLTAGE_RMS": lambda volts, dt: np.sqrt(np.mean(volts ** 2)),
+    "VOLTAGE_TOP": lambda volts, dt: _top_and_base(volts)[0],
+    "VOLTAGE_BASE": lambda volts, dt: _top_and_base(volts)[1],
+    "AMPLITUDE": lambda volts, dt: np.subtract(*_top_and_base(volts)),
+    "OVERSHOOT": lambda volts, dt: 100 * (volts.max() - _top_and_base(volts)[0]) /
+                                   np.subtract(*_top_and_base(volts)),
+    "PRESHOOT": lambda volts, dt: 100 * (_top_and_base(volts)[1] - volts.min()) /
+                                  np.subtract(*_top_and_base(volts)),
+    "RISE_TIME": lambda volts, dt: _transition_time(volts, dt, rising=True),
+    "FALL_TIME": lambda volts, dt: _transition_time(volts, dt, rising=False),
+}
+
+
+def create_scopes(model: DcDcConverterModel, voltage_addr="PXI2Slot8", current_addr="PXI2Slot7"):
+    """
+    Creates the two simulated scopes of the DC-DC tests.
+
+    Args:
+        model (DcDcConverterModel): The converter model.
+        voltage_addr (str, optional): The resource name of the voltage scope sc0.
+            Defaults to "PXI2Slot8".
+        current_addr (str, optional): The resource name of the current scope sc1.
+            Defaults to "PXI2Slot7".
+
+    Returns:
+        tuple: (sc0, sc1), PXI_5142 objects with the voltages and the currents.
+    """
+    # pylint: disable=import-outside-toplevel
+    from Drivers.pxi_5142_main.PXI_5142 import PXI_5142
+    sc0 = PXI_5142(voltage_addr, name="scope",
+                   simulate=model.voltage_session(voltage_addr))
+    sc1 = PXI_5142(current_addr, name="scope",
+                   simulate=model.current_session(current_addr, PXI_5142.CURRENT_RATIO))
+    return sc0, sc1
+
+
+if __name__ == "__main__":
+    # pylint: disable=import-outside-toplevel
+    from Drivers.pxi_5142_main.PXI_5142 import PXI_5142
+    from database import Database
+    parser = argparse.ArgumentParser(description="Benchmark get_data2 and the database with " +
+                                     "simulated scopes (run from the repository root with " +
+                                     "python -m Drivers.pxi_5142_main.simulation)")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="load")
+    parser.add_argument("--runs", type=int, default=10, help="number of acquisitions")
+    parser.add_argument("--noise", type=float, default=2e-3, help="RMS noise in volts")
+    parser.add_argument("--trigger-delay", type=float, default=1e-3,
+                        help="time from the initiate until the trigger in seconds")
+    parser.add_argument("--trigger-jitter", type=float, default=0.0,
+                        help="standard deviation of the event around the trigger in seconds")
+    parser.add_argument("--no-realtime", action="store_true",
+                        help="records are complete at the trigger")
+    parser.add_argument("--raw", action="store_true", help="fetch int16 samples")
+    parser.add_argument("--database", default=None,
+                        help="name of a database (without .db) to store the measurements in")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    converter = DcDcConverterModel(arguments.scenario, noise=arguments.noise,
+                                   trigger_delay=arguments.trigger_delay,
+                                   trigger_jitter=arguments.trigger_jitter,
+                                   realtime=not arguments.no_realtime, seed=arguments.seed)
+    scope0, scope1 = create_scopes(converter)
+    data_base = Database(arguments.database) if arguments.database else None
+    acquisition_times, insert_times = [], []
+    for run in range(arguments.runs):
+        started = time.perf_counter()
+        result = PXI_5142.get_data2(scope0, scope1, raw=arguments.raw,
+                                    **ACQUISITION_SETTINGS[arguments.scenario])
+        acquired = time.perf_counter()
+        acquisition_times.append(acquired - started)
+        if data_base is not None:
+            result.title = f"Simulated {arguments.scenario} {run + 1}/{arguments.runs}"
+            data_base.insert("simulation", f"simulated {arguments.scenario}", result, "Passed",
+                             f"{converter.vin}V", "R1")
+            insert_times.append(time.perf_counter() - acquired)
+    if data_base is not None:
+        data_base.close()
+    print(f"get_data2: mean {np.mean(acquisition_times) * 1e3:.2f}ms, " +
+          f"min {np.min(acquisition_times) * 1e3:.2f}ms")
+    if insert_times:
+        print(f"insert:    mean {np.mean(insert_times) * 1e3:.2f}ms, " +
+              f"min {np.min(insert_times) * 1e3:.2f}ms")
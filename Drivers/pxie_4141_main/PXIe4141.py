@@ -13,6 +13,16 @@ import time
 
 class PXIe4141:
     
+    # channels that supply the chip together (set_all_* methods)
+    GANGED_CHANNELS = "0,1,2"
+    # measurement profiles (see apply_profile): aperture time, its units, source delay in seconds
+    # and auto zero, the PXIe-4141 only supports auto zero OFF
+    PROFILES = {
+        "fast": (50e-6, nidcpower.ApertureTimeUnits.SECONDS, 20e-6, "OFF"),
+        "normal": (2, nidcpower.ApertureTimeUnits.POWER_LINE_CYCLES, 0.001, "OFF"),
+        "precise": (10, nidcpower.ApertureTimeUnits.POWER_LINE_CYCLES, 0.01, "OFF"),
+    }
+
     def __init__(self, addr = 'PXI2Slot3', name = 'NoName', selftest=False, reset=False, log=False):
         self.log = log
         if log:
@@ -22,6 +32,13 @@ class PXIe4141:
         self.name = name
         self.addr = addr
         self.instr = None
+        # output function and output enable of the channels as written by this object, so
+        # measure() does not query them from the driver (see cached_state)
+        self.channel_state = {}
+        # number of measurements and last voltage of the uploaded sequences, keyed by channel list
+        self.sequence_points = {}
+        # name of the profile applied to each channel
+        self.profiles = {}
         self.__open_com(selftest, reset)
 
     def __open_com(self, with_selftest: bool, with_reset: bool):
@@ -41,6 +58,7 @@ class PXIe4141:
     def reset(self):
         self.instr.reset_device()
         self.instr.disable()
+        self.channel_state.clear()
         if self.log:
             self.logger.info("Device reseted")
         
@@ -60,6 +78,86 @@ class PXIe4141:
         self.instr.channels[channel_nr].source_delay = delay
         self.instr.channels[channel_nr].configure_aperture_time(aperture_plc, nidcpower.ApertureTimeUnits.POWER_LINE_CYCLES)
         self.instr.channels[channel_nr].initiate()
+        for number in self.channel_numbers(channel_nr):
+            self.profiles.pop(number, None)
+
+    def apply_profile(self, channels, profile: str="normal"):
+        """
+        Applies a measurement profile (see PROFILES) to a channel or a channel list.
+
+        'fast' measures in microseconds for quick checks, 'normal' is the 2 PLC aperture used so
+        far and 'precise' averages over 10 PLC for static voltages and currents.
+
+        Args:
+            channels (int or str): The channel number or a channel list, e.g. "0,1,2".
+            profile (str, optional): 'fast', 'normal' or 'precise'. Defaults to "normal".
+        """
+        if profile not in self.PROFILES:
+            raise ValueError(f"Unknown profile {profile}, use one of {list(self.PROFILES)}")
+        aperture_time, units, source_delay, auto_zero = self.PROFILES[profile]
+        channel = self.instr.channels[channels]
+        channel.abort()
+        channel.source_delay = source_delay
+        channel.configure_aperture_time(aperture_time, units)
+        channel.auto_zero = nidcpower.AutoZero[auto_zero]
+        channel.initiate()
+        for channel_nr in self.channel_numbers(channels):
+            self.profiles[channel_nr] = profile
+        if self.log:
+            self.logger.info("Profile %s applied to Ch%s", profile, channels)
+
+    def benchmark_profiles(self, channel_nr: int, points: int=50, profiles=None) -> dict:
+        """
+        Measures the time per point and the noise of the measurement profiles on a channel.
+
+        The channel has to be configured and enabled with a constant output, each profile measures
+        points points back to back with measure_vi. The source delay, aperture and auto zero settings
+        of the channel are read before and written back at the end, also if they were configured
+        directly and not with a profile.
+
+        Args:
+            channel_nr (int): The channel number.
+            points (int, optional): The number of points per profile. Defaults to 50.
+            profiles (list, optional): The profile names. Defaults to None (all profiles).
+
+        Returns:
+            dict: For each profile a dictionary with 'time_per_point' in seconds and the standard
+                deviations 'voltage_noise' in volts and 'current_noise' in amperes.
+        """
+        channel = self.instr.channels[channel_nr]
+        previous = (channel.source_delay, channel.aperture_time, channel.aperture_time_units,
+                    channel.auto_zero)
+        previous_profile = self.profiles.get(channel_nr)
+        results = {}
+        try:
+            for profile in profiles or self.PROFILES:
+                self.apply_profile(channel_nr, profile)
+                # the first point includes the source delay after the initiate
+                self.measure_vi(channel_nr)
+                values = np.empty((points, 2))
+                start = time.perf_counter()
+                for point in range(points):
+                    values[point] = self.measure_vi(channel_nr)
+                elapsed = time.perf_counter() - start
+                results[profile] = {"time_per_point": elapsed / points,
+                                    "voltage_noise": float(np.std(values[:, 0])),
+                                    "current_noise": float(np.std(values[:, 1]))}
+                if self.log:
+                    self.logger.info("Profile %s: %.6fs per point, %.3gV, %.3gA noise", profile,
+                                     results[profile]["time_per_point"], results[profile]["voltage_noise"],
+                                     results[profile]["current_noise"])
+        finally:
+            source_delay, aperture_time, aperture_time_units, auto_zero = previous
+            channel.abort()
+            channel.source_delay = source_delay
+            channel.configure_aperture_time(aperture_time, aperture_time_units)
+            channel.auto_zero = auto_zero
+            channel.initiate()
+            if previous_profile is None:
+                self.profiles.pop(channel_nr, None)
+            else:
+                self.profiles[channel_nr] = previous_profile
+        return results
     
     def configure_channel_vdc(self, channel_nr: int, voltage_range: float, voltage: float,
                               current_limit_low: float, current_limit_high: float):
@@ -89,6 +187,7 @@ class PXIe4141:
         self.instr.channels[channel_nr].current_limit_high = current_limit_high
         
         self.instr.channels[channel_nr].initiate()
+        self.remember(channel_nr, output_function=nidcpower.OutputFunction.DC_VOLTAGE)
         
     def configure_channel_idc(self, channel_nr: int, current_range: float, current: float,
                               voltage_limit_low: float, voltage_limit_high: float):
@@ -118,21 +217,130 @@ class PXIe4141:
         self.instr.channels[channel_nr].voltage_limit_high = voltage_limit_high
         
         self.instr.channels[channel_nr].initiate()
+        self.remember(channel_nr, output_function=nidcpower.OutputFunction.DC_CURRENT)
         
+    def configure_sequence_vdc(self, channels, voltages, source_delays, aperture_time: float=None,
+                               voltage_range: float=6.0, current_limit_low: float=-0.001,
+                               current_limit_high: float=0.1, loop_count: int=1):
+        """
+        Uploads a hardware-timed voltage sequence, see run_sequence.
+
+        Each step sources its voltage, waits its source delay and then measures voltage and current
+        once (aperture_time), all timed by the instrument. A step therefore lasts its source delay
+        plus the aperture time, use a short aperture_time for short steps.
+
+        Args:
+            channels (int or str): The channel number or a channel list, e.g. "0,1,2" for the ganged
+                channels, all channels source the same sequence.
+            voltages (list): The voltage of each step.
+            source_delays (float or list): The time in seconds from the voltage of a step to its
+                measurement, for all steps or for each step.
+            aperture_time (float, optional): The measurement aperture in seconds. Defaults to None
+                (the aperture configured before, see set_aperture and apply_profile, e.g. 40ms with
+                the 'normal' profile).
+            voltage_range (float, optional): The voltage range. Defaults to 6.0.
+            current_limit_low (float, optional): The low current limit. Defaults to -0.001.
+            current_limit_high (float, optional): The high current limit. Defaults to 0.1.
+            loop_count (int, optional): The number of times the sequence runs. Defaults to 1.
+        """
+        voltages = [float(voltage) for voltage in voltages]
+        if np.ndim(source_delays) == 0:
+            source_delays = [float(source_delays)] * len(voltages)
+        if len(source_delays) != len(voltages):
+            raise ValueError("source_delays must have one delay per voltage")
+        channel = self.instr.channels[channels]
+        channel.abort()
+        channel.power_line_frequency = 50.0
+        channel.source_mode = nidcpower.SourceMode.SEQUENCE
+        channel.output_function = nidcpower.OutputFunction.DC_VOLTAGE
+        # one measurement per step, taken by the instrument after the source delay
+        channel.measure_when = nidcpower.MeasureWhen.AUTOMATICALLY_AFTER_SOURCE_COMPLETE
+        channel.measure_record_length = 1
+        if aperture_time is not None:
+            channel.configure_aperture_time(aperture_time, nidcpower.ApertureTimeUnits.SECONDS)
+            for channel_nr in self.channel_numbers(channels):
+                self.profiles.pop(channel_nr, None)
+        channel.voltage_level_autorange = False
+        channel.voltage_level_range = voltage_range
+        channel.compliance_limit_symmetry = nidcpower.ComplianceLimitSymmetry.ASYMMETRIC
+        channel.current_limit_autorange = False
+        channel.current_limit_range = max([abs(current_limit_low), abs(current_limit_high)])
+        channel.current_limit_low = current_limit_low
+        channel.current_limit_high = current_limit_high
+        channel.sequence_loop_count_is_finite = True
+        channel.sequence_loop_count = loop_count
+        channel.set_sequence(values=voltages, source_delays=[float(delay) for delay in source_delays])
+        self.sequence_points[str(channels)] = (len(voltages) * loop_count, voltages[-1])
+        self.remember(channels, output_function=nidcpower.OutputFunction.DC_VOLTAGE)
+
+    def run_sequence(self, channels, timeout: float=10.0) -> tuple:
+        """
+        Runs the sequence uploaded with configure_sequence_vdc and fetches all its measurements
+        with one fetch_multiple call.
+
+        The outputs must be enabled. The last voltage of the sequence stays on the outputs, afterwards
+        the channels are back in single point mode with measurements on demand, so set_voltage and
+        measure work as before.
+
+        Args:
+            channels (int or str): The channels of configure_sequence_vdc.
+            timeout (float, optional): The time in seconds to wait for the sequence. Defaults to 10.0.
+
+        Returns:
+            tuple: (voltages, currents, in_compliance), numpy arrays of shape (number of channels,
+                number of steps * loop_count) in the order of the channel list.
+        """
+        count, last_voltage = self.sequence_points[str(channels)]
+        num_channels = len(str(channels).split(","))
+        channel = self.instr.channels[channels]
+        channel.initiate()
+        try:
+            channel.wait_for_event(nidcpower.Event.SEQUENCE_ENGINE_DONE, timeout=timeout)
+            # the measurements of a channel list are returned channel after channel
+            measurements = channel.fetch_multiple(count, timeout=timeout)
+        finally:
+            channel.abort()
+            channel.source_mode = nidcpower.SourceMode.SINGLE_POINT
+            channel.measure_when = nidcpower.MeasureWhen.ON_DEMAND
+            channel.voltage_level = last_voltage
+            channel.initiate()
+        voltages = np.fromiter((measurement.voltage for measurement in measurements), dtype=np.float64,
+                               count=num_channels * count).reshape(num_channels, count)
+        currents = np.fromiter((measurement.current for measurement in measurements), dtype=np.float64,
+                               count=num_channels * count).reshape(num_channels, count)
+        in_compliance = np.fromiter((measurement.in_compliance for measurement in measurements), dtype=bool,
+                                    count=num_channels * count).reshape(num_channels, count)
+        if self.log:
+            self.logger.info("Sequence: Ch%s, %d points", channels, count)
+        return voltages, currents, in_compliance
+
+    def sweep_vdc(self, channels, voltages, source_delays, aperture_time: float=None, timeout: float=10.0,
+                  **limits) -> tuple:
+        """
+        Sources a hardware-timed voltage sweep or step pattern and returns its measurements, see
+        configure_sequence_vdc (limits are its voltage_range, current_limit_low/high and loop_count)
+        and run_sequence.
+        """
+        self.configure_sequence_vdc(channels, voltages, source_delays, aperture_time, **limits)
+        return self.run_sequence(channels, timeout)
+
     def set_voltage(self, channel_nr: int, voltage: float, enable : bool):
         # output_connected : Not supported
         self.instr.channels[channel_nr].voltage_level = voltage
         self.instr.channels[channel_nr].output_enabled = enable
-    def set_all_voltages(self, voltage: float, enable : bool):
-        self.instr.voltage_level = voltage
-        self.instr.output_enabled = enable
+        self.remember(channel_nr, enabled=enable)
+    def set_all_voltages(self, voltage: float, enable : bool, channels: str=GANGED_CHANNELS):
+        # one write per property for all channels, the outputs switch together
+        self.set_voltage(channels, voltage, enable)
     def set_current(self, channel_nr: int, current: float, enable : bool):
         # output_connected : Not supported
         self.instr.channels[channel_nr].current_level = current
         self.instr.channels[channel_nr].output_enabled = enable
+        self.remember(channel_nr, enabled=enable)
         
     def enable(self, channel_nr, enable: bool):
         self.instr.channels[channel_nr].output_enabled = enable
+        self.remember(channel_nr, enabled=enable)
         if self.log:
             if enable:
                 self.logger.info("Channel {nr} was enabled".format(nr = channel_nr))
@@ -140,37 +348,104 @@ class PXIe4141:
                 self.logger.info("Channel {nr} was disabled".format(nr = channel_nr))
 
     def enable_all(self, enable: bool):
-        for channel_nr in range(0, self.instr.channel_count-1):
-            self.instr.channels[channel_nr].output_enabled = enable
+        # the ganged channels with one write, the unused channel 3 is not touched
+        self.instr.channels[self.GANGED_CHANNELS].output_enabled = enable
+        self.remember(self.GANGED_CHANNELS, enabled=enable)
         if self.log:
             if enable:
                 self.logger.info("All Channels were enabled")
             else:
                 self.logger.info("All Channels were disabled")
         
-    def measure(self, channel_nr: int) -> float:
-        st = self.instr.channels[channel_nr].measure_multiple()
-        resistance = st[0].voltage/st[0].current
-        power = st[0].voltage*st[0].current
-        if self.is_output_function_dc_voltage(channel_nr):
+    @staticmethod
+    def channel_numbers(channels) -> list:
+        """
+        Returns the channel numbers of a channel number or a channel list like "0,1,2" or "0-2".
+        """
+        numbers = []
+        for part in str(channels).split(","):
+            first, _, last = part.strip().partition("-")
+            numbers.extend(range(int(first), int(last or first) + 1))
+        return numbers
+
+    def remember(self, channels, **state):
+        """
+        Stores the output function and/or output enable written to a channel or a channel list in
+        the cache.
+        """
+        for channel_nr in self.channel_numbers(channels):
+            self.channel_state.setdefault(channel_nr, {}).update(state)
+
+    def cached_state(self, channel_nr: int, key: str):
+        """
+        Returns the cached 'output_function' or 'enabled' of a channel, the driver is only queried
+        if this object did not write it yet.
+        """
+        state = self.channel_state.setdefault(channel_nr, {})
+        if key not in state:
+            state[key] = getattr(self.instr.channels[channel_nr], "output_function" if key == "output_function"
+                                 else "output_enabled")
+        return state[key]
+
+    def measure_vi(self, channel_nr: int) -> tuple:
+        """
+        Measures the voltage and the current of a channel with one driver call and nothing else.
+
+        Returns:
+            tuple: (voltage, current)
+        """
+        st = self.instr.channels[channel_nr].measure_multiple()[0]
+        return st.voltage, st.current
+
+    def measure_channels(self, channels: str=GANGED_CHANNELS) -> tuple:
+        """
+        Measures the voltages and the currents of a channel list with one driver call.
+
+        Returns:
+            tuple: (voltages, currents), numpy arrays in the order of the channel list.
+        """
+        measurements = self.instr.channels[channels].measure_multiple()
+        return (np.array([measurement.voltage for measurement in measurements]),
+                np.array([measurement.current for measurement in measurements]))
+
+    def measure(self, channel_nr: int, query_compliance: bool=False) -> list:
+        """
+        Measures a channel with one measure_multiple call.
+
+        The mode and the enable state come from the configuration written by this object (see
+        cached_state). Pass query_compliance=True to also query the compliance state.
+
+        Args:
+            channel_nr (int): The channel number.
+            query_compliance (bool, optional): Query whether the output is in compliance
+                (tripped), one more driver call. Defaults to False.
+
+        Returns:
+            list: [voltage, current, resistance, power, mode, enable, tripped], mode is 'VDC',
+                'IDC' or 'UNDEF', tripped is None if the compliance was not queried.
+        """
+        voltage, current = self.measure_vi(channel_nr)
+        resistance = voltage/current
+        power = voltage*current
+        output_function = self.cached_state(channel_nr, "output_function")
+        if output_function == nidcpower.OutputFunction.DC_VOLTAGE:
             mode = 'VDC'
-        elif self.is_output_function_dc_current(channel_nr):
+        elif output_function == nidcpower.OutputFunction.DC_CURRENT:
             mode = 'IDC'
         else:
-            mode = 'UNDEF'  
-        enable = self.is_enable(channel_nr)
-        tripped = self.is_tripped(channel_nr)
+            mode = 'UNDEF'
+        enable = self.cached_state(channel_nr, "enabled")
+        tripped = None
+        if query_compliance:
+            tripped = enable and self.instr.channels[channel_nr].query_in_compliance()
 
         if self.log:
-            self.logger.info("Measure: Ch{nr}, V={v:.4f}V, I={i:.4f}A, R={r:.4f}Ohm, P={p:.4f}W: mode={mode:s}".format(nr=st[0].channel[-1], 
-                                                                                                                      v=st[0].voltage,
-                                                                                                                      i=st[0].current,
-                                                                                                                      r=resistance,
-                                                                                                                      p=power,
-                                                                                                                      mode=mode))
+            # formatted only if the log level is enabled
+            self.logger.info("Measure: Ch%d, V=%.4fV, I=%.4fA, R=%.4fOhm, P=%.4fW: mode=%s", channel_nr, voltage,
+                             current, resistance, power, mode)
             if tripped:
                 self.logger.info("Output is tripped!")
-        return [st[0].voltage, st[0].current, resistance, power, mode, enable, tripped]
+        return [voltage, current, resistance, power, mode, enable, tripped]
     
     
     def is_task_running(self, channel_nr: int) -> bool:
@@ -275,6 +550,7 @@ class PXIe4141:
 
         self.instr.channels[channel_nr].sequence_step_delta_time = Ts
         self.instr.channels[channel_nr].sequence_step_delta_time_enabled = True
+        self.remember(channel_nr, output_function=nidcpower.OutputFunction.DC_VOLTAGE)
 
         
         # self.instr.channels[channel_nr].initiate()
@@ -289,43 +565,43 @@ class PXIe4141:
         else:
             self.instr.channels[channel_nr].abort()
                     
-    def set_all_smu_outputs_to_voltage(self, output_voltage=5):
+    def set_all_smu_outputs_to_voltage(self, output_voltage=5, profile="normal"):
         """
         Sets the output voltage of all SMU channels to a specified value.
 
         Args:
             output_voltage (float, optional): The desired output voltage. Defaults to 5.
+            profile (str, optional): The measurement profile, see apply_profile. Defaults to "normal".
 
         Returns:
             None
         """
+        # the ganged channels are configured, enabled and set with one driver call each
+        channels = self.GANGED_CHANNELS
         print("Set speed of SMU channel")
-        self.set_aperture(1, 0.001, 2)
-        self.set_aperture(2, 0.001, 2)
-        self.set_aperture(0, 0.001, 2)
+        self.apply_profile(channels, profile)
         print(f"Set {output_voltage}V on output of SMU channel zero")
         # Todo change current limit to 100mA
-        self.configure_channel_vdc(1, 6, 0.0, -0.001, 0.1)
-        self.configure_channel_vdc(2, 6, 0.0, -0.001, 0.1)
-        self.configure_channel_vdc(0, 6, 0.0, -0.001, 0.1)
-        if abs(self.measure(0)[0])>0.01:
-            print("Voltage:" + str(self.measure(0)[0]))
+        self.configure_channel_vdc(channels, 6, 0.0, -0.001, 0.1)
+        voltages = self.measure_channels(channels)[0]
+        if np.max(np.abs(voltages))>0.01:
+            print("Voltage:" + str(voltages))
             print("SMU Voltage was not zero before enabling the channel")
         print("enable the channel")
-        self.enable(1, True)
-        self.enable(2, True)
-        self.enable(0, True)
-        if abs(self.measure(0)[0])>0.01:
-            print("Voltage:" + str(self.measure(0)[0]))
+        self.enable(channels, True)
+        voltages = self.measure_channels(channels)[0]
+        if np.max(np.abs(voltages))>0.01:
+            print("Voltage:" + str(voltages))
             print("SMU Voltage was not zero after enabling the channel")
         # self.set_voltage(1 ,output_voltage,True)
         # self.set_voltage(2 ,output_voltage,True)
         # self.set_voltage(0 ,output_voltage,True)
-        self.set_all_voltages(output_voltage,True)
+        self.set_all_voltages(output_voltage,True,channels)
         time.sleep(0.05)
-        deviation=abs(1-(self.measure(0)[0]/output_voltage))
+        voltages = self.measure_channels(channels)[0]
+        deviation=np.max(np.abs(1-(voltages/output_voltage)))
         if (deviation>=0.01):
-            print("Voltage:" + str(self.measure(0)[0]))
+            print("Voltage:" + str(voltages))
             print(f"SMU output does not have correct value, deviation was: {deviation}")
     
     
@@ -338,12 +614,9 @@ class PXIe4141:
         Returns:
         - None
         """
-        self.set_voltage(1, 0, True)
-        self.set_voltage(2, 0, True)
-        self.set_voltage(0, 0, True)
-        self.set_voltage(1, 0, False)
-        self.set_voltage(2, 0, False)
-        self.set_voltage(0, 0, False)
+        # discharge the outputs to zero, then disable them, both for all ganged channels at once
+        self.set_voltage(self.GANGED_CHANNELS, 0, True)
+        self.enable(self.GANGED_CHANNELS, False)
 
 if __name__ == '__main__':
     import logging
@@ -377,11 +650,11 @@ if __name__ == '__main__':
     smu0.configure_channel_vdc(1, 2.0, 1.0, -0.001, 0.0025)
     smu0.enable(1, True)
 
-    smu0.measure(1)
+    smu0.measure(1, query_compliance=True)
     smu0.set_voltage(1, 2.0, True)
-    smu0.measure(1)
+    smu0.measure(1, query_compliance=True)
     smu0.set_voltage(1, 3.0, True)
-    smu0.measure(1)
+    smu0.measure(1, query_compliance=True)
     smu0.enable(1, False)
     
     smu0.set_aperture(0, 0.001, 2)
@@ -391,12 +664,12 @@ if __name__ == '__main__':
     smu0.enable(0, True)
     smu0.enable(1, True)
     
-    smu0.measure(0)
-    smu0.measure(1)
+    smu0.measure(0, query_compliance=True)
+    smu0.measure(1, query_compliance=True)
     smu0.set_voltage(0, 2.0, True)
     smu0.set_current(1, 0.002, True)
-    smu0.measure(0)
-    smu0.measure(1)
+    smu0.measure(0, query_compliance=True)
+    smu0.measure(1, query_compliance=True)
     smu0.enable(0, False)
     smu0.enable(1, False)
 
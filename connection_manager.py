@@ -0,0 +1,126 @@
+"""
+This module contains the ConnectionManager class that manages the SQLite connections of a
+measurement database.
+
+The database is used in WAL mode: one writer connection stores the measurements while any number
+of read-only reader connections see the last committed state without blocking the writer. The
+readers are kept in a pool and can be used from any thread:
+
+    with ConnectionManager("measurements.db", read_only=True) as connections:
+        with connections.reader() as con:
+            rows = con.execute("SELECT id, chip_id FROM measurements").fetchall()
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionManager:
+    """
+    Manages one writer connection and a pool of read-only reader connections.
+
+    Attributes:
+        path (str): The path of the database file.
+        writer (sqlite3.Connection): The writer connection, None if the manager is read only.
+        size (int): The maximum number of reader connections.
+        timeout (float): The time in seconds a connection waits for a lock.
+    """
+
+    def __init__(self, path, readers=4, read_only=False, timeout=30.0):
+        """
+        Initializes a ConnectionManager object.
+
+        Args:
+            path (str): The path of the database file.
+            readers (int, optional): The maximum number of reader connections. Defaults to 4.
+            read_only (bool, optional): Do not open a writer connection, e.g. for dashboards
+                and plotting scripts. The database must already exist. Defaults to False.
+            timeout (float, optional): The time in seconds a connection waits for a lock.
+                Defaults to 30.0.
+        """
+        self.path = path
+        self.size = readers
+        self.timeout = timeout
+        self.writer = None
+        self.pool = queue.LifoQueue()
+        self.connections = []
+        self.pool_lock = threading.Lock()
+        self.available = threading.Semaphore(readers)
+        self.closed = False
+        if not read_only:
+            self.writer = sqlite3.connect(path, timeout=timeout)
+            # readers and the writer do not block each other in WAL mode
+            self.writer.execute("PRAGMA journal_mode = WAL")
+            self.writer.execute("PRAGMA foreign_keys = ON")
+            # map the database file into memory so waveform blobs are read without extra copies
+            self.writer.execute("PRAGMA mmap_size = 268435456")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect_reader(self):
+        """
+        Opens a new read-only connection.
+
+        The connection may be used from another thread than the one that opened it, but only
+        by one thread at a time (see reader()).
+
+        Returns:
+            sqlite3.Connection: The reader connection.
+        """
+        con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=self.timeout,
+                              check_same_thread=False)
+        con.execute("PRAGMA mmap_size = 268435456")
+        return con
+
+    @contextmanager
+    def reader(self):
+        """
+        Borrows a reader connection from the pool.
+
+        Blocks while all reader connections are in use. The connection is returned to the pool
+        when the block is left and must not be used afterwards.
+
+        Yields:
+            sqlite3.Connection: The reader connection.
+        """
+        if self.closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed connection manager.")
+        self.available.acquire()
+        try:
+            try:
+                con = self.pool.get_nowait()
+            except queue.Empty:
+                con = self.connect_reader()
+                with self.pool_lock:
+                    self.connections.append(con)
+            try:
+                yield con
+            finally:
+                # end an open read transaction so the WAL file can be checkpointed
+                if con.in_transaction:
+                    con.rollback()
+                self.pool.put(con)
+        finally:
+            self.available.release()
+
+    def close(self):
+        """
+        Closes the writer connection and all reader connections.
+
+        Calling close() more than once has no effect.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        with self.pool_lock:
+            connections, self.connections = self.connections, []
+        for con in connections:
+            con.close()
+        if self.writer is not None:
+            self.writer.close()
@@ -4,9 +4,16 @@
 import sqlite3
 import os
 import pickle
+import queue
+import re
+import threading
+from datetime import datetime, timezone
 from enum import Enum
+import numpy as np
 import matplotlib.pyplot as plt
 from plot_data import PlotData
+from waveform_store import WaveformStore
+from connection_manager import ConnectionManager
 
 
 from enum import Enum
@@ -19,6 +26,224 @@ class MeasurementField(Enum):
     MEASUREMENT_PARAMETER1 = "measurement_parameter1"
     MEASUREMENT_PARAMETER2 = "measurement_parameter2"
     MEASUREMENT_TEMPERATURE = "measurement_temperature"
+    INPUT_VOLTAGE = "input_voltage"
+    LOAD_RESISTOR = "load_resistor"
+
+
+# Version of the database schema, stored in 'PRAGMA user_version' (see Database.migrate)
+SCHEMA_VERSION = 7
+# Columns of the 'measurements' table, the measurement data is kept in 'measurement_payloads'
+METADATA_COLUMNS = ("id", "chip_id", "measurement_type", "measurement_parameter1",
+                    "measurement_parameter2", "measurement_temperature", "measurement_result",
+                    "time_stamp", "input_voltage", "step_voltage_low", "step_voltage_high",
+                    "load_resistor")
+# Numeric columns filled from measurement_parameter1 and measurement_parameter2
+NUMERIC_COLUMNS = {"input_voltage": "FLOAT", "step_voltage_low": "FLOAT",
+                   "step_voltage_high": "FLOAT", "load_resistor": "INTEGER"}
+# Columns of the 'measurement_summary' table, computed from PlotData by Database.summarize
+SUMMARY_COLUMNS = ("title", "in_voltage", "out_voltage", "in_current", "out_current",
+                   "efficiency", "peak_voltage", "min_voltage", "overshoot", "settling_time")
+
+
+class MeasurementRow:
+    """
+    Represents the metadata of one measurement.
+
+    The metadata columns are available as attributes. The measurement_data is only loaded from
+    the database when the attribute is accessed for the first time.
+    """
+
+    def __init__(self, database, row):
+        """
+        Initializes a MeasurementRow object.
+
+        Args:
+            database (Database): The database the row was read from.
+            row (tuple): The values of the columns in METADATA_COLUMNS.
+        """
+        for column, value in zip(METADATA_COLUMNS, row):
+            setattr(self, column, value)
+        self._database = database
+        self._measurement_data = None
+        self._loaded = False
+
+    @property
+    def measurement_data(self):
+        """The measurement data (normally a PlotData object), loaded on first access."""
+        if not self._loaded:
+            self._measurement_data = self._database.load_measurement_data(self.id)
+            self._loaded = True
+        return self._measurement_data
+
+    def __repr__(self):
+        values = ", ".join(f"{column}={getattr(self, column)!r}" for column in METADATA_COLUMNS)
+        return f"MeasurementRow({values})"
+
+
+class MeasurementWriteError(Exception):
+    """
+    Raised for the measurements the background writer could not store.
+
+    Attributes:
+        failures (list): (record, error) for every measurement that was not stored, see
+            Database.write_measurement for the record.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__(f"{len(failures)} measurement(s) could not be written, the first " +
+                         f"failed with {failures[0][1]!r}")
+
+
+class MeasurementWriter(threading.Thread):
+    """
+    Writes queued measurements to the database in a background thread.
+
+    The thread has its own connection to the database. All measurements that are waiting in the
+    queue are written in one transaction, so the disk latency is paid once per batch and not on
+    the thread that queued the measurements.
+    """
+
+    def __init__(self, path, batch_size=64, compression="raw"):
+        """
+        Initializes a MeasurementWriter object.
+
+        Args:
+            path (str): The path of the database file.
+            batch_size (int, optional): The maximum number of measurements per transaction.
+                Defaults to 64.
+            compression (str, optional): The codec for new waveform blobs
+                (see WaveformStore). Defaults to "raw".
+        """
+        super().__init__(name="MeasurementWriter", daemon=True)
+        self.path = path
+        self.compression = compression
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        # (record, error) of the measurements that were not stored, see check_error
+        self.failures = []
+        self.failures_lock = threading.Lock()
+
+    def run(self):
+        """
+        Writes the queued measurements until None is queued.
+        """
+        con = sqlite3.connect(self.path)
+        con.execute("PRAGMA foreign_keys = ON")
+        # every committed batch is synced to disk
+        con.execute("PRAGMA synchronous = FULL")
+        cur = con.cursor()
+        waveforms = WaveformStore(con, self.compression)
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            written = []
+            try:
+                # one transaction per batch, the savepoints of the measurements nest inside it
+                cur.execute("BEGIN")
+                for record in batch:
+                    if record is not None and self.write(cur, waveforms, record):
+                        written.append(record)
+                con.commit()
+            except Exception as error:
+                if con.in_transaction:
+                    con.rollback()
+                self.add_failures([(record, error) for record in written])
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        con.close()
+
+    def write(self, cur, waveforms, record):
+        """
+        Writes one measurement of a batch in a savepoint.
+
+        A measurement that cannot be written (e.g. a PlotData object that cannot be summarized)
+        is rolled back and kept in self.failures, the other measurements of the batch are still
+        committed and the thread keeps running.
+
+        Args:
+            cur (sqlite3.Cursor): The cursor of the writer connection.
+            waveforms (WaveformStore): The waveform store of the same connection.
+            record (tuple): The measurement record (see Database.write_measurement).
+
+        Returns:
+            bool: True if the measurement was written.
+        """
+        cur.execute("SAVEPOINT measurement")
+        try:
+            Database.write_measurement(cur, waveforms, record)
+            written = True
+        except Exception as error:
+            cur.execute("ROLLBACK TO measurement")
+            self.add_failures([(record, error)])
+            written = False
+        cur.execute("RELEASE measurement")
+        return written
+
+    def add_failures(self, failures):
+        """
+        Keeps measurements that were not stored until check_error raises them.
+
+        Args:
+            failures (list): (record, error) of each measurement.
+        """
+        with self.failures_lock:
+            self.failures.extend(failures)
+
+    def put(self, record):
+        """
+        Queues a measurement record (see Database.write_measurement).
+
+        Args:
+            record (tuple): The measurement record.
+        """
+        self.check_error()
+        self.check_running()
+        self.queue.put(record)
+
+    def flush(self):
+        """
+        Blocks until all queued measurements are committed to the database.
+        """
+        self.check_running()
+        self.queue.join()
+        self.check_error()
+
+    def stop(self):
+        """
+        Writes the remaining measurements and stops the thread.
+        """
+        self.queue.put(None)
+        self.join()
+        self.check_error()
+
+    def check_running(self):
+        """
+        Raises an error if the thread has stopped, queued measurements would never be written.
+        """
+        if not self.is_alive():
+            raise RuntimeError("The measurement writer is not running")
+
+    def check_error(self):
+        """
+        Raises the measurements that could not be written once, so they are not silently lost.
+
+        Raises:
+            MeasurementWriteError: With all failed measurements since the last call.
+        """
+        with self.failures_lock:
+            failures, self.failures = self.failures, []
+        if failures:
+            raise MeasurementWriteError(failures) from failures[0][1]
+
+
 class Database:
     """
     Represents a SQLite database.
@@ -27,20 +252,77 @@ class Database:
     inserting data, retrieving data, and deleting data.
 
     Attributes:
-        con (sqlite3.Connection): The connection to the SQLite database.
+        connections (ConnectionManager): The writer connection and the pool of reader
+            connections.
+        con (sqlite3.Connection): The writer connection to the SQLite database.
         cur (sqlite3.Cursor): The cursor object for executing SQL statements.
+        waveforms (WaveformStore): The store for the waveforms of PlotData measurements.
+        writer (MeasurementWriter): The background writer, None if measurements are written
+            directly.
     """
 
-    def __init__(self, data_base):
+    def __init__(self, data_base, write_behind=False, compression="raw", readers=4):
         """
         Initializes a Database object.
 
         Args:
             data_base (str): The name of the database.
+            write_behind (bool, optional): Queue inserted measurements and write them in a
+                background thread. Call flush() to make sure they are stored. Defaults to False.
+            compression (str, optional): The codec for new waveform blobs, 'raw', 'zlib' or
+                'zstd' (see WaveformStore). Defaults to "raw".
+            readers (int, optional): The maximum number of read-only connections used by the
+                queries. Defaults to 4.
         """
-        self.con = sqlite3.connect(f'{data_base}.db')
+        self.connections = ConnectionManager(f'{data_base}.db', readers)
+        self.con = self.connections.writer
         self.cur = self.con.cursor()
+        self.writer = None
+        self.waveforms = WaveformStore(self.con, compression)
         self.create_table()
+        if write_behind:
+            self.writer = MeasurementWriter(f'{data_base}.db', compression=compression)
+            self.writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def flush(self):
+        """
+        Blocks until all queued measurements are committed to the database.
+
+        Measurements inserted with write_behind enabled are only visible to queries after this
+        call. Call it at the end of each measurement step.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+
+    def reader(self):
+        """
+        Borrows a read-only connection (see ConnectionManager.reader).
+
+        Reader connections can be used from other threads and do not block the writer, e.g.
+        for plotting while a measurement is running:
+
+            with database.reader() as con:
+                con.execute("SELECT ...")
+
+        Returns:
+            A context manager yielding a sqlite3.Connection.
+        """
+        return self.connections.reader()
+
+    def close(self):
+        """
+        Writes the queued measurements and closes the database connections.
+        """
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.stop()
+        self.connections.close()
 
     def __del__(self):
         """
@@ -57,39 +339,198 @@ class Database:
             so it should not be relied upon
             as the sole means of closing resources.
         """
-        self.con.close()
+        self.close()
 
     def create_table(self):
         """
         Creates a table named 'measurements' if it doesn't already exist in the database.
 
         The table has the following columns:
-        - id: INTEGER (Primary Key)
+        - id: INTEGER (Primary Key, AUTOINCREMENT so IDs of deleted measurements are not reused)
         - chip_id TEXT,
         - measurement_type: TEXT
         - measurement_parameter1 TEXT
         - measurement_parameter2 TEXT
         - measurement_temperature: FLOAT
-        - measurement_data: TEXT
         - measurement_result: TEXT
         - time_stamp: TIMESTAMP (Default: CURRENT_TIMESTAMP)
+        - input_voltage: FLOAT (e.g. 4.3 for "4.3V", the first voltage of a step)
+        - step_voltage_low: FLOAT (e.g. 4.3 for "4.3V to 5V")
+        - step_voltage_high: FLOAT (e.g. 5.0 for "4.3V to 5V")
+        - load_resistor: INTEGER (e.g. 1 for "R1")
+        - retention_stage: INTEGER (0 with full waveforms, 1 when reduced, see Retention)
+
+        New databases use incremental auto vacuum, so freed pages can be returned to the file
+        system (see reclaim_space).
+
+        The pickled measurement data is stored in the table 'measurement_payloads' and the
+        waveforms of PlotData measurements in the table 'waveforms'
+        (see WaveformStore.create_table), so queries on the metadata never read them.
+        The figures of merit of PlotData measurements are stored in the table
+        'measurement_summary' (see Database.summarize).
+        """
+        # only takes effect on a new, empty database, existing ones are converted in migrate
+        self.cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.create_measurements_table("measurements")
+        self.cur.execute('''CREATE TABLE IF NOT EXISTS measurement_payloads
+             (measurement_id INTEGER PRIMARY KEY REFERENCES measurements(id) ON DELETE CASCADE,
+             measurement_data BLOB)''')
+        self.cur.execute('''CREATE TABLE IF NOT EXISTS measurement_summary
+             (measurement_id INTEGER PRIMARY KEY REFERENCES measurements(id) ON DELETE CASCADE,
+             title TEXT,
+             in_voltage FLOAT,
+             out_voltage FLOAT,
+             in_current FLOAT,
+             out_current FLOAT,
+             efficiency FLOAT,
+             peak_voltage FLOAT,
+             min_voltage FLOAT,
+             overshoot FLOAT,
+             settling_time FLOAT)''')
+        self.waveforms.create_table()
+        self.migrate()
+
+    def create_measurements_table(self, table_name):
+        """
+        Creates the 'measurements' table (see create_table) under the given name if it doesn't
+        already exist.
+
+        Args:
+            table_name (str): The name of the table, 'measurements_new' while migrate rebuilds it.
         """
-        self.cur.execute('''CREATE TABLE IF NOT EXISTS measurements
-             (id INTEGER PRIMARY KEY,
+        self.check_identifier(table_name)
+        self.cur.execute(f'''CREATE TABLE IF NOT EXISTS {table_name}
+             (id INTEGER PRIMARY KEY AUTOINCREMENT,
              chip_id TEXT,
              measurement_type TEXT,
              measurement_parameter1 TEXT,
              measurement_parameter2 TEXT,
              measurement_temperature FLOAT,
-             measurement_data TEXT,
              measurement_result TEXT,
-             time_stamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+             time_stamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+             input_voltage FLOAT,
+             step_voltage_low FLOAT,
+             step_voltage_high FLOAT,
+             load_resistor INTEGER,
+             retention_stage INTEGER DEFAULT 0)''')
+
+    def create_indexes(self):
+        """
+        Creates the indexes of the 'measurements' table used by the grouping and filtering
+        queries.
+        """
+        # GROUP BY of get_newest_unique_measurement_ids and delete_duplicate_entries
+        self.cur.execute("CREATE INDEX IF NOT EXISTS measurements_by_setup ON measurements " +
+                         "(chip_id, measurement_type, measurement_parameter1, " +
+                         "measurement_parameter2, measurement_temperature, time_stamp)")
+        # newest measurements of a type, e.g. plot_efficiency
+        self.cur.execute("CREATE INDEX IF NOT EXISTS measurements_by_type ON measurements " +
+                         "(measurement_type, time_stamp)")
+        # numeric filters, e.g. all runs of a chip at one input voltage and load
+        self.cur.execute("CREATE INDEX IF NOT EXISTS measurements_by_operating_point ON " +
+                         "measurements (chip_id, measurement_type, input_voltage, " +
+                         "load_resistor, measurement_temperature)")
+
+    def migrate(self):
+        """
+        Updates the schema of an existing database to SCHEMA_VERSION.
+
+        The version of the schema is stored in 'PRAGMA user_version'. Each step only runs once.
+        - Version 1: Moves the measurement_data column of the 'measurements' table into the
+          'measurement_payloads' table.
+        - Version 2: Adds the numeric parameter columns, fills them from the text parameters
+          and creates the indexes used by the grouping and filtering queries.
+        - Version 3: Fills the 'measurement_summary' table for the existing PlotData
+          measurements. The measurements are loaded one after the other.
+        - Version 4: Moves the waveform samples into the content addressed 'waveform_blobs'
+          table (see WaveformStore.migrate_to_blobs).
+        - Version 5: Adds the retention_stage column and switches the database to incremental
+          auto vacuum. The switch rewrites the database file once with VACUUM.
+        - Version 6: Adds the gain and offset columns of raw waveforms to the 'waveforms' table
+          (see WaveformStore.add_scaling_columns).
+        - Version 7: Rebuilds the 'measurements' table with an AUTOINCREMENT id, so the IDs of
+          deleted measurements are not reused and the ID watermark of DatabaseExport only
+          grows. The foreign keys are switched off while the table is replaced.
+        """
+        version = self.cur.execute("PRAGMA user_version").fetchone()[0]
+        if version < 7:
+            # only takes effect outside of a transaction
+            self.con.commit()
+            self.cur.execute("PRAGMA foreign_keys = OFF")
+        if version < 1:
+            columns = [row[1] for row in self.cur.execute("PRAGMA table_info(measurements)")]
+            if "measurement_data" in columns:
+                self.cur.execute("INSERT INTO measurement_payloads (measurement_id, " +
+                                 "measurement_data) SELECT id, measurement_data FROM " +
+                                 "measurements WHERE measurement_data IS NOT NULL")
+                self.cur.execute("ALTER TABLE measurements DROP COLUMN measurement_data")
+        if version < 2:
+            columns = [row[1] for row in self.cur.execute("PRAGMA table_info(measurements)")]
+            for column, column_type in NUMERIC_COLUMNS.items():
+                if column not in columns:
+                    self.cur.execute(f"ALTER TABLE measurements ADD COLUMN {column} {column_type}")
+            self.cur.execute("SELECT id, measurement_parameter1, measurement_parameter2 " +
+                             "FROM measurements")
+            values = [(*self.parse_parameters(parameter1, parameter2), index)
+                      for index, parameter1, parameter2 in self.cur.fetchall()]
+            self.cur.executemany("UPDATE measurements SET input_voltage = ?, " +
+                                 "step_voltage_low = ?, step_voltage_high = ?, " +
+                                 "load_resistor = ? WHERE id = ?", values)
+            self.create_indexes()
+        # run before version 3, load_measurement_data only reads the current format
+        if version < 4:
+            self.waveforms.migrate_to_blobs()
+        if version < 6:
+            self.waveforms.add_scaling_columns()
+        if version < 3:
+            self.cur.execute("SELECT measurement_id FROM measurement_payloads WHERE " +
+                             "measurement_id NOT IN (SELECT measurement_id FROM " +
+                             "measurement_summary)")
+            for (measurement_id,) in self.cur.fetchall():
+                # the reader connections do not see the uncommitted steps above
+                measurement_data = self.read_measurement_data(self.con, measurement_id)
+                if isinstance(measurement_data, PlotData):
+                    self.insert_summary(self.cur, measurement_id, measurement_data)
+        if version < 5:
+            columns = [row[1] for row in self.cur.execute("PRAGMA table_info(measurements)")]
+            if "retention_stage" not in columns:
+                self.cur.execute("ALTER TABLE measurements ADD COLUMN retention_stage " +
+                                 "INTEGER DEFAULT 0")
+        if version < 7:
+            sql = self.cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND " +
+                                   "name = 'measurements'").fetchone()[0]
+            if "AUTOINCREMENT" not in sql.upper():
+                if not self.con.in_transaction:
+                    self.cur.execute("BEGIN")
+                columns = ", ".join(METADATA_COLUMNS + ("retention_stage",))
+                self.create_measurements_table("measurements_new")
+                # the explicit IDs also start the AUTOINCREMENT sequence after the highest one
+                self.cur.execute(f"INSERT INTO measurements_new ({columns}) SELECT {columns} " +
+                                 "FROM measurements")
+                self.cur.execute("DROP TABLE measurements")
+                self.cur.execute("ALTER TABLE measurements_new RENAME TO measurements")
+                self.create_indexes()
+        self.cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.con.commit()
+        if version < 7:
+            self.cur.execute("PRAGMA foreign_keys = ON")
+        # 2 = INCREMENTAL, VACUUM cannot run inside a transaction
+        if version < 5 and self.cur.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self.cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.cur.execute("VACUUM")
 
     def insert(self, chip_id, measurement_type, measurements_data, measurement_result,
                measurement_parameter1="", measurement_parameter2="", measurement_temperature=22.0):
         """
         Inserts a new measurement into the database.
 
+        If the data is a PlotData object, its waveforms are stored as typed arrays in the
+        'waveforms' table and only the remaining attributes (title, efficiency, ...) are pickled
+        into the 'measurement_payloads' table.
+
+        With write_behind enabled the measurement is queued and written by the background
+        writer. The waveforms must not be modified afterwards.
+
         Args:
             chip_id (str): The ID of the chip.
             measurement_type (str): The type of measurement.
@@ -102,69 +543,322 @@ class Database:
         Returns:
             None
         """
-        self.cur.execute("INSERT INTO measurements (chip_id, measurement_type, measurement_data," +
-                         " measurement_result, measurement_parameter1, measurement_parameter2, "+
-                         "measurement_temperature) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                         (chip_id, measurement_type, pickle.dumps(measurements_data),
-                          measurement_result, measurement_parameter1, measurement_parameter2,
-                          measurement_temperature))
-        self.con.commit()
+        if isinstance(measurements_data, PlotData):
+            pickled_data = pickle.dumps(WaveformStore.strip(measurements_data))
+            plot_data = measurements_data
+        else:
+            pickled_data = pickle.dumps(measurements_data)
+            plot_data = None
+        # same format as CURRENT_TIMESTAMP, taken now and not when the writer stores the row
+        time_stamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        record = (chip_id, measurement_type, measurement_result, measurement_parameter1,
+                  measurement_parameter2, measurement_temperature, time_stamp, pickled_data,
+                  plot_data)
+        if self.writer is not None:
+            self.writer.put(record)
+        else:
+            self.write_measurement(self.cur, self.waveforms, record)
+            self.con.commit()
+
+    @staticmethod
+    def parse_parameters(measurement_parameter1, measurement_parameter2):
+        """
+        Extracts the numeric values from the text parameters of a measurement.
+
+        Args:
+            measurement_parameter1 (str): The voltage, e.g. "4.3V" or "4.3V to 5V".
+            measurement_parameter2 (str): The load resistor, e.g. "R1".
+
+        Returns:
+            tuple: (input_voltage, step_voltage_low, step_voltage_high, load_resistor),
+                values that are not given are None.
+        """
+        input_voltage = step_voltage_low = step_voltage_high = load_resistor = None
+        voltages = re.findall(r"(-?\d+(?:\.\d+)?)\s*V", str(measurement_parameter1))
+        if voltages:
+            input_voltage = float(voltages[0])
+        if len(voltages) == 2:
+            step_voltage_low, step_voltage_high = float(voltages[0]), float(voltages[1])
+        resistor = re.fullmatch(r"\s*R(\d+)\s*", str(measurement_parameter2))
+        if resistor:
+            load_resistor = int(resistor.group(1))
+        return input_voltage, step_voltage_low, step_voltage_high, load_resistor
+
+    @staticmethod
+    def write_measurement(cur, waveforms, record):
+        """
+        Writes a measurement record without committing the transaction.
+
+        Args:
+            cur (sqlite3.Cursor): The cursor to execute the SQL statements with.
+            waveforms (WaveformStore): The waveform store of the same connection.
+            record (tuple): (chip_id, measurement_type, measurement_result,
+                measurement_parameter1, measurement_parameter2, measurement_temperature,
+                time_stamp, pickled_data, plot_data), plot_data is None for other data.
+
+        Returns:
+            int: The ID of the new measurement.
+        """
+        *metadata, pickled_data, plot_data = record
+        numeric = Database.parse_parameters(metadata[3], metadata[4])
+        cur.execute("INSERT INTO measurements (chip_id, measurement_type, " +
+                    "measurement_result, measurement_parameter1, measurement_parameter2, "+
+                    "measurement_temperature, time_stamp, input_voltage, step_voltage_low, " +
+                    "step_voltage_high, load_resistor) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*metadata, *numeric))
+        measurement_id = cur.lastrowid
+        cur.execute("INSERT INTO measurement_payloads (measurement_id, measurement_data) " +
+                    "VALUES (?, ?)", (measurement_id, pickled_data))
+        if plot_data is not None:
+            waveforms.insert(measurement_id, plot_data)
+            Database.insert_summary(cur, measurement_id, plot_data)
+        return measurement_id
+
+    @staticmethod
+    def summarize(plot_data: PlotData):
+        """
+        Computes the figures of merit of a PlotData measurement.
+
+        The steady-state values are taken from the attributes set by PXI_5142.get_data2
+        (in_voltage, out_voltage, in_current, out_current, efficiency). If an attribute is
+        missing, the mean of the last 100 samples of the corresponding channel is used
+        (y[0], y[1], y2[0], y2[1]).
+        - peak_voltage / min_voltage: Maximum / minimum of all voltage channels (y).
+        - overshoot: Peak of the output voltage (y[1]) above its steady state in percent.
+        - settling_time: Time on the time axis of the record after which the output voltage
+          stays within +-2% of its steady state, None if it never settles.
+        Measurements without waveforms (PXI_5142.get_measurements2) take peak_voltage,
+        min_voltage and overshoot from the onboard VOLTAGE_MAX, VOLTAGE_MIN and OVERSHOOT
+        measurements of the voltage scope, if they were measured.
+
+        Args:
+            plot_data (PlotData): The measurement.
+
+        Returns:
+            dict: The values of SUMMARY_COLUMNS, values that can not be computed are None.
+        """
+        def steady_state(name, channels, index):
+            if hasattr(plot_data, name):
+                return float(getattr(plot_data, name))
+            if len(channels) > index and len(channels[index]) > 0:
+                return float(np.mean(np.asarray(channels[index])[-100:]))
+            return None
+
+        summary = dict.fromkeys(SUMMARY_COLUMNS)
+        summary["title"] = plot_data.title
+        summary["in_voltage"] = steady_state("in_voltage", plot_data.y, 0)
+        summary["out_voltage"] = steady_state("out_voltage", plot_data.y, 1)
+        summary["in_current"] = steady_state("in_current", plot_data.y2, 0)
+        summary["out_current"] = steady_state("out_current", plot_data.y2, 1)
+        if hasattr(plot_data, "efficiency"):
+            summary["efficiency"] = float(plot_data.efficiency)
+        elif None not in (summary["in_voltage"], summary["out_voltage"], summary["in_current"],
+                          summary["out_current"]):
+            power_in = summary["in_voltage"] * summary["in_current"]
+            if power_in != 0:
+                summary["efficiency"] = summary["out_voltage"] * summary["out_current"] / power_in
+        voltages = [np.asarray(samples) for samples in plot_data.y if len(samples) > 0]
+        if voltages:
+            summary["peak_voltage"] = float(max(samples.max() for samples in voltages))
+            summary["min_voltage"] = float(min(samples.min() for samples in voltages))
+        onboard = getattr(plot_data, "scalar_measurements", {}).get("sc0")
+        if not voltages and onboard is not None:
+            names = onboard.dtype.names
+            if "VOLTAGE_MAX" in names:
+                summary["peak_voltage"] = float(onboard["VOLTAGE_MAX"].max())
+            if "VOLTAGE_MIN" in names:
+                summary["min_voltage"] = float(onboard["VOLTAGE_MIN"].min())
+            # the output voltage is channel 1, first record
+            output = onboard[(onboard["channel"] == "1") & (onboard["record"] == 0)]
+            if "OVERSHOOT" in names and len(output) == 1:
+                summary["overshoot"] = float(output["OVERSHOOT"][0])
+        out_voltage = summary["out_voltage"]
+        if len(plot_data.y) > 1 and len(plot_data.y[1]) > 0 and out_voltage:
+            output = np.asarray(plot_data.y[1])
+            time_t = np.asarray(plot_data.x[1])
+            summary["overshoot"] = float((output.max() - out_voltage) / abs(out_voltage) * 100)
+            outside = np.flatnonzero(np.abs(output - out_voltage) > 0.02 * abs(out_voltage))
+            if outside.size == 0:
+                summary["settling_time"] = float(time_t[0])
+            elif outside[-1] + 1 < len(time_t):
+                summary["settling_time"] = float(time_t[outside[-1] + 1])
+        return summary
+
+    @staticmethod
+    def insert_summary(cur, measurement_id, plot_data: PlotData):
+        """
+        Computes the figures of merit of a PlotData measurement and inserts them into the
+        'measurement_summary' table. The caller commits the transaction.
+
+        Args:
+            cur (sqlite3.Cursor): The cursor to execute the SQL statement with.
+            measurement_id (int): The ID of the measurement.
+            plot_data (PlotData): The measurement.
+        """
+        summary = Database.summarize(plot_data)
+        cur.execute("INSERT OR REPLACE INTO measurement_summary (measurement_id, " +
+                    f"{', '.join(SUMMARY_COLUMNS)}) VALUES (?{', ?' * len(SUMMARY_COLUMNS)})",
+                    (measurement_id, *summary.values()))
+
+    def select_summary(self, id_to_select):
+        """
+        Retrieves the figures of merit of a measurement.
+
+        Args:
+            id_to_select (int): The ID of the measurement.
+
+        Returns:
+            dict: The values of SUMMARY_COLUMNS, or None if no summary is stored.
+        """
+        with self.reader() as con:
+            row = con.execute(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM measurement_summary " +
+                              "WHERE measurement_id = ?", (id_to_select,)).fetchone()
+        return dict(zip(SUMMARY_COLUMNS, row)) if row is not None else None
 
     def read(self):
         """
         Retrieves all the measurements from the database.
 
         Returns:
-            A list of tuples representing the measurements.
+            A list of MeasurementRow objects, the measurement data is loaded on access.
         """
-        self.cur.execute("SELECT * FROM measurements")
-        return self.cur.fetchall()
+        return self.query()
 
-    def print_table(self):
+    def query(self, order_by="id", descending=False, limit=None, **filters):
+        """
+        Retrieves the metadata of the measurements matching the given filters.
+
+        Only the columns of the 'measurements' table are read. The measurement data of a row is
+        loaded when its measurement_data attribute is accessed.
+
+        Args:
+            order_by (str, optional): The column to sort by. Defaults to "id".
+            descending (bool, optional): Sort in descending order. Defaults to False.
+            limit (int, optional): The maximum number of rows. Defaults to None (all rows).
+            **filters: Column names of METADATA_COLUMNS and the values they must be equal to,
+                e.g. measurement_type="normal startup".
+
+        Returns:
+            A list of MeasurementRow objects.
+        """
+        for column in [order_by, *filters]:
+            if column not in METADATA_COLUMNS:
+                raise ValueError(f"Unknown column {column}")
+        sql = f"SELECT {', '.join(METADATA_COLUMNS)} FROM measurements"
+        if filters:
+            sql += " WHERE " + " AND ".join(f"{column} = ?" for column in filters)
+        sql += f" ORDER BY {order_by}" + (" DESC" if descending else "")
+        parameters = list(filters.values())
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        with self.reader() as con:
+            rows = con.execute(sql, parameters).fetchall()
+        return [MeasurementRow(self, row) for row in rows]
+
+    def print_table(self, chip_id=None, measurement_type=None, since=None, until=None,
+                    page_size=100):
         """
         Prints the contents of the 'measurements' table in a formatted manner.
 
-        This method executes a SELECT query to fetch all the rows from the 'measurements' table.
-        It then calculates the maximum length of each column and formats the table accordingly.
-        The column length for the third column is adjusted based on the length of the values.
+        The width of each column is computed by the database with a MAX(LENGTH(...)) aggregate
+        over the metadata columns, then the rows are fetched and printed in pages of page_size.
+        The whole table is never held in memory. The measurement_data column only shows
+        whether data is stored for the row, the data itself is not read.
 
         Args:
-            None
+            chip_id (str, optional): Only print the measurements of this chip.
+            measurement_type (str, optional): Only print the measurements of this type.
+            since (str, optional): Only print measurements at or after this time stamp
+                ('YYYY-MM-DD HH:MM:SS').
+            until (str, optional): Only print measurements before this time stamp
+                ('YYYY-MM-DD HH:MM:SS').
+            page_size (int, optional): The number of rows fetched at once. Defaults to 100.
 
         Returns:
             None
         """
-        self.cur.execute("SELECT * FROM measurements")
-        columns_name = [description[0] for description in self.cur.description]
-        data_fetched = self.cur.fetchall()
-        column_lengths = [len(column) for column in columns_name]
-        for row in data_fetched:
-            for i, value in enumerate(row):
-                if i == 6:
-                    if len(value) > 10:
-                        column_lengths[i] = max(column_lengths[i], len("Data true"))
-                    else:
-                        column_lengths[i] = max(column_lengths[i], len("Data false"))
-                else:
-                    column_lengths[i] = max(column_lengths[i], len(str(value)))
-        separator = "+--" + "+--".join(["-" * length for length in column_lengths]) + "+"
-        print(separator)
-        print("| " + " | ".join([column.ljust(column_lengths[i]) for i, column in
-                                 enumerate(columns_name)]) + ' |')
-        print(separator)
-        for row in data_fetched:
-            row_values = []
-            for i, value in enumerate(row):
-                formated_value = str(value).ljust(column_lengths[i])
-                if i == 6:
-                    if len(value) > 10:
-                        formated_value = "Data true".ljust(column_lengths[i])
-                    else:
-                        formated_value = "Data false".ljust(column_lengths[i])
-                row_values.append(formated_value)
-            formated_row = "| " + " | ".join(row_values) + " |"
-            print(formated_row)
-        print(separator)
+        columns_name = ["id", "chip_id", "measurement_type", "measurement_parameter1",
+                        "measurement_parameter2", "measurement_temperature", "measurement_data",
+                        "measurement_result", "time_stamp"]
+        conditions = []
+        parameters = []
+        for condition, value in (("chip_id = ?", chip_id),
+                                 ("measurement_type = ?", measurement_type),
+                                 ("time_stamp >= ?", since), ("time_stamp < ?", until)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+        # the values are printed as SQLite converts them to text, so the widths match
+        texts = {column: f"COALESCE(CAST({column} AS TEXT), 'None')" for column in columns_name}
+        texts["measurement_data"] = ("EXISTS(SELECT 1 FROM measurement_payloads WHERE " +
+                                     "measurement_id = id AND length(measurement_data) > 10)")
+        metadata_columns = [column for column in columns_name if column != "measurement_data"]
+        with self.reader() as con:
+            cur = con.cursor()
+            # widths and rows are read from the same snapshot
+            cur.execute("BEGIN")
+            cur.execute("SELECT " + ", ".join(f"MAX(LENGTH({texts[column]}))" for column in
+                                              metadata_columns) + " FROM measurements" + where,
+                        parameters)
+            lengths = dict(zip(metadata_columns, cur.fetchone()))
+            lengths["measurement_data"] = len("Data false")
+            column_lengths = [max(len(column), lengths[column] or 0) for column in columns_name]
+            separator = "+--" + "+--".join(["-" * length for length in column_lengths]) + "+"
+            print(separator)
+            print("| " + " | ".join([column.ljust(column_lengths[i]) for i, column in
+                                     enumerate(columns_name)]) + ' |')
+            print(separator)
+            cur.execute("SELECT " + ", ".join(texts[column] for column in columns_name) +
+                        " FROM measurements" + where + " ORDER BY id", parameters)
+            while True:
+                data_fetched = cur.fetchmany(page_size)
+                if not data_fetched:
+                    break
+                for row in data_fetched:
+                    row_values = []
+                    for i, value in enumerate(row):
+                        formated_value = str(value).ljust(column_lengths[i])
+                        if i == 6:
+                            if value:
+                                formated_value = "Data true".ljust(column_lengths[i])
+                            else:
+                                formated_value = "Data false".ljust(column_lengths[i])
+                        row_values.append(formated_value)
+                    formated_row = "| " + " | ".join(row_values) + " |"
+                    print(formated_row)
+            print(separator)
+
+    @staticmethod
+    def check_identifier(name):
+        """
+        Checks that a table or column name can be used in an SQL statement.
+
+        Names cannot be passed as SQL parameters, so they are restricted to plain identifiers.
+
+        Args:
+            name (str): The table or column name.
+
+        Raises:
+            ValueError: If the name is not a plain identifier.
+        """
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name):
+            raise ValueError(f"Invalid table or column name {name!r}")
+
+    def reclaim_space(self, pages=None):
+        """
+        Returns free pages of the database file to the file system (incremental vacuum).
+
+        Args:
+            pages (int, optional): The maximum number of pages to free. Defaults to None (all
+                free pages).
+        """
+        # execute() only steps the pragma once, which frees a single page
+        if pages is None:
+            self.cur.executescript("PRAGMA incremental_vacuum")
+        else:
+            self.cur.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
 
     def delete_entries(self, id_values, table_name="measurements", column_name="id"):
         """
@@ -177,21 +871,39 @@ class Database:
             column_name (str, optional): The name of the column to match the ID values.
                 Defaults to "id".
         """
-        for id_value in id_values:
-            self.cur.execute(f"DELETE FROM {table_name} WHERE {column_name}={id_value}")
+        self.check_identifier(table_name)
+        self.check_identifier(column_name)
+        self.cur.executemany(f"DELETE FROM {table_name} WHERE {column_name} = ?",
+                             [(id_value,) for id_value in id_values])
+        self.waveforms.delete_orphans()
         self.con.commit()
+        self.reclaim_space()
 
-    def delete_measurement_before(self, timestamp_cutoff, table_name="measurements"):
+    def delete_measurement_before(self, timestamp_cutoff, table_name="measurements",
+                                  batch_size=500):
         """
         Delete measurements from the specified table before the given timestamp cutoff.
 
+        The measurements are deleted in transactions of batch_size rows, so the writer lock is
+        never held for long, and the freed space is returned after each batch.
+
         Args:
             timestamp_cutoff (str): The timestamp cutoff in the format 'YYYY-MM-DD HH:MM:SS'.
             table_name (str, optional): The name of the table to delete measurements from.
                 Defaults to "measurements".
+            batch_size (int, optional): The number of rows per transaction. Defaults to 500.
         """
-        self.cur.execute(f"DELETE FROM {table_name} WHERE time_stamp < '{timestamp_cutoff}'")
-        self.con.commit()
+        self.check_identifier(table_name)
+        while True:
+            self.cur.execute(f"DELETE FROM {table_name} WHERE id IN (SELECT id FROM " +
+                             f"{table_name} WHERE time_stamp < ? LIMIT ?)",
+                             (timestamp_cutoff, batch_size))
+            deleted = self.cur.rowcount
+            self.waveforms.delete_orphans()
+            self.con.commit()
+            self.reclaim_space()
+            if deleted < batch_size:
+                break
 
     def delete_oldest_measurements(self, measurement, column_name="measurement_type",
                                    table_name="measurements"):
@@ -205,9 +917,14 @@ class Database:
             table_name (str, optional): The name of the table to delete from.
                 Defaults to "measurements".
         """
+        self.check_identifier(table_name)
+        self.check_identifier(column_name)
         self.cur.execute(f"DELETE FROM {table_name} WHERE id = (SELECT id FROM {table_name}" +
-                         f" WHERE {column_name} ='{measurement}' ORDER BY time_stamp LIMIT 1)")
+                         f" WHERE {column_name} = ? ORDER BY time_stamp LIMIT 1)",
+                         (measurement,))
+        self.waveforms.delete_orphans()
         self.con.commit()
+        self.reclaim_space()
 
     def select_by_id(self, id_to_select, table_name="measurements"):
         """
@@ -219,9 +936,10 @@ class Database:
                 Defaults to "measurements".
 
         Returns:
-            tuple: The row retrieved from the table.
+            tuple: The row retrieved from the table (without the measurement data).
         """
-        self.cur.execute(f"SELECT * FROM {table_name} WHERE id={id_to_select}")
+        self.check_identifier(table_name)
+        self.cur.execute(f"SELECT * FROM {table_name} WHERE id = ?", (id_to_select,))
         row = self.cur.fetchone()
         return row
 
@@ -240,9 +958,19 @@ class Database:
 
         Returns:
             The value of the specified field in the selected row, or None if
-            the row does not exist.
+            the row does not exist. The measurement_data is returned pickled as before, including
+            the waveforms that are stored in the 'waveforms' table, so
+            pickle.loads(select_field_by_id(id)) gives the complete object.
         """
-        self.cur.execute(f"SELECT {field_name} FROM {table_name} WHERE id  = ?", (id_to_select,))
+        if field_name == "measurement_data" and table_name == "measurements":
+            exists = self.cur.execute("SELECT 1 FROM measurement_payloads WHERE " +
+                                      "measurement_id = ?", (id_to_select,)).fetchone()
+            if exists is None:
+                return None
+            return pickle.dumps(self.read_measurement_data(self.con, id_to_select))
+        self.check_identifier(table_name)
+        self.check_identifier(field_name)
+        self.cur.execute(f"SELECT {field_name} FROM {table_name} WHERE id = ?", (id_to_select,))
         row = self.cur.fetchone()
         return row[0] if row is not None else None
     def plot_efficiency(self, n=9):
@@ -259,20 +987,18 @@ class Database:
         # self.cur.execute("SELECT * FROM measurements ORDER BY time_stamp DESC LIMIT ?", (n,))
         # rows = self.cur.fetchall()
         measurement_type = "normal startup"
-        self.cur.execute("SELECT * FROM measurements WHERE measurement_type = ? ORDER BY "+
-                         "time_stamp DESC LIMIT ?", (measurement_type, n))
+        self.cur.execute("SELECT m.chip_id, s.out_current, s.efficiency, s.title FROM " +
+                         "measurements m LEFT JOIN measurement_summary s ON " +
+                         "s.measurement_id = m.id WHERE m.measurement_type = ? ORDER BY " +
+                         "m.time_stamp DESC LIMIT ?", (measurement_type, n))
         rows = self.cur.fetchall()
 
-        # Unpack the pickled data and create a plot
-        for row in rows:
-            index, chip_id, measurement_type, measurement_parameter1, measurement_parameter2, \
-            measurement_temperature, measurement_data, measurement_result, _ = row
-            measurement_data = pickle.loads(measurement_data)
-            if hasattr(measurement_data, 'efficiency'):
-                plt.scatter(measurement_data.out_current, measurement_data.efficiency,
-                            label=measurement_data.title)
+        # Plot the precomputed figures of merit
+        for chip_id, out_current, efficiency, title in rows:
+            if efficiency is not None:
+                plt.scatter(out_current, efficiency, label=title)
             else:
-                print("Efficiency does not exist in measurement_data")
+                print("Efficiency does not exist in measurement_summary")
         plt.legend()
         plt.grid()
         plt.xlabel("Output Current (A)")
@@ -308,6 +1034,7 @@ class Database:
                 measurement_parameter2, measurement_temperature
             )
         """)
+        self.waveforms.delete_orphans()
         self.con.commit()
 
     def get_measurement_types(self, field: MeasurementField):
@@ -337,6 +1064,44 @@ class Database:
         """
         return pickle.loads(measurement_data)
 
+    def load_measurement_data(self, id_to_select):
+        """
+        Loads the measurement_data of a specific entry including its stored waveforms.
+
+        Entries written before the waveform store existed contain the complete pickled object
+        and are returned as they are.
+
+        Args:
+            id_to_select (int): The ID of the entry to load.
+
+        Returns:
+            The measurement data (normally a PlotData object), or None if the entry does not exist.
+        """
+        with self.reader() as con:
+            return self.read_measurement_data(con, id_to_select)
+
+    def read_measurement_data(self, con, id_to_select):
+        """
+        Loads the measurement_data of a specific entry through the given connection
+        (see load_measurement_data).
+
+        Args:
+            con (sqlite3.Connection): The connection to read with, e.g. the writer connection
+                while its transaction is not committed yet.
+            id_to_select (int): The ID of the entry to load.
+
+        Returns:
+            The measurement data (normally a PlotData object), or None if the entry does not exist.
+        """
+        row = con.execute("SELECT measurement_data FROM measurement_payloads WHERE " +
+                          "measurement_id = ?", (id_to_select,)).fetchone()
+        if row is None:
+            return None
+        measurement_data = self.get_plot_data_from_pickle(row[0])
+        if isinstance(measurement_data, PlotData) and len(measurement_data.y) == 0:
+            WaveformStore(con).load(id_to_select, measurement_data)
+        return measurement_data
+
     def plot_measurement_data(self, id_to_select, plot_type='png'):
         """
         Loads the measurement_data of a specific entry from the database and calls the
@@ -348,10 +1113,8 @@ class Database:
         Returns:
             None
         """
-        measurement_data = PlotData()
-        measurement_data = self.select_field_by_id(id_to_select)
+        measurement_data = self.load_measurement_data(id_to_select)
         if measurement_data is not None:
-            measurement_data = self.get_plot_data_from_pickle(measurement_data)
             measurement_data.plot_all_data(plot_type=plot_type)
 
     def get_newest_unique_measurement_ids(self):
@@ -370,36 +1133,26 @@ class Database:
         ids = [row[0] for row in self.cur.fetchall()]
         return ids
 
-    #The following method is not implemented yet
     def get_ids_groups_with_same_measurement_type(self):
-        """_summary_
-        """
-        ids_list = []
-        database.cur.execute("""SELECT measurement_type, measurement_parameter1,
-                             measurement_parameter2, COUNT(*) FROM measurements GROUP BY
-                             measurement_type, measurement_parameter1, measurement_parameter2
-                             HAVING COUNT(*) > 1""")
-        rows=database.cur.fetchall()
-        for row in rows:
-            database.cur.execute("""SELECT id FROM measurements WHERE measurement_type = ?
-                                 AND measurement_parameter1 = ? AND measurement_parameter2 = ?""",
-                                 (row[0], row[1], row[2]))
-            rows2=database.cur.fetchall()
-            simple_list = [item[0] for item in rows2]
-            ids_list.append(simple_list)
-        values=[]
-        for ids in ids_list:
-            for id in ids:
-                measurement_data = self.select_field_by_id(id)
-                if measurement_data is not None:
-                    measurement_data = self.get_plot_data_from_pickle(measurement_data)
-                    value=[max(measurement_data.y[0].max(),measurement_data.y[1].max()),
-                           min(measurement_data.y[0].min(),measurement_data.y[1].min())]
-
-            values.append(value)
-
+        """
+        Retrieves the groups of measurements with the same type and parameters together with
+        the extreme values of their voltages.
 
+        Only groups with more than one measurement are returned. The values are aggregated
+        from the 'measurement_summary' table, no waveform is loaded.
 
+        Returns:
+            A list of tuples (ids, peak_voltage, min_voltage), where ids is the list of IDs of
+            the group, peak_voltage the maximum and min_voltage the minimum over all voltage
+            channels of the group.
+        """
+        self.cur.execute("""SELECT GROUP_CONCAT(m.id), MAX(s.peak_voltage), MIN(s.min_voltage)
+                         FROM measurements m JOIN measurement_summary s
+                         ON s.measurement_id = m.id GROUP BY m.measurement_type,
+                         m.measurement_parameter1, m.measurement_parameter2
+                         HAVING COUNT(*) > 1""")
+        return [([int(index) for index in ids.split(",")], peak_voltage, min_voltage)
+                for ids, peak_voltage, min_voltage in self.cur.fetchall()]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+"""
+This module contains the DatabaseExport class to export the measurement database to Parquet.
+
+The metadata (with the figures of merit of 'measurement_summary') and the waveforms are written
+into separate datasets, partitioned by chip_id, measurement_type and temperature:
+
+    <target>/metadata/chip_id=<..>/measurement_type=<..>/temperature=<..>/part-<ids>.parquet
+    <target>/waveforms/chip_id=<..>/measurement_type=<..>/temperature=<..>/part-<ids>.parquet
+
+Both can be read with pyarrow.dataset (hive partitioning) without this repository. The export is
+incremental: the highest exported measurement ID is stored in <target>/watermark.json and only
+newer measurements are exported on the next run. The IDs are never reused after deletions
+(AUTOINCREMENT, see Database.migrate), so new measurements always lie above the watermark.
+"""
+
+import argparse
+import json
+import os
+from urllib.parse import quote
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from database import Database, METADATA_COLUMNS, SUMMARY_COLUMNS
+
+# Columns that are not stored as float64 (the remaining numeric values)
+_COLUMN_TYPES = {"id": pa.int64(), "chip_id": pa.string(), "measurement_type": pa.string(),
+                 "measurement_parameter1": pa.string(), "measurement_parameter2": pa.string(),
+                 "measurement_result": pa.string(), "time_stamp": pa.string(),
+                 "load_resistor": pa.int64(), "title": pa.string()}
+METADATA_SCHEMA = pa.schema([(column, _COLUMN_TYPES.get(column, pa.float64()))
+                             for column in METADATA_COLUMNS + SUMMARY_COLUMNS])
+WAVEFORM_SCHEMA = pa.schema([("measurement_id", pa.int64()), ("axis", pa.int64()),
+                             ("channel", pa.int64()), ("label", pa.string()),
+                             ("sample_rate", pa.float64()), ("t0", pa.float64()),
+                             ("time", pa.list_(pa.float64())),
+                             ("samples", pa.large_list(pa.float64()))])
+
+
+class DatabaseExport:
+    """
+    Exports the measurements of a database to partitioned Parquet files.
+
+    Attributes:
+        database (Database): The database to export.
+        target_directory (str): The directory the datasets are written to.
+    """
+
+    def __init__(self, database: Database, target_directory):
+        """
+        Initializes a DatabaseExport object.
+
+        Args:
+            database (Database): The database to export.
+            target_directory (str): The directory the datasets are written to.
+        """
+        self.database = database
+        self.target_directory = target_directory
+
+    def read_watermark(self):
+        """
+        Reads the ID of the newest measurement that was already exported.
+
+        Returns:
+            int: The ID, 0 if nothing was exported yet.
+        """
+        path = os.path.join(self.target_directory, "watermark.json")
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)["last_id"]
+
+    def write_watermark(self, last_id):
+        """
+        Stores the ID of the newest exported measurement.
+
+        The file is replaced atomically, so an interrupted export restarts after the last
+        complete batch.
+
+        Args:
+            last_id (int): The ID of the newest exported measurement.
+        """
+        path = os.path.join(self.target_directory, "watermark.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"last_id": last_id}, file)
+        os.replace(path + ".tmp", path)
+
+    def export(self, batch_size=100):
+        """
+        Exports all measurements newer than the watermark.
+
+        The measurements are read in batches of batch_size, so at most one batch of waveforms
+        is held in memory. The watermark is updated after every batch.
+
+        Args:
+            batch_size (int, optional): The number of measurements per batch. Defaults to 100.
+
+        Returns:
+            int: The number of exported measurements.
+        """
+        os.makedirs(self.target_directory, exist_ok=True)
+        cur = self.database.con.cursor()
+        last_id = self.read_watermark()
+        exported = 0
+        while True:
+            columns = [f"m.{column}" for column in METADATA_COLUMNS]
+            columns += [f"s.{column}" for column in SUMMARY_COLUMNS]
+            cur.execute(f"SELECT {', '.join(columns)} FROM measurements m LEFT JOIN " +
+                        "measurement_summary s ON s.measurement_id = m.id WHERE m.id > ? " +
+                        "ORDER BY m.id LIMIT ?", (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            names = list(METADATA_COLUMNS) + list(SUMMARY_COLUMNS)
+            metadata = [dict(zip(names, row)) for row in rows]
+            partitions = {}
+            for row in metadata:
+                key = (row["chip_id"], row["measurement_type"], row["measurement_temperature"])
+                partitions.setdefault(key, []).append(row)
+            for key, partition_rows in partitions.items():
+                self.write_partition(cur, key, partition_rows)
+            last_id = metadata[-1]["id"]
+            self.write_watermark(last_id)
+            exported += len(metadata)
+        return exported
+
+    def write_partition(self, cur, key, rows):
+        """
+        Writes the metadata and the waveforms of one partition of a batch.
+
+        Args:
+            cur (sqlite3.Cursor): The cursor to read the waveforms with.
+            key (tuple): (chip_id, measurement_type, measurement_temperature).
+            rows (list): The metadata of the measurements as dictionaries.
+        """
+        partition = os.path.join(*[f"{name}={quote(str(value), safe='')}" for name, value in
+                                   zip(("chip_id", "measurement_type", "temperature"), key)])
+        file_name = f"part-{rows[0]['id']:08d}-{rows[-1]['id']:08d}.parquet"
+
+        metadata = pa.Table.from_pylist(rows, schema=METADATA_SCHEMA)
+        metadata_directory = os.path.join(self.target_directory, "metadata", partition)
+        os.makedirs(metadata_directory, exist_ok=True)
+        pq.write_table(metadata, os.path.join(metadata_directory, file_name))
+
+        waveforms = self.database.waveforms.select(cur, [row["id"] for row in rows])
+        if not waveforms:
+            return
+        # raw samples (ScaledWaveform) are exported in volts
+        samples = [np.asarray(row[7], dtype=np.float64) for row in waveforms]
+        offsets = np.concatenate(([0], np.cumsum([len(array) for array in samples])))
+        table = pa.table({
+            "measurement_id": [row[0] for row in waveforms],
+            "axis": [row[1] for row in waveforms],
+            "channel": [row[2] for row in waveforms],
+            "label": [row[3] for row in waveforms],
+            "sample_rate": [row[4] for row in waveforms],
+            "t0": [row[5] for row in waveforms],
+            # only set for time vectors that are not evenly spaced
+            "time": [None if row[6] is None else row[6].tolist() for row in waveforms],
+            "samples": pa.LargeListArray.from_arrays(pa.array(offsets, pa.int64()),
+                                                     pa.array(np.concatenate(samples))),
+        }, schema=WAVEFORM_SCHEMA)
+        waveform_directory = os.path.join(self.target_directory, "waveforms", partition)
+        os.makedirs(waveform_directory, exist_ok=True)
+        pq.write_table(table, os.path.join(waveform_directory, file_name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the measurement database to Parquet")
+    parser.add_argument("data_base", nargs="?", default="measurements",
+                        help="name of the database (without .db)")
+    parser.add_argument("target_directory", nargs="?", default="export",
+                        help="directory of the Parquet datasets")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="number of measurements per batch")
+    arguments = parser.parse_args()
+    with Database(arguments.data_base) as data_base:
+        count = DatabaseExport(data_base, arguments.target_directory).export(
+            arguments.batch_size)
+    print(f"Exported {count} measurements")
@@ -47,15 +47,72 @@ class DcDcConverterLoadTest:
             power_sup.en_output(True)
         # enable the chip
         time.sleep(0.3)
+        DcDcConverterLoadTest.load_step(gpio, resistor)
+        if NORMAL_MODE:
+            smu0.set_all_smu_outputs_to_zero_and_disable()
+        else:
+            power_sup.en_output(False)
+        time.sleep(0.2)
+    @staticmethod
+    def load_step(gpio: GPIOController, resistor="R1"):
+        """
+        Switches the load resistor on for 5ms and waits until the converter has settled.
+
+        Args:
+            gpio (GPIOController): The GPIO controller object.
+            resistor (str, optional): The resistor to be used. Defaults to "R1".
+        """
         gpio.set_output(reset=False, **{resistor: True})
         time.sleep(0.005)
         gpio.set_output(reset=False, **{resistor: False})
         time.sleep(0.1)
+
+    @staticmethod
+    def run_repeated(gpio: GPIOController, smu0: PXIe4141, sc0: PXI_5142, sc1: PXI_5142,
+                     power_sup: E3631A, voltage: float, resistor: str, repetitions=10):
+        """
+        Runs the load step repetitions times and captures all of them in one multi-record
+        acquisition (see PXI_5142.get_records2).
+
+        The chip is powered once, the scopes are armed once for all load steps and all records
+        are fetched together, instead of one run() per load step.
+
+        Args:
+            gpio (GPIOController): The GPIO controller object.
+            smu0 (PXIe4141): The SMU object.
+            sc0 (PXI_5142): The first Oscilloscope object.
+            sc1 (PXI_5142): The second Oscilloscope object.
+            power_sup (E3631A): The power supply object.
+            voltage (float): The input voltage.
+            resistor (str): The resistor value.
+            repetitions (int, optional): The number of load steps. Defaults to 10.
+
+        Returns:
+            list: One PlotData object per load step.
+        """
         if NORMAL_MODE:
-            smu0.set_all_smu_outputs_to_zero_and_disable()
+            with power_sup.transaction():
+                power_sup.set_6V(5, 0.4)
+                power_sup.en_output(True)
+            smu0.set_all_smu_outputs_to_voltage(voltage)
         else:
-            power_sup.en_output(False)
-        time.sleep(0.2)
+            power_sup.set_P25V(voltage, 0.4)
+            power_sup.en_output(True)
+        # enable the chip
+        time.sleep(0.3)
+        records = PXI_5142.get_records2(sc0, sc1, repetitions,
+                                        lambda: DcDcConverterLoadTest.load_step(gpio, resistor),
+                                        trigger_source_channel_nr=1, trigger_level=0.01,
+                                        delta_t=25e-3, triger_position=10.0, voffset=0,
+                                        vrange=6.0, trigger_scope=0)
+        if NORMAL_MODE:
+            smu0.set_all_smu_outputs_to_zero_and_disable()
+        power_sup.en_output(False)
+        for record, plot_data in enumerate(records):
+            plot_data.title = f"DCDC step test with load step with resistor {resistor}" +\
+                f" at voltage {voltage}V ({record + 1}/{repetitions})"
+        return records
+
     @staticmethod
     def run(gpio: GPIOController, smu0: PXIe4141, sc0: PXI_5142, sc1: PXI_5142, power_sup: E3631A,
             voltage: float, resistor : str):
@@ -81,8 +138,9 @@ class DcDcConverterLoadTest:
               with output current""")
         print("Connect Power supply to the PCB (6V output)")
         if NORMAL_MODE:
-            power_sup.set_6V(5,0.4)
-            power_sup.en_output(True)
+            with power_sup.transaction():
+                power_sup.set_6V(5, 0.4)
+                power_sup.en_output(True)
         with concurrent.futures.ThreadPoolExecutor() as executor:
             smu_return = executor.submit(DcDcConverterLoadTest.step_test, gpio, smu0, power_sup,
                                          voltage, resistor)
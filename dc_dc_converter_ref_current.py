@@ -32,17 +32,19 @@ class DcDcConverterRefCurrent:
         print("init")
     
     @staticmethod
-    def get_ref_current(power_sup: E3631A, smu0: PXIe4141, spi: FtdiSpi, voltage=5):
-        # Power chip
-        power_sup.set_P25V(voltage, 0.4)
-        time.sleep(0.1)
-        power_sup.en_output(True)
+    def get_ref_current(power_sup: E3631A, smu0: PXIe4141, spi: FtdiSpi, voltage=5, profile="precise"):
+        # Power chip, the voltage and the output enable are written with one GPIB message
+        with power_sup.transaction():
+            power_sup.set_P25V(voltage, 0.4)
+            power_sup.en_output(True)
         time.sleep(0.3)
         spi.output_cur_ref()
         smu0.configure_channel_idc(0, 0.000002, 0.000, -6, 6)
+        # a static value, a long aperture averages the noise
+        smu0.apply_profile(0, profile)
         smu0.enable(0, True)
         time.sleep(0.1)
-        voltage_measured = smu0.measure(0)[0]
+        voltage_measured = smu0.measure_vi(0)[0]
         smu0.enable(0, False)
         power_sup.en_output(False)
         return voltage_measured
@@ -86,8 +86,9 @@ class DcDcConverterResetPowerOnTest:
               with output current""")
         print("Connect Power supply to the PCB (6V output)")
         if NORMAL_MODE:
-            power_sup.set_6V(5, 0.4)
-            power_sup.en_output(True)
+            with power_sup.transaction():
+                power_sup.set_6V(5, 0.4)
+                power_sup.en_output(True)
         with concurrent.futures.ThreadPoolExecutor() as executor:
             smu_return = executor.submit(DcDcConverterResetPowerOnTest.reset_test, gpio, smu0,
                                          power_sup, voltage, resistor)
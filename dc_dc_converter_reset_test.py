@@ -81,8 +81,9 @@ class DcDcConverterResetTest:
               osc1 with output current""")
         print("Connect Power supply to the PCB (6V output)")
         if NORMAL_MODE:
-            power_sup.set_6V(5,0.4)
-            power_sup.en_output(True)
+            with power_sup.transaction():
+                power_sup.set_6V(5, 0.4)
+                power_sup.en_output(True)
         with concurrent.futures.ThreadPoolExecutor() as executor:
             scope_return = executor.submit(PXI_5142.get_data2, sc0, sc1,
                                            trigger_source_channel_nr=1, trigger_level=2,
@@ -74,8 +74,9 @@ class DcDcConverterStartupTest:
               output current""")
         print("Connect Power supply to the PCB (6V output)")
         if NORMAL_MODE:
-            power_sup.set_6V(5,0.4)
-            power_sup.en_output(True)
+            with power_sup.transaction():
+                power_sup.set_6V(5, 0.4)
+                power_sup.en_output(True)
         # wait so that power supply is for sure on
         time.sleep(0.1)
         with concurrent.futures.ThreadPoolExecutor() as executor:
@@ -45,10 +45,10 @@ class DcDcConverterStepTest:
         if NORMAL_MODE:
             smu0.set_all_smu_outputs_to_voltage(step[0])
             time.sleep(0.3)
-            smu0.set_all_voltages(step[1], True)
-            time.sleep(0.01)
-            smu0.set_all_voltages(step[0], True)
-            time.sleep(0.1)
+            # the step is timed by the SMU on the ganged channels: 10ms at step[1], then step[0],
+            # each step lasts its source delay plus the (short) aperture time
+            smu0.sweep_vdc("0,1,2", [step[1], step[0]], source_delays=[0.01, 0.1],
+                           aperture_time=50e-6)
             gpio.set_output(**{resistor: False})
             smu0.set_all_smu_outputs_to_zero_and_disable()
         else:
@@ -90,8 +90,9 @@ class DcDcConverterStepTest:
               with output current""")
         print("Connect Power supply to the PCB (6V output)")
         if NORMAL_MODE:
-            power_sup.set_6V(5,0.4)
-            power_sup.en_output(True)
+            with power_sup.transaction():
+                power_sup.set_6V(5, 0.4)
+                power_sup.en_output(True)
         with concurrent.futures.ThreadPoolExecutor() as executor:
             smu_return = executor.submit(DcDcConverterStepTest.step_test, gpio, smu0, power_sup,
                                          step, resistor)
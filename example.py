@@ -76,9 +76,9 @@ if 1:
     if abs(1-smu0.measure(0)[0])>0.01:
         print("SMU does not work")
     smu0.set_voltage(0, 2.0, True)
-    smu0.measure(0)
+    smu0.measure(0, query_compliance=True)
     smu0.set_voltage(0, 3.0, True)
-    smu0.measure(0)
+    smu0.measure(0, query_compliance=True)
     smu0.enable(0, False)
 
     smu0.set_aperture(0, 0.001, 2)
@@ -88,12 +88,12 @@ if 1:
     smu0.enable(0, True)
     smu0.enable(1, True)
 
-    smu0.measure(0)
-    smu0.measure(1)
+    smu0.measure(0, query_compliance=True)
+    smu0.measure(1, query_compliance=True)
     smu0.set_voltage(0, 2.0, True)
     smu0.set_current(1, 0.002, True)
-    smu0.measure(0)
-    smu0.measure(1)
+    smu0.measure(0, query_compliance=True)
+    smu0.measure(1, query_compliance=True)
     smu0.enable(0, False)
     smu0.enable(1, False)
 
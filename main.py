@@ -69,8 +69,8 @@ def main():
     spi=FtdiSpi()
     spi.configure()
 
-    # Create database
-    database = Database("measurements")
+    # Create database (measurements are written in a background thread)
+    database = Database("measurements", write_behind=True)
     chip_id= "g_2"
     temperature=[0, 25, 70]
     resistors=['R1', 'R2', 'R3']
@@ -136,11 +136,13 @@ def main():
                     database.insert(f"{chip_id}", "reset while powered", dcdc, "Passed",
                                     f"{voltage}V", resistor,
                                     measurement_temperature=measurement_temperature)
+        # make sure all measurements of this temperature are stored
+        database.flush()
     # Bandgap test
     if False:
         voltage=[]
         input("Connect SMU0 to the output of Analog testpin and press enter\n")
-        smu0.set_aperture(0, 0.001, 2)
+        smu0.apply_profile(0, "precise")
         smu0.configure_channel_idc(0, 0.002, 0.001, -2, 2)
         smu0.enable(0, True)
         for measurement_temperature in range(0,71):
@@ -148,8 +150,9 @@ def main():
             tp04300_obj.flow(True)
             tp04300_obj.setPointAndWait(measurement_temperature, ploton)
             
-            print(f"voltage was: {smu0.measure(0)[0]}V")
-            voltage.append(smu0.measure(0)[0])
+            voltage_measured = smu0.measure_vi(0)[0]
+            print(f"voltage was: {voltage_measured}V")
+            voltage.append(voltage_measured)
         smu0.enable(0, False)
         database.insert(f"{chip_id}", "bandgap", voltage, "Passed",
                                     " ", " ",
@@ -160,7 +163,9 @@ def main():
     tp04300_obj.headDown(False)
     tp04300_obj.close_com()
     # database.delete_measurement_before("2024-03-22 15:27:21")
+    database.flush()
     database.print_table()
+    database.close()
 
 if __name__ == "__main__":
     main()
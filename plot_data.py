@@ -1,10 +1,223 @@
 """
-This module contains the PlotData class for plotting data using Matplotlib.
+This module contains the PlotData class for plotting data using Matplotlib, the
+ScaledWaveform class for raw digitizer samples and the TimeBase class for evenly spaced
+time vectors.
 """
+import functools
 import os
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
 import matplotlib.pyplot as plt
 
 
+class LazyArray(NDArrayOperatorsMixin):
+    """
+    Base class of the vectors that create their numpy array only when it is used.
+
+    Subclasses implement __array__. Arithmetic, comparisons and numpy ufuncs work on that array
+    (e.g. waveform * 1e3, waveform - waveform[0], np.sqrt(waveform)) and return plain numpy
+    arrays, other attributes like max() or tolist() are taken from it as well.
+    """
+
+    __slots__ = ()
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if any(isinstance(value, LazyArray) for value in kwargs.get("out", ())):
+            # the vectors are read-only
+            return NotImplemented
+        inputs = [np.asarray(value) if isinstance(value, LazyArray) else value
+                  for value in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getattr__(self, name):
+        # only called for attributes that are not defined, private ones are never delegated
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(np.asarray(self), name)
+
+
+class ScaledWaveform(LazyArray):
+    """
+    Raw binary samples of a digitizer that are scaled to volts only when they are used.
+
+    volts = raw * gain + offset
+
+    A ScaledWaveform can be used like a numpy array of volts (e.g. np.asarray(waveform),
+    waveform[-100:], waveform * 1e3, waveform > 1.0, see LazyArray), but only the raw samples
+    are kept in memory and stored.
+
+    Attributes:
+        raw (numpy.ndarray): The raw samples (e.g. int16).
+        gain (float): The gain factor of the channel.
+        offset (float): The offset of the channel in volts.
+    """
+
+    def __init__(self, raw, gain, offset):
+        """
+        Initializes a ScaledWaveform object.
+
+        Args:
+            raw (numpy.ndarray): The raw samples.
+            gain (float): The gain factor of the channel.
+            offset (float): The offset of the channel in volts.
+        """
+        self.raw = raw
+        self.gain = float(gain)
+        self.offset = float(offset)
+
+    @property
+    def volts(self) -> np.ndarray:
+        """
+        numpy.ndarray: The samples scaled to volts (float64), computed on every access.
+        """
+        return self.raw * self.gain + self.offset
+
+    @property
+    def shape(self):
+        """
+        tuple: The shape of the samples.
+        """
+        return self.raw.shape
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, index):
+        # only the selected samples are scaled
+        return self.raw[index] * self.gain + self.offset
+
+    def __array__(self, dtype=None, copy=None):
+        volts = self.volts
+        return volts if dtype is None else volts.astype(dtype, copy=False)
+
+    def __repr__(self):
+        return (f"ScaledWaveform({len(self.raw)} samples of {self.raw.dtype}, "
+                f"gain={self.gain}, offset={self.offset})")
+
+
+class TimeBase(LazyArray):
+    """
+    An immutable, evenly spaced time vector t[i] = t0 + i / sample_rate with n samples.
+
+    Only the three parameters are stored, the time array is created on first use and then
+    shared. TimeBase.get returns the same instance for the same parameters, also when a
+    PlotData object is unpickled, so all channels and runs with the same horizontal settings
+    share one time vector. A TimeBase can be used like a read-only numpy array (e.g. t * 1e3,
+    t - t[0], see LazyArray).
+
+    Attributes:
+        sample_rate (float): The sample rate in samples per second.
+        t0 (float): The time of the first sample in seconds.
+        n (int): The number of samples.
+    """
+
+    __slots__ = ("sample_rate", "t0", "n", "_array")
+
+    def __init__(self, sample_rate, t0, n):
+        """
+        Initializes a TimeBase object. Use TimeBase.get to share instances.
+
+        Args:
+            sample_rate (float): The sample rate in samples per second.
+            t0 (float): The time of the first sample in seconds.
+            n (int): The number of samples.
+        """
+        object.__setattr__(self, "sample_rate", float(sample_rate))
+        object.__setattr__(self, "t0", float(t0))
+        object.__setattr__(self, "n", int(n))
+        object.__setattr__(self, "_array", None)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def get(sample_rate, t0, n) -> "TimeBase":
+        """
+        Returns the shared TimeBase for the given parameters.
+
+        Args:
+            sample_rate (float): The sample rate in samples per second.
+            t0 (float): The time of the first sample in seconds.
+            n (int): The number of samples.
+
+        Returns:
+            TimeBase: The cached instance.
+        """
+        return TimeBase(sample_rate, t0, n)
+
+    @staticmethod
+    def from_range(t_min, t_max, n) -> "TimeBase":
+        """
+        Returns the shared TimeBase of np.linspace(t_min, t_max, num=n).
+
+        A single sample (or none) has no sample rate, its TimeBase only holds t_min.
+
+        Args:
+            t_min (float): The time of the first sample in seconds.
+            t_max (float): The time of the last sample in seconds.
+            n (int): The number of samples.
+
+        Returns:
+            TimeBase: The cached instance.
+
+        Raises:
+            ValueError: If there are several samples and t_max is not larger than t_min.
+        """
+        if n <= 1:
+            return TimeBase.get(1.0, t_min, max(n, 0))
+        if t_max <= t_min:
+            raise ValueError(f"{n} samples need t_max > t_min, got {t_min} to {t_max}")
+        return TimeBase.get((n - 1) / (t_max - t_min), t_min, n)
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        numpy.ndarray: The read-only time vector, created on first access.
+        """
+        if self._array is None:
+            array = np.linspace(self.t0, self.t0 + (self.n - 1) / self.sample_rate, num=self.n)
+            array.flags.writeable = False
+            object.__setattr__(self, "_array", array)
+        return self._array
+
+    @property
+    def shape(self):
+        """
+        tuple: The shape of the time vector.
+        """
+        return (self.n,)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TimeBase is immutable")
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.array if dtype is None else self.array.astype(dtype, copy=False)
+        return array.copy() if copy else array
+
+    def __eq__(self, other):
+        # two time bases are compared by their parameters, anything else element-wise
+        if not isinstance(other, TimeBase):
+            return np.equal(self, other)
+        return (self.sample_rate, self.t0, self.n) == (other.sample_rate, other.t0, other.n)
+
+    def __ne__(self, other):
+        if not isinstance(other, TimeBase):
+            return np.not_equal(self, other)
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.sample_rate, self.t0, self.n))
+
+    def __reduce__(self):
+        # only the parameters are pickled, unpickling returns the shared instance
+        return (TimeBase.get, (self.sample_rate, self.t0, self.n))
+
+    def __repr__(self):
+        return f"TimeBase(sample_rate={self.sample_rate}, t0={self.t0}, n={self.n})"
 
 
 class PlotData:
@@ -0,0 +1,275 @@
+"""
+This module contains the retention policies that keep the measurement database small.
+
+A RetentionPolicy describes how long the measurements of a measurement_type are kept:
+
+    full waveforms --full_days--> decimated or summary only --archive_days--> archive database
+
+The Retention class applies the policies in bounded batches. Each batch is one short
+transaction, the freed pages are returned to the file system with an incremental vacuum after
+every batch, so it can run between measurements without blocking the acquisition for long.
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from database import Database, METADATA_COLUMNS, SUMMARY_COLUMNS
+
+# retention_stage values of the 'measurements' table
+STAGE_FULL = 0
+STAGE_REDUCED = 1
+REDUCTIONS = ("decimate", "summary")
+_WAVEFORM_COLUMNS = ("axis", "channel", "label", "sample_rate", "t0", "time_hash", "blob_hash",
+                     "gain", "offset")
+
+
+class RetentionPolicy:
+    """
+    Describes how long the measurements of a measurement_type are kept.
+
+    Attributes:
+        measurement_type (str): The measurement_type the policy applies to, None for all types.
+        full_days (float): The days the full waveforms are kept.
+        reduction (str): 'decimate' keeps every decimation-th sample of the waveforms,
+            'summary' deletes the waveforms and keeps the metadata and figures of merit.
+        decimation (int): The decimation factor.
+        archive_days (float): The days after which the measurements are moved to the archive
+            database, None to keep them.
+    """
+
+    def __init__(self, measurement_type, full_days, reduction="decimate", decimation=10,
+                 archive_days=None):
+        """
+        Initializes a RetentionPolicy object.
+
+        Args:
+            measurement_type (str): The measurement_type the policy applies to, None for all
+                types.
+            full_days (float): The days the full waveforms are kept.
+            reduction (str, optional): 'decimate' or 'summary'. Defaults to "decimate".
+            decimation (int, optional): The decimation factor. Defaults to 10.
+            archive_days (float, optional): The days after which the measurements are moved
+                to the archive database. Defaults to None (never).
+        """
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction {reduction}, use one of {REDUCTIONS}")
+        if decimation < 2:
+            raise ValueError("The decimation factor must be at least 2")
+        if archive_days is not None and archive_days < full_days:
+            raise ValueError("archive_days must not be smaller than full_days")
+        self.measurement_type = measurement_type
+        self.full_days = full_days
+        self.reduction = reduction
+        self.decimation = decimation
+        self.archive_days = archive_days
+
+
+class Retention:
+    """
+    Applies retention policies to a database.
+
+    Attributes:
+        database (Database): The working database.
+        policies (list): The RetentionPolicy objects.
+        archive (str): The name of the archive database (without .db), None if no policy
+            archives.
+    """
+
+    def __init__(self, database: Database, policies, archive=None):
+        """
+        Initializes a Retention object.
+
+        Args:
+            database (Database): The working database.
+            policies (list): The RetentionPolicy objects.
+            archive (str, optional): The name of the archive database (without .db).
+                Required if a policy sets archive_days. Defaults to None.
+        """
+        if archive is None and any(policy.archive_days is not None for policy in policies):
+            raise ValueError("An archive database is required to archive measurements")
+        self.database = database
+        self.policies = policies
+        self.archive = archive
+
+    @staticmethod
+    def cutoff(days):
+        """
+        Returns the time stamp before which measurements are older than the given days.
+
+        Args:
+            days (float): The age in days.
+
+        Returns:
+            str: The UTC time stamp in the format 'YYYY-MM-DD HH:MM:SS' of the 'measurements'
+                table.
+        """
+        return (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    def select_ids(self, policy: RetentionPolicy, days, stage, batch_size):
+        """
+        Selects the oldest measurements of a policy that are due.
+
+        Args:
+            policy (RetentionPolicy): The policy.
+            days (float): The age in days.
+            stage (int): Only measurements at this retention_stage, None for all stages.
+            batch_size (int): The maximum number of measurements.
+
+        Returns:
+            list: The IDs of the measurements.
+        """
+        sql = "SELECT id FROM measurements WHERE time_stamp < ?"
+        parameters = [self.cutoff(days)]
+        if policy.measurement_type is not None:
+            sql += " AND measurement_type = ?"
+            parameters.append(policy.measurement_type)
+        if stage is not None:
+            sql += " AND retention_stage = ?"
+            parameters.append(stage)
+        parameters.append(batch_size)
+        self.database.cur.execute(sql + " ORDER BY id LIMIT ?", parameters)
+        return [row[0] for row in self.database.cur.fetchall()]
+
+    def reduce_batch(self, policy: RetentionPolicy, batch_size):
+        """
+        Decimates the waveforms or deletes them (see RetentionPolicy.reduction) for one batch
+        of measurements that are older than full_days.
+
+        Args:
+            policy (RetentionPolicy): The policy.
+            batch_size (int): The maximum number of measurements.
+
+        Returns:
+            int: The number of reduced measurements.
+        """
+        ids = self.select_ids(policy, policy.full_days, STAGE_FULL, batch_size)
+        if not ids:
+            return 0
+        database = self.database
+        with database.con:
+            for measurement_id in ids:
+                if policy.reduction == "decimate":
+                    database.waveforms.decimate(measurement_id, policy.decimation)
+                else:
+                    database.cur.execute("DELETE FROM waveforms WHERE measurement_id = ?",
+                                         (measurement_id,))
+            database.cur.executemany("UPDATE measurements SET retention_stage = ? WHERE id = ?",
+                                     [(STAGE_REDUCED, measurement_id) for measurement_id in ids])
+            database.waveforms.delete_orphans()
+        database.reclaim_space()
+        return len(ids)
+
+    def archive_batch(self, policy: RetentionPolicy, batch_size):
+        """
+        Moves one batch of measurements that are older than archive_days to the archive
+        database, with their payloads, figures of merit and waveforms.
+
+        The measurements get new IDs in the archive, so the IDs of the working database never
+        collide with archived ones.
+
+        Args:
+            policy (RetentionPolicy): The policy.
+            batch_size (int): The maximum number of measurements.
+
+        Returns:
+            int: The number of archived measurements.
+        """
+        ids = self.select_ids(policy, policy.archive_days, None, batch_size)
+        if not ids:
+            return 0
+        database = self.database
+        columns = [column for column in METADATA_COLUMNS if column != "id"] + ["retention_stage"]
+        waveform_columns = ", ".join(_WAVEFORM_COLUMNS)
+        cur = database.cur
+        with database.con:
+            for measurement_id in ids:
+                cur.execute(f"INSERT INTO archive.measurements ({', '.join(columns)}) SELECT " +
+                            f"{', '.join(columns)} FROM main.measurements WHERE id = ?",
+                            (measurement_id,))
+                archive_id = cur.lastrowid
+                cur.execute("INSERT INTO archive.measurement_payloads (measurement_id, " +
+                            "measurement_data) SELECT ?, measurement_data FROM " +
+                            "main.measurement_payloads WHERE measurement_id = ?",
+                            (archive_id, measurement_id))
+                cur.execute(f"INSERT INTO archive.measurement_summary (measurement_id, " +
+                            f"{', '.join(SUMMARY_COLUMNS)}) SELECT ?, " +
+                            f"{', '.join(SUMMARY_COLUMNS)} FROM main.measurement_summary " +
+                            "WHERE measurement_id = ?", (archive_id, measurement_id))
+                cur.execute("INSERT OR IGNORE INTO archive.waveform_blobs (hash, codec, data) " +
+                            "SELECT hash, codec, data FROM main.waveform_blobs WHERE hash IN " +
+                            "(SELECT blob_hash FROM main.waveforms WHERE measurement_id = ? " +
+                            "UNION SELECT time_hash FROM main.waveforms WHERE " +
+                            "measurement_id = ?)", (measurement_id, measurement_id))
+                cur.execute(f"INSERT INTO archive.waveforms (measurement_id, {waveform_columns})" +
+                            f" SELECT ?, {waveform_columns} FROM main.waveforms WHERE " +
+                            "measurement_id = ?", (archive_id, measurement_id))
+            # the payloads, summaries and waveforms are deleted by ON DELETE CASCADE
+            cur.executemany("DELETE FROM main.measurements WHERE id = ?",
+                            [(measurement_id,) for measurement_id in ids])
+            database.waveforms.delete_orphans()
+        database.reclaim_space()
+        return len(ids)
+
+    def run(self, batch_size=50, max_batches=None):
+        """
+        Applies all policies until nothing is due or max_batches batches have run.
+
+        Measurements that are due for the archive are archived before they are reduced.
+
+        Args:
+            batch_size (int, optional): The number of measurements per batch. Defaults to 50.
+            max_batches (int, optional): The maximum number of batches, e.g. to limit the time
+                spent between two measurements. Defaults to None (no limit).
+
+        Returns:
+            dict: The number of 'reduced' and 'archived' measurements.
+        """
+        counts = {"reduced": 0, "archived": 0}
+        batches = 0
+        if self.archive is not None:
+            # creates or migrates the schema of the archive
+            Database(self.archive).close()
+            self.database.flush()
+            self.database.cur.execute("ATTACH DATABASE ? AS archive", (f"{self.archive}.db",))
+        try:
+            for policy in self.policies:
+                steps = [("reduced", self.reduce_batch)]
+                if policy.archive_days is not None:
+                    steps.insert(0, ("archived", self.archive_batch))
+                for name, step in steps:
+                    while max_batches is None or batches < max_batches:
+                        count = step(policy, batch_size)
+                        if count == 0:
+                            break
+                        counts[name] += count
+                        batches += 1
+        finally:
+            if self.archive is not None:
+                self.database.cur.execute("DETACH DATABASE archive")
+        return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply a retention policy to the database")
+    parser.add_argument("data_base", nargs="?", default="measurements",
+                        help="name of the database (without .db)")
+    parser.add_argument("--measurement-type", default=None,
+                        help="measurement_type the policy applies to (default: all)")
+    parser.add_argument("--full-days", type=float, default=30,
+                        help="days the full waveforms are kept")
+    parser.add_argument("--reduction", choices=REDUCTIONS, default="decimate",
+                        help="what is kept after full-days")
+    parser.add_argument("--decimation", type=int, default=10, help="decimation factor")
+    parser.add_argument("--archive-days", type=float, default=None,
+                        help="days after which measurements are moved to the archive")
+    parser.add_argument("--archive", default=None,
+                        help="name of the archive database (without .db)")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="number of measurements per batch")
+    arguments = parser.parse_args()
+    retention_policy = RetentionPolicy(arguments.measurement_type, arguments.full_days,
+                                       arguments.reduction, arguments.decimation,
+                                       arguments.archive_days)
+    with Database(arguments.data_base) as data_base:
+        result = Retention(data_base, [retention_policy], arguments.archive).run(
+            arguments.batch_size)
+    print(f"Reduced {result['reduced']} and archived {result['archived']} measurements")
@@ -0,0 +1,232 @@
+"""
+Tests of the measurement database: round trips, the write-behind writer, the migration of
+baseline databases, the incremental Parquet export and the retention policies.
+"""
+
+import pickle
+import sqlite3
+import numpy as np
+import pytest
+from database import Database, MeasurementWriteError, MeasurementWriter
+from plot_data import PlotData
+from retention import Retention, RetentionPolicy, STAGE_REDUCED
+
+
+def make_plot_data(title="Voltage vs Time", num_samples=1000, efficiency=0.7):
+    """Returns a PlotData object like the one of PXI_5142.get_data2."""
+    time_t = np.linspace(-1e-3, 1e-3, num_samples)
+    plot_data = PlotData(title=title)
+    plot_data.add_data(time_t, np.full(num_samples, 5.0), "Voltage input")
+    plot_data.add_data(time_t, 1.8 + 0.1 * np.exp(-np.abs(time_t) * 1e4), "Voltage Output")
+    plot_data.add_data2(time_t, np.full(num_samples, 0.1), "Current Input")
+    plot_data.add_data2(time_t, np.full(num_samples, 0.2), "Current Output")
+    if efficiency is not None:
+        plot_data.efficiency = efficiency
+    return plot_data
+
+
+@pytest.fixture
+def database(tmp_path):
+    with Database(str(tmp_path / "measurements")) as data_base:
+        yield data_base
+
+
+def assert_same_waveforms(loaded, plot_data):
+    assert loaded.label == plot_data.label
+    assert loaded.label2 == plot_data.label2
+    for loaded_axis, axis in ((loaded.x, plot_data.x), (loaded.y, plot_data.y),
+                              (loaded.x2, plot_data.x2), (loaded.y2, plot_data.y2)):
+        assert len(loaded_axis) == len(axis)
+        for loaded_samples, samples in zip(loaded_axis, axis):
+            np.testing.assert_allclose(np.asarray(loaded_samples), np.asarray(samples))
+
+
+def test_insert_and_load_round_trip(database):
+    plot_data = make_plot_data()
+    database.insert("chip1", "normal startup", plot_data, "ok", "4.3V to 5V", "R2")
+    database.insert("chip1", "bandgap", 1.21, "ok")
+
+    rows = database.read()
+    assert [row.measurement_type for row in rows] == ["normal startup", "bandgap"]
+    assert (rows[0].step_voltage_low, rows[0].step_voltage_high, rows[0].load_resistor) == \
+        (4.3, 5.0, 2)
+    assert_same_waveforms(rows[0].measurement_data, plot_data)
+    assert rows[0].measurement_data.efficiency == 0.7
+    assert rows[1].measurement_data == 1.21
+    assert database.select_summary(rows[0].id)["efficiency"] == 0.7
+
+
+def test_select_field_by_id_returns_the_complete_object(database):
+    plot_data = make_plot_data()
+    database.insert("chip1", "normal startup", plot_data, "ok")
+    (row,) = database.read()
+    legacy = pickle.loads(database.select_field_by_id(row.id))
+    assert_same_waveforms(legacy, plot_data)
+    assert legacy.efficiency == 0.7
+    assert database.select_field_by_id(row.id + 1) is None
+
+
+def test_select_by_id_rejects_sql_in_names(database):
+    database.insert("chip1", "bandgap", 1.21, "ok")
+    assert database.select_by_id(1)[1] == "chip1"
+    assert database.select_by_id("1 OR 1=1") is None
+    assert database.select_field_by_id(1, "chip_id") == "chip1"
+    with pytest.raises(ValueError):
+        database.select_by_id(1, "measurements; DROP TABLE measurements")
+    with pytest.raises(ValueError):
+        database.select_field_by_id(1, "chip_id FROM measurements --")
+
+
+@pytest.mark.parametrize("compression", ["raw", "zlib"])
+def test_write_behind_flush(tmp_path, compression):
+    with Database(str(tmp_path / "measurements"), write_behind=True,
+                  compression=compression) as database:
+        plot_data = make_plot_data()
+        for _ in range(5):
+            database.insert("chip1", "normal startup", plot_data, "ok", "5V", "R1")
+        database.flush()
+        rows = database.read()
+        assert len(rows) == 5
+        assert_same_waveforms(rows[-1].measurement_data, plot_data)
+        # identical waveforms are stored once
+        blobs = database.cur.execute("SELECT COUNT(*) FROM waveform_blobs").fetchone()[0]
+        assert blobs == 4
+
+
+def test_write_behind_survives_a_failing_record(tmp_path):
+    with Database(str(tmp_path / "measurements"), write_behind=True) as database:
+        broken = make_plot_data(efficiency=None)
+        broken.efficiency = "not a number"
+        database.insert("chip1", "normal startup", make_plot_data(), "ok")
+        database.insert("chip1", "normal startup", broken, "ok")
+        database.insert("chip1", "normal startup", broken, "ok")
+        with pytest.raises(MeasurementWriteError) as error:
+            database.flush()
+        # every failed measurement is reported, not only the last one
+        assert len(error.value.failures) == 2
+        assert all(isinstance(failure, ValueError) for _, failure in error.value.failures)
+        assert database.writer.is_alive()
+        database.insert("chip1", "normal startup", make_plot_data(), "ok")
+        database.flush()
+        assert len(database.read()) == 2
+
+
+def test_write_behind_commits_once_per_batch(tmp_path, monkeypatch):
+    path = str(tmp_path / "measurements.db")
+    Database(str(tmp_path / "measurements")).close()
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        con = connect(*args, **kwargs)
+        con.set_trace_callback(lambda sql: statements.append(sql.strip().split()[0].upper()))
+        return con
+
+    monkeypatch.setattr(sqlite3, "connect", traced_connect)
+    writer = MeasurementWriter(path)
+    record = ("chip1", "normal startup", "ok", "5V", "R1", 22.0, "2024-01-01 00:00:00",
+              pickle.dumps(1.21), None)
+    # queued before the thread starts, so the five measurements are one batch
+    for _ in range(5):
+        writer.queue.put(record)
+    writer.start()
+    writer.stop()
+    assert statements.count("SAVEPOINT") == 5
+    assert statements.count("BEGIN") == 1
+    assert statements.count("COMMIT") == 1
+
+
+def create_baseline_database(path, plot_data):
+    """Creates a database in the format before the waveform store (one pickled column)."""
+    con = sqlite3.connect(path)
+    con.execute('''CREATE TABLE measurements
+         (id INTEGER PRIMARY KEY,
+         chip_id TEXT,
+         measurement_type TEXT,
+         measurement_parameter1 TEXT,
+         measurement_parameter2 TEXT,
+         measurement_temperature FLOAT,
+         measurement_data TEXT,
+         measurement_result TEXT,
+         time_stamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    con.execute("INSERT INTO measurements (chip_id, measurement_type, measurement_data, " +
+                "measurement_result, measurement_parameter1, measurement_parameter2, " +
+                "measurement_temperature) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ("chip1", "normal startup", pickle.dumps(plot_data), "ok", "5V", "R1", 22.0))
+    con.commit()
+    con.close()
+
+
+def test_migrate_baseline_database(tmp_path):
+    plot_data = make_plot_data()
+    create_baseline_database(str(tmp_path / "old.db"), plot_data)
+
+    with Database(str(tmp_path / "old")) as database:
+        (row,) = database.read()
+        assert (row.input_voltage, row.load_resistor) == (5.0, 1)
+        assert_same_waveforms(row.measurement_data, plot_data)
+        summary = database.cur.execute("SELECT measurement_id, efficiency, out_voltage FROM " +
+                                       "measurement_summary").fetchall()
+        assert [(measurement_id, efficiency) for measurement_id, efficiency, _ in summary] == \
+            [(1, 0.7)]
+        assert summary[0][2] == pytest.approx(1.8, abs=0.01)
+        assert database.cur.execute("PRAGMA foreign_key_check").fetchall() == []
+        assert database.cur.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_ids_are_not_reused(database):
+    for _ in range(3):
+        database.insert("chip1", "normal startup", make_plot_data(), "ok")
+    database.delete_entries([3])
+    database.insert("chip1", "normal startup", make_plot_data(), "ok")
+    assert [row.id for row in database.read()] == [1, 2, 4]
+    # the waveforms of the deleted measurement are removed with it
+    assert database.cur.execute("SELECT COUNT(*) FROM waveforms WHERE measurement_id = 3")\
+        .fetchone()[0] == 0
+
+
+def test_incremental_export(database, tmp_path):
+    pytest.importorskip("pyarrow")
+    import pyarrow.dataset as ds
+    from database_export import DatabaseExport
+
+    target = str(tmp_path / "export")
+    for chip_id in ("chip1", "chip2"):
+        database.insert(chip_id, "normal startup", make_plot_data(), "ok", "5V", "R1")
+    export = DatabaseExport(database, target)
+    assert export.export(batch_size=1) == 2
+    assert export.export() == 0
+
+    # a measurement inserted after the newest one was deleted is still exported
+    database.delete_entries([2])
+    database.insert("chip2", "normal startup", make_plot_data(), "ok", "5V", "R1")
+    assert export.export() == 1
+
+    metadata = ds.dataset(f"{target}/metadata", partitioning="hive").to_table()
+    assert sorted(metadata.column("id").to_pylist()) == [1, 2, 3]
+    waveforms = ds.dataset(f"{target}/waveforms", partitioning="hive").to_table()
+    assert waveforms.num_rows == 12
+    assert len(waveforms.column("samples")[0]) == 1000
+
+
+def test_retention_reduces_and_archives(database, tmp_path):
+    for _ in range(3):
+        database.insert("chip1", "normal startup", make_plot_data(), "ok")
+    database.cur.execute("UPDATE measurements SET time_stamp = '2000-01-01 00:00:00' WHERE " +
+                         "id = 1")
+    database.cur.execute("UPDATE measurements SET time_stamp = datetime('now', '-5 days') " +
+                         "WHERE id = 2")
+    database.con.commit()
+    policies = [RetentionPolicy("normal startup", full_days=1, decimation=10, archive_days=30)]
+    counts = Retention(database, policies, archive=str(tmp_path / "archive")).run()
+    assert counts == {"reduced": 1, "archived": 1}
+
+    assert [row.id for row in database.read()] == [2, 3]
+    stages = database.cur.execute("SELECT retention_stage FROM measurements ORDER BY id")
+    assert [stage for (stage,) in stages] == [STAGE_REDUCED, 0]
+    reduced = database.load_measurement_data(2)
+    assert len(reduced.y[0]) == 100
+    with Database(str(tmp_path / "archive")) as archive:
+        (row,) = archive.read()
+        assert_same_waveforms(row.measurement_data, make_plot_data())
+        assert archive.select_summary(row.id)["efficiency"] == 0.7
@@ -0,0 +1,59 @@
+"""
+Tests of the ScaledWaveform and TimeBase vectors of plot_data.
+"""
+
+import pickle
+import numpy as np
+import pytest
+from plot_data import ScaledWaveform, TimeBase
+
+
+def test_scaled_waveform_arithmetic():
+    waveform = ScaledWaveform(np.array([0, 100, 200], dtype=np.int16), 0.01, 1.0)
+    volts = np.array([1.0, 2.0, 3.0])
+    np.testing.assert_allclose(waveform * 1e3, volts * 1e3)
+    np.testing.assert_allclose(waveform - waveform[0], volts - 1.0)
+    np.testing.assert_allclose(2.0 - waveform, 2.0 - volts)
+    np.testing.assert_allclose(waveform / waveform, np.ones(3))
+    np.testing.assert_array_equal(waveform > 1.5, [False, True, True])
+    np.testing.assert_allclose(np.sqrt(waveform), np.sqrt(volts))
+    np.testing.assert_allclose(np.diff(waveform), [1.0, 1.0])
+    assert waveform.max() == 3.0
+    assert np.mean(waveform) == 2.0
+    assert isinstance(-waveform, np.ndarray)
+    # the raw samples are not touched
+    np.testing.assert_array_equal(waveform.raw, [0, 100, 200])
+
+
+def test_scaled_waveform_pickle():
+    waveform = pickle.loads(pickle.dumps(ScaledWaveform(np.arange(3, dtype=np.int16), 0.5, 1.0)))
+    assert waveform.raw.dtype == np.int16
+    np.testing.assert_allclose(waveform + 0, [1.0, 1.5, 2.0])
+
+
+def test_time_base_arithmetic():
+    time_t = TimeBase.from_range(-1e-3, 1e-3, 5)
+    expected = np.linspace(-1e-3, 1e-3, 5)
+    np.testing.assert_allclose(time_t * 1e3, expected * 1e3)
+    np.testing.assert_allclose(time_t - time_t[0], expected + 1e-3)
+    np.testing.assert_allclose(np.diff(time_t), np.full(4, 0.5e-3))
+    np.testing.assert_allclose(np.abs(time_t), np.abs(expected))
+    np.testing.assert_array_equal(time_t >= 0, expected >= 0)
+    np.testing.assert_array_equal(time_t == expected, np.full(5, True))
+    assert time_t.min() == -1e-3
+    # time bases are still compared and hashed by their parameters
+    assert time_t == TimeBase.from_range(-1e-3, 1e-3, 5)
+    assert time_t != TimeBase.from_range(-1e-3, 1e-3, 6)
+    assert len({time_t, TimeBase.get(time_t.sample_rate, time_t.t0, time_t.n)}) == 1
+    assert pickle.loads(pickle.dumps(time_t)) is time_t
+    # the shared time vector is read-only
+    with pytest.raises(TypeError):
+        np.multiply(time_t, 2, out=time_t)
+
+
+def test_time_base_single_sample():
+    np.testing.assert_array_equal(TimeBase.from_range(0.5, 0.5, 1), [0.5])
+    np.testing.assert_array_equal(TimeBase.from_range(0.5, 1.0, 1), [0.5])
+    assert len(TimeBase.from_range(0.0, 0.0, 0)) == 0
+    with pytest.raises(ValueError):
+        TimeBase.from_range(0.5, 0.5, 10)
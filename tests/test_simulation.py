@@ -0,0 +1,63 @@
+"""
+Tests of the PXI_5142 acquisitions against the simulated scopes (needs niscope and hightime).
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("niscope")
+pytest.importorskip("hightime")
+
+from Drivers.pxi_5142_main.PXI_5142 import PXI_5142  # noqa: E402
+from Drivers.pxi_5142_main.simulation import (ACQUISITION_SETTINGS, DcDcConverterModel,  # noqa: E402
+                                              create_scopes)
+
+
+def settings(scenario):
+    kwargs = dict(ACQUISITION_SETTINGS[scenario])
+    kwargs.pop("delay", None)
+    return kwargs
+
+
+@pytest.mark.parametrize("scenario", ["startup", "step", "load"])
+def test_get_data2(scenario):
+    sc0, sc1 = create_scopes(DcDcConverterModel(scenario, seed=1))
+    plot_data = PXI_5142.get_data2(sc0, sc1, **settings(scenario))
+    assert plot_data.acquisition_time is not None
+    assert plot_data.out_voltage == pytest.approx(1.8, abs=0.05)
+    assert np.isfinite(plot_data.efficiency)
+    # the exported trigger is released after the run
+    assert sc0.instr.exported_ref_trigger_output_terminal == ""
+    assert sc1.instr.exported_ref_trigger_output_terminal == ""
+
+
+def test_raw_matches_volts():
+    sc0, sc1 = create_scopes(DcDcConverterModel("load", seed=1, noise=0.0))
+    volts = PXI_5142.get_data2(sc0, sc1, **settings("load"))
+    raw = PXI_5142.get_data2(sc0, sc1, raw=True, **settings("load"))
+    for samples, raw_samples in zip(volts.y + volts.y2, raw.y + raw.y2):
+        np.testing.assert_allclose(np.asarray(raw_samples), samples, atol=1e-3)
+        # a fetched channel can be used in numpy expressions like the float64 samples
+        np.testing.assert_allclose(raw_samples * 1e3 - raw_samples[0] * 1e3,
+                                   (samples - samples[0]) * 1e3, atol=1)
+        assert (raw_samples > samples.max() + 1e-3).sum() == 0
+
+
+def test_scalar_measurements():
+    sc0, sc1 = create_scopes(DcDcConverterModel("load", seed=1))
+    plot_data = PXI_5142.get_measurements2(sc0, sc1, functions=["OVERSHOOT"], **settings("load"))
+    measurements = plot_data.scalar_measurements["sc0"]
+    assert list(measurements["channel"]) == ["0", "1"]
+    assert plot_data.out_voltage == PXI_5142.scalar_measurement(measurements, "VOLTAGE_TOP", 1)
+    assert len(sc0.fetch_scalar_measurements([])) == 2
+
+
+def test_get_records2_waits_for_each_record():
+    sc0, sc1 = create_scopes(DcDcConverterModel("load", seed=1, realtime=True))
+    records_done = []
+    plot_data_list = PXI_5142.get_records2(sc0, sc1, 3,
+                                           lambda: records_done.append(sc1.instr.records_done),
+                                           **settings("load"))
+    # each stimulus comes after the record of the previous one is complete
+    assert all(done >= record for record, done in enumerate(records_done))
+    assert [plot_data.record for plot_data in plot_data_list] == [0, 1, 2]
@@ -0,0 +1,409 @@
+"""
+This module contains the WaveformStore class to store PlotData waveforms as typed arrays.
+
+Every channel of a PlotData object is stored in its own row of the 'waveforms' table. The samples
+are kept as raw bytes behind a small dtype/shape header, so they can be read back without
+unpickling. Evenly spaced time vectors are reduced to their sample rate and t0.
+
+The packed arrays are stored once in the 'waveform_blobs' table, keyed by their SHA-256 hash, so
+identical waveforms of repeated runs share one blob. The blobs can optionally be compressed
+losslessly ('zlib', or 'zstd' if the zstandard package is installed). Before compressing, the
+samples are delta coded on their bit pattern and byte shuffled, which makes slowly changing
+waveforms compress much better.
+
+Raw digitizer samples (ScaledWaveform) are stored in their native integer type together with
+their gain and offset, and are loaded as ScaledWaveform again.
+"""
+
+import copy
+import hashlib
+import struct
+import zlib
+import numpy as np
+from plot_data import PlotData, ScaledWaveform, TimeBase
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# magic, dtype string (e.g. b'<f8'), number of dimensions, padding to 16 bytes
+_HEADER = struct.Struct("<4s8sB3x")
+_MAGIC = b"WFM1"
+# Axis numbers used in the 'waveforms' table
+AXIS_Y = 1
+AXIS_Y2 = 2
+# Unsigned integer types used to delta code the bit pattern of the samples
+_UNSIGNED = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+CODECS = ("raw", "zlib", "zstd")
+
+
+class WaveformStore:
+    """
+    Stores the waveforms of PlotData objects in the 'waveforms' and 'waveform_blobs' tables.
+
+    Attributes:
+        con (sqlite3.Connection): The connection to the SQLite database.
+        cur (sqlite3.Cursor): The cursor object for executing SQL statements.
+        compression (str): The codec for new blobs ('raw', 'zlib' or 'zstd').
+    """
+
+    def __init__(self, con, compression="raw"):
+        """
+        Initializes a WaveformStore object.
+
+        Args:
+            con (sqlite3.Connection): The connection to the SQLite database.
+            compression (str, optional): The codec for new blobs, 'raw' keeps the zero-copy
+                reads. Defaults to "raw".
+        """
+        if compression not in CODECS:
+            raise ValueError(f"Unknown compression {compression}, use one of {CODECS}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("Compression 'zstd' needs the zstandard package")
+        self.con = con
+        self.cur = con.cursor()
+        self.compression = compression
+
+    def create_table(self):
+        """
+        Creates the tables 'waveforms' and 'waveform_blobs' if they don't already exist.
+
+        The table 'waveforms' has the following columns:
+        - measurement_id: INTEGER (References measurements.id)
+        - axis: INTEGER (1 for the left y-axis, 2 for the right y-axis)
+        - channel: INTEGER (Index of the channel on its axis)
+        - label: TEXT
+        - sample_rate: FLOAT (NULL when the time vector is not evenly spaced)
+        - t0: FLOAT (Time of the first sample)
+        - time_hash: TEXT (Blob of the time vector, only used when sample_rate is NULL)
+        - blob_hash: TEXT (Blob of the samples)
+        - gain: FLOAT (Scaling of raw samples to volts, NULL for samples in volts)
+        - offset: FLOAT (Offset of raw samples in volts, NULL for samples in volts)
+
+        The table 'waveform_blobs' has the following columns:
+        - hash: TEXT (Primary Key, SHA-256 of the packed array)
+        - codec: TEXT ('raw', 'zlib' or 'zstd')
+        - data: BLOB (Packed array, compressed according to codec)
+        """
+        self.cur.execute('''CREATE TABLE IF NOT EXISTS waveforms
+             (measurement_id INTEGER REFERENCES measurements(id) ON DELETE CASCADE,
+             axis INTEGER,
+             channel INTEGER,
+             label TEXT,
+             sample_rate FLOAT,
+             t0 FLOAT,
+             time_hash TEXT,
+             blob_hash TEXT,
+             gain FLOAT,
+             offset FLOAT,
+             PRIMARY KEY (measurement_id, axis, channel))''')
+        self.cur.execute('''CREATE TABLE IF NOT EXISTS waveform_blobs
+             (hash TEXT PRIMARY KEY,
+             codec TEXT,
+             data BLOB)''')
+
+    def migrate_to_blobs(self):
+        """
+        Moves the samples of a 'waveforms' table with data/time_data columns into the table
+        'waveform_blobs' and creates the indexes on the hashes.
+
+        The rows are converted one after the other to keep the memory bounded.
+        """
+        columns = [row[1] for row in self.cur.execute("PRAGMA table_info(waveforms)")]
+        if "data" in columns:
+            self.cur.execute("ALTER TABLE waveforms ADD COLUMN time_hash TEXT")
+            self.cur.execute("ALTER TABLE waveforms ADD COLUMN blob_hash TEXT")
+            rowids = [row[0] for row in self.cur.execute("SELECT rowid FROM waveforms")]
+            for rowid in rowids:
+                time_data, data = self.cur.execute("SELECT time_data, data FROM waveforms " +
+                                                   "WHERE rowid = ?", (rowid,)).fetchone()
+                time_hash = None if time_data is None else self.put_blob(time_data)
+                self.cur.execute("UPDATE waveforms SET time_hash = ?, blob_hash = ? WHERE " +
+                                 "rowid = ?", (time_hash, self.put_blob(data), rowid))
+            self.cur.execute("ALTER TABLE waveforms DROP COLUMN time_data")
+            self.cur.execute("ALTER TABLE waveforms DROP COLUMN data")
+        self.cur.execute("CREATE INDEX IF NOT EXISTS waveforms_by_blob ON waveforms (blob_hash)")
+        self.cur.execute("CREATE INDEX IF NOT EXISTS waveforms_by_time ON waveforms (time_hash)")
+
+    def add_scaling_columns(self):
+        """
+        Adds the gain and offset columns to a 'waveforms' table created without them.
+        """
+        columns = [row[1] for row in self.cur.execute("PRAGMA table_info(waveforms)")]
+        for column in ("gain", "offset"):
+            if column not in columns:
+                self.cur.execute(f"ALTER TABLE waveforms ADD COLUMN {column} FLOAT")
+
+    @staticmethod
+    def pack_array(array) -> bytes:
+        """
+        Packs a numeric array into bytes with a dtype/shape header.
+
+        Args:
+            array (array_like): The array to pack.
+
+        Returns:
+            bytes: The header followed by the raw samples in C order.
+        """
+        array = np.ascontiguousarray(array)
+        header = _HEADER.pack(_MAGIC, array.dtype.str.encode("ascii"), array.ndim)
+        shape = struct.pack(f"<{array.ndim}Q", *array.shape)
+        return header + shape + array.tobytes()
+
+    @staticmethod
+    def unpack_array(blob) -> np.ndarray:
+        """
+        Unpacks bytes created by pack_array.
+
+        The returned array is a read-only view on the blob, no samples are copied.
+
+        Args:
+            blob (bytes): The packed array.
+
+        Returns:
+            np.ndarray: The unpacked array.
+        """
+        dtype, shape, offset = WaveformStore.read_header(blob)
+        return np.frombuffer(blob, dtype=dtype, offset=offset).reshape(shape)
+
+    @staticmethod
+    def read_header(blob):
+        """
+        Reads the header of a packed array.
+
+        Args:
+            blob (bytes): The packed array.
+
+        Returns:
+            tuple: (dtype, shape, offset of the samples).
+        """
+        magic, dtype, ndim = _HEADER.unpack_from(blob)
+        if magic != _MAGIC:
+            raise ValueError("Blob does not contain a packed waveform")
+        shape = struct.unpack_from(f"<{ndim}Q", blob, _HEADER.size)
+        return np.dtype(dtype.rstrip(b"\0").decode("ascii")), shape, _HEADER.size + 8 * ndim
+
+    @staticmethod
+    def encode(packed, codec) -> bytes:
+        """
+        Compresses a packed array. The header stays uncompressed.
+
+        Args:
+            packed (bytes): The packed array (see pack_array).
+            codec (str): 'raw', 'zlib' or 'zstd'.
+
+        Returns:
+            bytes: The encoded blob.
+        """
+        if codec == "raw":
+            return packed
+        dtype, _, offset = WaveformStore.read_header(packed)
+        body = memoryview(packed)[offset:]
+        if dtype.itemsize in _UNSIGNED:
+            samples = np.frombuffer(body, dtype=_UNSIGNED[dtype.itemsize])
+            # delta of the bit pattern (wraps around, so it is lossless)
+            samples = np.diff(samples, prepend=samples.dtype.type(0))
+            # byte shuffle: all first bytes, then all second bytes, ...
+            body = samples.view(np.uint8).reshape(-1, dtype.itemsize).T.tobytes()
+        if codec == "zlib":
+            return packed[:offset] + zlib.compress(body)
+        return packed[:offset] + zstandard.ZstdCompressor().compress(body)
+
+    @staticmethod
+    def decode(blob, codec) -> np.ndarray:
+        """
+        Decodes a blob created by encode.
+
+        Args:
+            blob (bytes): The encoded blob.
+            codec (str): 'raw', 'zlib' or 'zstd'.
+
+        Returns:
+            np.ndarray: The array, a read-only view on the blob for codec 'raw'.
+        """
+        if codec == "raw":
+            return WaveformStore.unpack_array(blob)
+        dtype, shape, offset = WaveformStore.read_header(blob)
+        if codec == "zlib":
+            body = zlib.decompress(memoryview(blob)[offset:])
+        elif codec == "zstd" and zstandard is not None:
+            body = zstandard.ZstdDecompressor().decompress(memoryview(blob)[offset:])
+        else:
+            raise ValueError(f"Can not decode codec {codec}")
+        if dtype.itemsize in _UNSIGNED:
+            shuffled = np.frombuffer(body, dtype=np.uint8).reshape(dtype.itemsize, -1)
+            samples = np.ascontiguousarray(shuffled.T).view(_UNSIGNED[dtype.itemsize])
+            samples = np.cumsum(samples, dtype=samples.dtype)
+            return samples.view(dtype).reshape(shape)
+        return np.frombuffer(body, dtype=dtype).reshape(shape)
+
+    def put_blob(self, packed) -> str:
+        """
+        Stores a packed array once and returns its hash.
+
+        Args:
+            packed (bytes): The packed array (see pack_array).
+
+        Returns:
+            str: The SHA-256 hash the blob is stored under.
+        """
+        blob_hash = hashlib.sha256(packed).hexdigest()
+        self.cur.execute("SELECT 1 FROM waveform_blobs WHERE hash = ?", (blob_hash,))
+        if self.cur.fetchone() is None:
+            self.cur.execute("INSERT INTO waveform_blobs (hash, codec, data) VALUES (?, ?, ?)",
+                             (blob_hash, self.compression,
+                              self.encode(packed, self.compression)))
+        return blob_hash
+
+    def delete_orphans(self):
+        """
+        Deletes the blobs that are no longer referenced by a waveform. The caller commits the
+        transaction.
+        """
+        self.cur.execute("DELETE FROM waveform_blobs WHERE NOT EXISTS (SELECT 1 FROM waveforms " +
+                         "WHERE blob_hash = hash) AND NOT EXISTS (SELECT 1 FROM waveforms " +
+                         "WHERE time_hash = hash)")
+
+    @staticmethod
+    def get_time_base(time_t):
+        """
+        Reduces a time vector to its sample rate and t0.
+
+        Args:
+            time_t (array_like): The time vector.
+
+        Returns:
+            tuple: (sample_rate, t0), sample_rate is None if the vector is not evenly spaced.
+        """
+        if isinstance(time_t, TimeBase):
+            return time_t.sample_rate, time_t.t0
+        time_t = np.asarray(time_t, dtype=np.float64)
+        if time_t.size < 2:
+            return None, float(time_t[0]) if time_t.size else 0.0
+        dt = (time_t[-1] - time_t[0]) / (time_t.size - 1)
+        if dt <= 0 or not np.allclose(np.diff(time_t), dt, rtol=1e-6, atol=0):
+            return None, float(time_t[0])
+        return 1 / dt, float(time_t[0])
+
+    @staticmethod
+    def strip(plot_data: PlotData) -> PlotData:
+        """
+        Returns a shallow copy of the PlotData object without the waveforms.
+
+        The labels are stored with the waveforms, titles and additional attributes
+        (e.g. efficiency) are kept.
+
+        Args:
+            plot_data (PlotData): The PlotData object.
+
+        Returns:
+            PlotData: The copy without waveforms and labels.
+        """
+        shell = copy.copy(plot_data)
+        shell.x, shell.y, shell.x2, shell.y2 = [], [], [], []
+        shell.label, shell.label2 = [], []
+        return shell
+
+    def insert(self, measurement_id, plot_data: PlotData):
+        """
+        Inserts the waveforms of a PlotData object. The caller commits the transaction.
+
+        Args:
+            measurement_id (int): The ID of the measurement the waveforms belong to.
+            plot_data (PlotData): The PlotData object containing the waveforms.
+        """
+        rows = []
+        for axis, x_data, y_data, labels in ((AXIS_Y, plot_data.x, plot_data.y, plot_data.label),
+                                             (AXIS_Y2, plot_data.x2, plot_data.y2,
+                                              plot_data.label2)):
+            for channel, (time_t, samples) in enumerate(zip(x_data, y_data)):
+                sample_rate, t0 = self.get_time_base(time_t)
+                time_hash = None
+                if sample_rate is None:
+                    time_hash = self.put_blob(self.pack_array(time_t))
+                gain, offset = None, None
+                if isinstance(samples, ScaledWaveform):
+                    samples, gain, offset = samples.raw, samples.gain, samples.offset
+                rows.append((measurement_id, axis, channel, labels[channel], sample_rate, t0,
+                             time_hash, self.put_blob(self.pack_array(samples)), gain, offset))
+        self.cur.executemany("INSERT INTO waveforms (measurement_id, axis, channel, label, " +
+                             "sample_rate, t0, time_hash, blob_hash, gain, offset) VALUES " +
+                             "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def select(self, cur, measurement_ids):
+        """
+        Reads and decodes the waveforms of the given measurements.
+
+        Args:
+            cur (sqlite3.Cursor): The cursor to execute the SQL statement with.
+            measurement_ids (list): The IDs of the measurements.
+
+        Returns:
+            list: Tuples (measurement_id, axis, channel, label, sample_rate, t0, time_t,
+                samples) ordered by measurement_id, axis and channel. time_t is None if
+                sample_rate is set. samples is a ScaledWaveform for raw samples.
+        """
+        placeholders = ", ".join("?" * len(measurement_ids))
+        cur.execute("SELECT w.measurement_id, w.axis, w.channel, w.label, w.sample_rate, w.t0, " +
+                    "t.codec, t.data, b.codec, b.data, w.gain, w.offset FROM waveforms w " +
+                    "JOIN waveform_blobs b " +
+                    "ON b.hash = w.blob_hash LEFT JOIN waveform_blobs t ON t.hash = " +
+                    f"w.time_hash WHERE w.measurement_id IN ({placeholders}) ORDER BY " +
+                    "w.measurement_id, w.axis, w.channel", list(measurement_ids))
+        waveforms = []
+        for row in cur.fetchall():
+            samples = self.decode(row[9], row[8])
+            if row[10] is not None:
+                samples = ScaledWaveform(samples, row[10], row[11])
+            waveforms.append((*row[:6], None if row[7] is None else self.decode(row[7], row[6]),
+                              samples))
+        return waveforms
+
+    def decimate(self, measurement_id, factor):
+        """
+        Keeps every factor-th sample of the waveforms of a measurement. The caller commits the
+        transaction and deletes the orphaned blobs.
+
+        Args:
+            measurement_id (int): The ID of the measurement.
+            factor (int): The decimation factor.
+        """
+        for _, axis, channel, _, sample_rate, _, time_t, samples in self.select(
+                self.cur, [measurement_id]):
+            time_hash = None
+            if sample_rate is None:
+                time_hash = self.put_blob(self.pack_array(time_t[::factor]))
+            else:
+                sample_rate = sample_rate / factor
+            # raw samples stay raw, the gain and offset do not change
+            if isinstance(samples, ScaledWaveform):
+                samples = samples.raw
+            self.cur.execute("UPDATE waveforms SET sample_rate = ?, time_hash = ?, blob_hash = ? " +
+                             "WHERE measurement_id = ? AND axis = ? AND channel = ?",
+                             (sample_rate, time_hash, self.put_blob(self.pack_array(
+                                 samples[::factor])), measurement_id, axis, channel))
+
+    def load(self, measurement_id, plot_data: PlotData) -> bool:
+        """
+        Loads the stored waveforms of a measurement into a PlotData object.
+
+        Evenly spaced time vectors are returned as shared TimeBase objects.
+
+        Args:
+            measurement_id (int): The ID of the measurement.
+            plot_data (PlotData): The PlotData object (normally created by strip) to fill.
+
+        Returns:
+            bool: True if waveforms were stored for the measurement, otherwise False.
+        """
+        rows = self.select(self.cur, [measurement_id])
+        for _, axis, _, label, sample_rate, t0, time_t, samples in rows:
+            if sample_rate is not None:
+                # shared by all channels and measurements with the same time base
+                time_t = TimeBase.get(sample_rate, t0, len(samples))
+            if axis == AXIS_Y:
+                plot_data.add_data(time_t, samples, label)
+            else:
+                plot_data.add_data2(time_t, samples, label)
+        return len(rows) > 0